@@ -6,19 +6,21 @@ This file contains route handlers and API endpoints for:
 1. Plastic Footprint Tracker
 2. Multilingual & Low-Literacy Support
 3. Infrastructure Project Feedback Loop
+4. Carbon Emission Reporting
+5. Personal Data Export
 
 All endpoints follow RESTful conventions and return JSON responses.
 """
 
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
 from flask_login import login_required, current_user
 from app import db
-from models import User, WasteItem, UserPlasticFootprintMonthly, PlasticFootprintScan
+from models import User, WasteItem, PlasticFootprintScan
 from models import InfrastructureProject, WasteBatch, ProjectContributor, ProjectLedger
 from models import LocalizationString
+from blockchain_tracker import append_ledger_entry
 from datetime import datetime, date
 from sqlalchemy import func, desc
-import hashlib
 import json
 import logging
 
@@ -26,6 +28,8 @@ import logging
 footprint_bp = Blueprint('footprint', __name__, url_prefix='/api/footprint')
 i18n_bp = Blueprint('i18n', __name__, url_prefix='/api/i18n')
 projects_bp = Blueprint('projects', __name__, url_prefix='/api/projects')
+carbon_bp = Blueprint('carbon', __name__, url_prefix='/api/carbon')
+export_bp = Blueprint('export', __name__, url_prefix='/api/export')
 
 # ============================================================================
 # FEATURE 1: PLASTIC FOOTPRINT TRACKER API
@@ -52,7 +56,10 @@ def update_footprint():
     {
         "success": true,
         "scan_id": 456,
+        "week_start": "2025-01-06",
+        "weekly_total": 310.0,
         "monthly_total": 1250.5,
+        "lifetime_total": 8500.5,
         "badge_level": "Silver",
         "comparison_percentage": 15.5
     }
@@ -82,31 +89,29 @@ def update_footprint():
             timestamp=datetime.utcnow()
         )
         db.session.add(scan)
+        
+        # Rollups, weekly footprint and lifetime total commit together with the scan
+        from footprint_updater import FOOTPRINT_ROLLUPS, get_period_start, record_scan_rollups, update_weekly_footprint
+        record_scan_rollups(current_user.id, float(estimated_weight_grams), scan.timestamp)
+        footprint = update_weekly_footprint(current_user.id, float(estimated_weight_grams), scan.timestamp, commit=False)
         db.session.commit()
         
-        # Get updated monthly footprint (trigger will update it)
-        current_month = date.today().replace(day=1)
-        monthly = UserPlasticFootprintMonthly.query.filter_by(
-            user_id=current_user.id,
-            month=current_month
-        ).first()
+        month_model, month_key = FOOTPRINT_ROLLUPS['month']
+        monthly_total = db.session.query(month_model.total_weight_grams).filter(
+            month_model.user_id == current_user.id,
+            getattr(month_model, month_key) == get_period_start('month', scan.timestamp)
+        ).scalar()
         
-        if monthly:
-            return jsonify({
-                'success': True,
-                'scan_id': scan.id,
-                'monthly_total': float(monthly.total_weight_grams),
-                'badge_level': monthly.badge_level,
-                'comparison_percentage': float(monthly.comparison_percentage)
-            }), 200
-        else:
-            return jsonify({
-                'success': True,
-                'scan_id': scan.id,
-                'monthly_total': float(estimated_weight_grams),
-                'badge_level': 'Bronze',
-                'comparison_percentage': 0.0
-            }), 200
+        return jsonify({
+            'success': True,
+            'scan_id': scan.id,
+            'week_start': footprint['week_start'].isoformat(),
+            'weekly_total': footprint['weekly_total'],
+            'monthly_total': float(monthly_total or estimated_weight_grams),
+            'lifetime_total': footprint['lifetime_total'],
+            'badge_level': footprint['badge_level'],
+            'comparison_percentage': footprint['comparison_percentage']
+        }), 200
             
     except Exception as e:
         logging.error(f"Error updating footprint: {e}")
@@ -144,8 +149,8 @@ def get_footprint_dashboard():
             {
                 "month": "2024-01-01",
                 "total_weight_grams": 1250.5,
-                "comparison_percentage": 15.5,
-                "badge_level": "Silver"
+                "scan_count": 48,
+                "comparison_percentage": 15.5
             },
             ...
         ],
@@ -163,59 +168,51 @@ def get_footprint_dashboard():
     try:
         months = int(request.args.get('months', 6))
         
-        # Get user's current badge level
-        user = User.query.get(current_user.id)
-        
-        # Get monthly history
-        monthly_history = UserPlasticFootprintMonthly.query.filter_by(
-            user_id=current_user.id
-        ).order_by(desc(UserPlasticFootprintMonthly.month)).limit(months).all()
+        from dashboard_snapshot import get_dashboard_snapshot, SNAPSHOT_MONTHS
+        from footprint_updater import shift_period_start
         
-        # Get current month
+        # One key lookup; rebuilt only after a new scan
+        snapshot = get_dashboard_snapshot(current_user.id)
         current_month = date.today().replace(day=1)
-        current_monthly = UserPlasticFootprintMonthly.query.filter_by(
-            user_id=current_user.id,
-            month=current_month
-        ).first()
-        
-        # Get recent scans
-        recent_scans = PlasticFootprintScan.query.filter_by(
-            user_id=current_user.id
-        ).order_by(desc(PlasticFootprintScan.timestamp)).limit(10).all()
+        current_monthly = snapshot['current_monthly']
         
-        # Calculate total lifetime weight
-        total_lifetime = db.session.query(
-            func.sum(UserPlasticFootprintMonthly.total_weight_grams)
-        ).filter_by(user_id=current_user.id).scalar() or 0.0
+        if months > SNAPSHOT_MONTHS:
+            from footprint_updater import get_footprint_history
+            monthly_history = get_footprint_history(current_user.id, 'month', limit=months)
+        else:
+            monthly_history = [
+                m for m in snapshot['monthly_history']
+                if m['period_start'] >= shift_period_start('month', current_month, -(months - 1))
+            ]
         
         return jsonify({
             'success': True,
             'user_id': current_user.id,
-            'badge_level': user.badge_level or 'Bronze',
-            'total_lifetime_weight_grams': float(total_lifetime),
+            'badge_level': snapshot['badge_level'],
+            'total_lifetime_weight_grams': snapshot['lifetime_weight_grams'],
             'current_month': {
-                'month': current_monthly.month.isoformat() if current_monthly else current_month.isoformat(),
-                'total_weight_grams': float(current_monthly.total_weight_grams) if current_monthly else 0.0,
-                'comparison_percentage': float(current_monthly.comparison_percentage) if current_monthly else 0.0,
-                'badge_level': current_monthly.badge_level if current_monthly else 'Bronze'
+                'month': current_month.isoformat(),
+                'total_weight_grams': current_monthly['total_weight_grams'] if current_monthly else 0.0,
+                'comparison_percentage': current_monthly['comparison_percentage'] if current_monthly else 0.0,
+                'badge_level': snapshot['badge_level']
             },
             'monthly_history': [
                 {
-                    'month': m.month.isoformat(),
-                    'total_weight_grams': float(m.total_weight_grams),
-                    'comparison_percentage': float(m.comparison_percentage),
-                    'badge_level': m.badge_level
+                    'month': m['period_start'].isoformat(),
+                    'total_weight_grams': m['total_weight_grams'],
+                    'scan_count': m['scan_count'],
+                    'comparison_percentage': m['comparison_percentage']
                 }
                 for m in monthly_history
             ],
             'recent_scans': [
                 {
-                    'id': s.id,
-                    'material_type': s.material_type,
-                    'estimated_weight_grams': float(s.estimated_weight_grams),
-                    'timestamp': s.timestamp.isoformat()
+                    'id': s['id'],
+                    'material_type': s['material_type'],
+                    'estimated_weight_grams': s['estimated_weight_grams'],
+                    'timestamp': s['timestamp'].isoformat() if s['timestamp'] else None
                 }
-                for s in recent_scans
+                for s in snapshot['recent_scans']
             ]
         }), 200
         
@@ -227,6 +224,258 @@ def get_footprint_dashboard():
         }), 500
 
 
+@footprint_bp.route('/history', methods=['GET'])
+@login_required
+def get_footprint_history():
+    """
+    GET /api/footprint/history
+    
+    Get the user's scanned weight per day, week or month over a date range.
+    
+    Query Parameters:
+    - period: day, week or month (default: week)
+    - start: First date of the range, YYYY-MM-DD (optional)
+    - end: Last date of the range, YYYY-MM-DD (default: today)
+    - limit: Last N periods up to end (optional, overrides start)
+    
+    Response:
+    {
+        "success": true,
+        "period": "week",
+        "history": [
+            {
+                "period_start": "2024-01-15",
+                "total_weight_grams": 250.0,
+                "scan_count": 9,
+                "comparison_percentage": 12.5
+            },
+            ...
+        ]
+    }
+    """
+    try:
+        from footprint_updater import get_footprint_history as read_footprint_history, FOOTPRINT_ROLLUPS
+        
+        period = request.args.get('period', 'week')
+        if period not in FOOTPRINT_ROLLUPS:
+            return jsonify({
+                'success': False,
+                'error': f"period must be one of: {', '.join(FOOTPRINT_ROLLUPS)}"
+            }), 400
+        
+        try:
+            start = request.args.get('start')
+            start = date.fromisoformat(start) if start else None
+            end = request.args.get('end')
+            end = date.fromisoformat(end) if end else None
+            limit = request.args.get('limit', type=int)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'start and end must be dates in YYYY-MM-DD format'
+            }), 400
+        
+        history = read_footprint_history(current_user.id, period, start=start, end=end, limit=limit)
+        
+        return jsonify({
+            'success': True,
+            'period': period,
+            'history': [
+                {
+                    'period_start': h['period_start'].isoformat(),
+                    'total_weight_grams': h['total_weight_grams'],
+                    'scan_count': h['scan_count'],
+                    'comparison_percentage': h['comparison_percentage']
+                }
+                for h in history
+            ]
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error getting footprint history: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@footprint_bp.route('/dashboard/cache-stats', methods=['GET'])
+@login_required
+def get_dashboard_cache_stats():
+    """
+    GET /api/footprint/dashboard/cache-stats
+    
+    Get the dashboard snapshot hit ratio for the worker serving the request.
+    
+    Response:
+    {
+        "success": true,
+        "stats": {"pid": 1234, "hits": 980, "misses": 20, "hit_ratio": 0.98}
+    }
+    """
+    from dashboard_snapshot import get_snapshot_cache_stats
+    return jsonify({
+        'success': True,
+        'stats': get_snapshot_cache_stats()
+    }), 200
+
+
+def _leaderboard_args():
+    """Parse period/date/city query parameters; returns (args, error response)"""
+    from leaderboard import LEADERBOARD_PERIODS
+    from footprint_updater import get_period_start, shift_period_start
+    
+    period = request.args.get('period', 'week')
+    if period not in LEADERBOARD_PERIODS:
+        return None, (jsonify({
+            'success': False,
+            'error': f"period must be one of: {', '.join(LEADERBOARD_PERIODS)}"
+        }), 400)
+    
+    try:
+        day = request.args.get('date')
+        day = date.fromisoformat(day) if day else None
+    except ValueError:
+        return None, (jsonify({
+            'success': False,
+            'error': 'date must be in YYYY-MM-DD format'
+        }), 400)
+    
+    if day is not None:
+        try:
+            shift_period_start(period, get_period_start(period, day), 1)  # The period must end by date.max
+        except (ValueError, OverflowError):
+            return None, (jsonify({
+                'success': False,
+                'error': 'date is out of range'
+            }), 400)
+    
+    city = request.args.get('city')
+    if city == 'me':
+        city = current_user.city
+        if not city:
+            return None, (jsonify({
+                'success': False,
+                'error': 'Set your city in your preferences to see your city leaderboard'
+            }), 400)
+    
+    return {'period': period, 'period_start': day, 'city': city}, None
+
+
+def _leaderboard_json(board):
+    """Make dates in a leaderboard result JSON-friendly"""
+    board['period_start'] = board['period_start'].isoformat()
+    board['built_at'] = board['built_at'].isoformat() if board['built_at'] else None
+    return board
+
+
+@footprint_bp.route('/leaderboard', methods=['GET'])
+@login_required
+def get_leaderboard():
+    """
+    GET /api/footprint/leaderboard
+    
+    Get one page of the weekly or monthly leaderboard by scanned weight.
+    
+    Query Parameters:
+    - period: week or month (default: week)
+    - date: Any day in the period, YYYY-MM-DD (default: today)
+    - city: City name, or "me" for the user's own city (default: all users)
+    - page: Page number (default: 1)
+    - per_page: Entries per page, at most 100 (default: 20)
+    
+    Response:
+    {
+        "success": true,
+        "period": "week",
+        "period_start": "2024-01-15",
+        "city": null,
+        "total_entries": 1520,
+        "page": 1,
+        "per_page": 20,
+        "entries": [
+            {
+                "position": 1,
+                "rank": 1,
+                "user_id": 42,
+                "username": "greenhero",
+                "badge_level": "Gold",
+                "total_weight_grams": 5400.0,
+                "scan_count": 120
+            },
+            ...
+        ]
+    }
+    """
+    try:
+        from leaderboard import get_leaderboard_page
+        
+        args, error = _leaderboard_args()
+        if error:
+            return error
+        
+        board = get_leaderboard_page(
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', 20, type=int),
+            **args
+        )
+        return jsonify(dict(_leaderboard_json(board), success=True)), 200
+        
+    except Exception as e:
+        logging.error(f"Error getting leaderboard: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@footprint_bp.route('/leaderboard/me', methods=['GET'])
+@login_required
+def get_my_leaderboard_rank():
+    """
+    GET /api/footprint/leaderboard/me
+    
+    Get the user's leaderboard rank and the users just above and below.
+    
+    Query Parameters:
+    - period, date, city: As for /leaderboard
+    - neighbours: Entries above and below the user, at most 25 (default: 2)
+    
+    Response:
+    {
+        "success": true,
+        "period": "week",
+        "period_start": "2024-01-15",
+        "city": "Bengaluru",
+        "total_entries": 310,
+        "me": {"position": 17, "rank": 16, "user_id": 7, ...},
+        "neighbours": [...]
+    }
+    
+    "me" is null if the user has no scans in the period.
+    """
+    try:
+        from leaderboard import get_user_rank
+        
+        args, error = _leaderboard_args()
+        if error:
+            return error
+        
+        board = get_user_rank(
+            current_user.id,
+            neighbours=request.args.get('neighbours', 2, type=int),
+            **args
+        )
+        return jsonify(dict(_leaderboard_json(board), success=True)), 200
+        
+    except Exception as e:
+        logging.error(f"Error getting leaderboard rank: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @footprint_bp.route('/weight-lookup', methods=['GET'])
 def get_weight_lookup():
     """
@@ -254,15 +503,15 @@ def get_weight_lookup():
     }
     """
     try:
-        from models import MaterialWeightLookup
+        from reference_cache import get_material_weights
         
         material_type = request.args.get('material_type')
-        query = MaterialWeightLookup.query
+        weights = get_material_weights()
         
         if material_type:
-            query = query.filter_by(material_type=material_type)
-        
-        lookups = query.all()
+            lookups = weights.get(material_type, ())
+        else:
+            lookups = [l for rows in weights.values() for l in rows]
         
         return jsonify({
             'success': True,
@@ -271,9 +520,9 @@ def get_weight_lookup():
                     'material_type': l.material_type,
                     'category': l.category,
                     'average_weight_grams': float(l.average_weight_grams),
-                    'min_weight_grams': float(l.min_weight_grams) if l.min_weight_grams else None,
-                    'max_weight_grams': float(l.max_weight_grams) if l.max_weight_grams else None,
-                    'confidence_threshold': float(l.confidence_threshold)
+                    'min_weight_grams': l.min_weight_grams,
+                    'max_weight_grams': l.max_weight_grams,
+                    'confidence_threshold': l.confidence_threshold
                 }
                 for l in lookups
             ]
@@ -362,13 +611,15 @@ def user_language_preferences():
         "success": true,
         "preferred_language": "hi",
         "voice_input_enabled": true,
-        "onboarding_completed": false
+        "onboarding_completed": false,
+        "city": "Bengaluru"
     }
     
     POST Request Body:
     {
         "preferred_language": "hi",
-        "voice_input_enabled": true
+        "voice_input_enabled": true,
+        "city": "Bengaluru"
     }
     """
     try:
@@ -379,7 +630,8 @@ def user_language_preferences():
                 'success': True,
                 'preferred_language': user.preferred_language or 'en',
                 'voice_input_enabled': getattr(user, 'voice_input_enabled', True),
-                'onboarding_completed': getattr(user, 'onboarding_completed', False)
+                'onboarding_completed': getattr(user, 'onboarding_completed', False),
+                'city': user.city
             }), 200
         
         elif request.method == 'POST':
@@ -394,6 +646,15 @@ def user_language_preferences():
             if 'onboarding_completed' in data:
                 user.onboarding_completed = data['onboarding_completed']
             
+            if 'city' in data:
+                from leaderboard import normalize_city
+                if data['city'] is not None and not isinstance(data['city'], str):
+                    return jsonify({
+                        'success': False,
+                        'error': 'city must be a string or null'
+                    }), 400
+                user.city = normalize_city(data['city']) or None
+            
             db.session.commit()
             
             return jsonify({
@@ -651,7 +912,7 @@ def get_project(project_id):
         # Get ledger entries
         ledger_entries = ProjectLedger.query.filter_by(
             project_id=project_id
-        ).order_by(ProjectLedger.timestamp).all()
+        ).order_by(ProjectLedger.seq, ProjectLedger.id).all()
         
         # Calculate progress
         progress = 0.0
@@ -719,6 +980,7 @@ def create_batch():
         "total_weight_grams": 5000.0,
         "material_type": "Plastic",
         "linked_project_id": 1,
+        "drop_location_id": 3,  // Optional: where the batch is held
         "waste_item_ids": [123, 124, 125]  // Optional: link to waste items
     }
     
@@ -734,6 +996,7 @@ def create_batch():
         total_weight_grams = data.get('total_weight_grams')
         material_type = data.get('material_type')
         linked_project_id = data.get('linked_project_id')
+        drop_location_id = data.get('drop_location_id')
         waste_item_ids = data.get('waste_item_ids', [])
         
         if not total_weight_grams or not material_type:
@@ -751,37 +1014,41 @@ def create_batch():
             total_weight_grams=float(total_weight_grams),
             material_type=material_type,
             linked_project_id=linked_project_id,
+            drop_location_id=drop_location_id,
             status='collected'
         )
         db.session.add(batch)
         db.session.flush()
         
-        # Create contributor records for linked waste items
+        # Record the batch's items and one contributor row per user
         if waste_item_ids:
+            from auto_batch_creator import add_batch_contributions, add_batch_items
+            user_weights = {}
+            item_weights = {}
             for item_id in waste_item_ids:
                 item = WasteItem.query.get(item_id)
-                if item and item.user_id:
+                if item:
                     # Get weight from footprint scan if available
                     scan = PlasticFootprintScan.query.filter_by(
                         waste_item_id=item_id
                     ).first()
                     
                     weight = scan.estimated_weight_grams if scan else (total_weight_grams / len(waste_item_ids))
-                    
-                    contributor = ProjectContributor(
-                        user_id=item.user_id,
-                        batch_id=batch.id,
-                        contribution_weight_grams=float(weight)
-                    )
-                    db.session.add(contributor)
-        
-        # Update project allocated weight
+                    item_weights[item.id] = float(weight)
+                    if item.user_id:
+                        user_weights[item.user_id] = user_weights.get(item.user_id, 0.0) + float(weight)
+            add_batch_items(batch.id, item_weights)
+            add_batch_contributions(batch.id, user_weights)
+        
+        # Update project allocated weight (in SQL, so concurrent updates all count)
         if linked_project_id:
             project = InfrastructureProject.query.get(linked_project_id)
             if project:
                 project.total_plastic_allocated_grams = (
-                    (project.total_plastic_allocated_grams or 0) + float(total_weight_grams)
+                    func.coalesce(InfrastructureProject.total_plastic_allocated_grams, 0) + float(total_weight_grams)
                 )
+                from project_allocation import consume_material_requirement
+                consume_material_requirement(project.id, material_type, float(total_weight_grams))
         
         db.session.commit()
         
@@ -842,37 +1109,17 @@ def update_ledger():
                 'error': 'project_id and status are required'
             }), 400
         
-        # Get previous hash
-        previous_entry = ProjectLedger.query.filter_by(
-            project_id=project_id
-        ).order_by(desc(ProjectLedger.timestamp)).first()
-        
-        previous_hash = previous_entry.block_hash if previous_entry else None
-        
-        # Calculate block hash
-        import json as json_lib
-        
-        block_hash = calculate_ledger_hash(
-            project_id,
-            datetime.utcnow(),
-            status,
-            verified_by,
-            batch_reference,
-            previous_hash,
-            json_lib.dumps(extra_data)
-        )
-        
-        # Create ledger entry
-        ledger = ProjectLedger(
-            project_id=project_id,
-            status=status,
-            verified_by=verified_by,
-            batch_reference=batch_reference,
-            previous_hash=previous_hash,
-            block_hash=block_hash,
-            data=json_lib.dumps(extra_data)
-        )
-        db.session.add(ledger)
+        # Append to the project's chain (next seq, linked to the current tail)
+        block_data = {
+            'batch_id': batch_reference,
+            'project_id': project_id,
+            'action': status,
+            'verified_by': verified_by,
+            'timestamp': datetime.utcnow().isoformat(),
+            'metadata': extra_data
+        }
+        ledger = append_ledger_entry(project_id, status, verified_by, batch_reference, block_data)
+        block_hash = ledger.block_hash
         db.session.commit()
         
         # Sync to Firebase Firestore
@@ -906,10 +1153,345 @@ def update_ledger():
         }), 500
 
 
-def calculate_ledger_hash(project_id, timestamp, status, verified_by, batch_reference, previous_hash, data):
-    """Calculate SHA256 hash for ledger entry"""
-    hash_input = f"{project_id}|{timestamp}|{status}|{verified_by}|{batch_reference}|{previous_hash}|{data}"
-    return hashlib.sha256(hash_input.encode()).hexdigest()
+@projects_bp.route('/ledger/<int:entry_id>/proof', methods=['GET'])
+def get_ledger_entry_proof(entry_id):
+    """
+    GET /api/projects/ledger/{entry_id}/proof
+    
+    Verify one ledger entry with a Merkle inclusion proof against its
+    project's latest anchored root. Entries added since the last anchor are
+    verified against the chain instead (method "chain", proof null).
+    
+    Response:
+    {
+        "success": true,
+        "entry_id": 42,
+        "method": "merkle_proof",
+        "is_valid": true,
+        "proof": {
+            "project_id": "proj_001",
+            "leaf_index": 41,
+            "leaf_hash": "9f2c...",
+            "leaf_count": 120,
+            "root_hash": "5ab1...",
+            "anchored_at": "2024-01-15T11:00:00",
+            "path": [
+                {"hash": "77e0...", "side": "left"},
+                ...
+            ]
+        }
+    }
+    """
+    try:
+        from ledger_merkle import verify_ledger_entry
+        result = verify_ledger_entry(entry_id)
+        if result is None:
+            return jsonify({
+                'success': False,
+                'error': 'Ledger entry not found'
+            }), 404
+        
+        return jsonify({'success': True, **result}), 200
+        
+    except Exception as e:
+        logging.error(f"Error verifying ledger entry: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+# ============================================================================
+# FEATURE 4: CARBON EMISSION REPORTING API
+# ============================================================================
+
+@carbon_bp.route('/summary', methods=['GET'])
+def get_carbon_summary():
+    """
+    GET /api/carbon/summary
+    
+    Get aggregated CO2e figures from the carbon rollup tables.
+    
+    Query Parameters:
+    - period: day, week or month (default: month)
+    - start: Inclusive start date, YYYY-MM-DD (default: start of the current period)
+    - end: Inclusive end date, YYYY-MM-DD (optional)
+    - group_by: Comma-separated subset of period,material (default: period)
+    - user: "me" for the logged-in user's figures instead of city-wide totals
+    
+    Response:
+    {
+        "success": true,
+        "period": "month",
+        "scope": "city",
+        "summary": [
+            {
+                "period_start": "2025-01-01",
+                "material_type": "Plastic",
+                "co2e_grams": -1250.5,
+                "co2e_saved_grams": 1400.0,
+                "weight_grams": 2100.0,
+                "item_count": 84
+            },
+            ...
+        ]
+    }
+    """
+    try:
+        from carbon_service import get_carbon_summary as query_carbon_summary, ROLLUP_PERIODS
+        from footprint_updater import get_period_start
+        
+        period = request.args.get('period', 'month')
+        if period not in ROLLUP_PERIODS:
+            return jsonify({
+                'success': False,
+                'error': f"period must be one of: {', '.join(ROLLUP_PERIODS)}"
+            }), 400
+        
+        group_by = [g.strip() for g in request.args.get('group_by', 'period').split(',') if g.strip()]
+        invalid_groups = [g for g in group_by if g not in ('period', 'material')]
+        if invalid_groups:
+            return jsonify({
+                'success': False,
+                'error': f"Unsupported group_by value(s): {', '.join(invalid_groups)}"
+            }), 400
+        
+        try:
+            start = request.args.get('start')
+            start = date.fromisoformat(start) if start else get_period_start(period, date.today())
+            end = request.args.get('end')
+            end = date.fromisoformat(end) if end else None
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'start and end must be dates in YYYY-MM-DD format'
+            }), 400
+        
+        user_id = None
+        if request.args.get('user') == 'me':
+            if not current_user.is_authenticated:
+                return jsonify({
+                    'success': False,
+                    'error': 'Login required for user=me'
+                }), 401
+            user_id = current_user.id
+        
+        # Align the start date to a period boundary so partial periods are included
+        start = get_period_start(period, start)
+        
+        summary = query_carbon_summary(
+            period=period,
+            start=start,
+            end=end,
+            group_by=group_by,
+            user_id=user_id
+        )
+        
+        return jsonify({
+            'success': True,
+            'period': period,
+            'scope': 'user' if user_id is not None else 'city',
+            'start': start.isoformat(),
+            'end': end.isoformat() if end else None,
+            'summary': summary
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error getting carbon summary: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@carbon_bp.route('/versions', methods=['GET'])
+def get_emission_factor_versions():
+    """
+    GET /api/carbon/versions
+    
+    Get stored emission factor sets and their audited carbon totals.
+    
+    Query Parameters:
+    - version: Only return this factor version (optional)
+    
+    Response:
+    {
+        "success": true,
+        "active_version": 2,
+        "versions": [
+            {
+                "version": 1,
+                "description": "Initial factors",
+                "is_active": false,
+                "totals": [{"material_type": "Plastic", "co2e_grams": -120.5, ...}, ...]
+            },
+            ...
+        ]
+    }
+    """
+    try:
+        from models import EmissionFactorSet
+        from carbon_service import get_version_totals
+        from emission_factors import get_active_factor_version
+        
+        version = request.args.get('version', type=int)
+        query = EmissionFactorSet.query
+        if version is not None:
+            query = query.filter_by(version=version)
+        
+        totals_by_version = {}
+        for total in get_version_totals(version):
+            totals_by_version.setdefault(total['version'], []).append(total)
+        
+        return jsonify({
+            'success': True,
+            'active_version': get_active_factor_version(),
+            'versions': [
+                {
+                    'version': factor_set.version,
+                    'description': factor_set.description,
+                    'source': factor_set.source,
+                    'is_active': factor_set.is_active,
+                    'created_at': factor_set.created_at.isoformat() if factor_set.created_at else None,
+                    'activated_at': factor_set.activated_at.isoformat() if factor_set.activated_at else None,
+                    'totals': totals_by_version.get(factor_set.version, [])
+                }
+                for factor_set in query.order_by(EmissionFactorSet.version).all()
+            ]
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error getting emission factor versions: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@carbon_bp.route('/scenarios', methods=['POST'])
+def simulate_carbon_scenarios():
+    """
+    POST /api/carbon/scenarios
+    
+    Project city-wide CO2e for alternative disposal mixes.
+    
+    Request Body:
+    {
+        "start": "2025-01-01",  // optional, inclusive
+        "end": "2025-07-01",    // optional, exclusive
+        "factor_version": 2,    // optional, defaults to the active version
+        "scenarios": [
+            {"name": "Plastic +20pts", "recycling_rate_change": {"Plastic": 0.2}},
+            {"name": "All recycled", "mix": {"*": {"recycling": 1.0}}}
+        ]
+    }
+    
+    Response:
+    {
+        "success": true,
+        "baseline": {"co2e_grams": 1520.4, "car_miles_equivalent": 3.8, ...},
+        "scenarios": [
+            {
+                "name": "Plastic +20pts",
+                "co2e_grams": 980.1,
+                "co2e_change_grams": -540.3,
+                "car_miles_equivalent": 2.45,
+                "tree_days_equivalent": 0.1,
+                "by_material": {"Plastic": -120.0, ...},
+                "recycling_rate": {"Plastic": 0.65, ...}
+            },
+            ...
+        ],
+        "elapsed_ms": 4.2
+    }
+    """
+    try:
+        import time
+        from carbon_scenarios import simulate_scenarios
+        
+        data = request.get_json() or {}
+        started = time.perf_counter()
+        
+        try:
+            start = data.get('start')
+            start = datetime.fromisoformat(start) if start else None
+            end = data.get('end')
+            end = datetime.fromisoformat(end) if end else None
+            
+            result = simulate_scenarios(
+                data.get('scenarios'),
+                start=start,
+                end=end,
+                factor_version=data.get('factor_version')
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            **result,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error simulating carbon scenarios: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+# ============================================================================
+# FEATURE 5: PERSONAL DATA EXPORT API
+# ============================================================================
+
+@export_bp.route('/me', methods=['GET'])
+@login_required
+def export_my_data():
+    """
+    GET /api/export/me
+    
+    Stream the user's waste items, footprint scans, rewards, contributions
+    and contribution ledger entries as a file download.
+    
+    Query Parameters:
+    - format: ndjson or csv (default: ndjson)
+    - section: waste_items, scans, rewards, contributions or ledger;
+      repeatable for NDJSON (default: all), exactly one for CSV
+    - compress: false to disable gzip (default: gzip if the client accepts it)
+    
+    Response: NDJSON (one {"section": ..., ...} record per line after an
+    "export" header line) or CSV, sent with Content-Encoding: gzip
+    """
+    try:
+        from data_export import build_export_stream
+        
+        compress = (
+            request.args.get('compress', 'true').lower() != 'false'
+            and 'gzip' in request.headers.get('Accept-Encoding', '')
+        )
+        chunks, mimetype, filename = build_export_stream(
+            current_user.id,
+            request.args.get('format', 'ndjson'),
+            request.args.getlist('section'),
+            compress
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 
 # ============================================================================
@@ -921,4 +1503,6 @@ def register_api_routes(app):
     app.register_blueprint(footprint_bp)
     app.register_blueprint(i18n_bp)
     app.register_blueprint(projects_bp)
+    app.register_blueprint(carbon_bp)
+    app.register_blueprint(export_bp)
 
@@ -5,261 +5,379 @@ Automatically creates batches from waste items and links them to infrastructure
 
 import uuid
 import logging
-from datetime import datetime
-from sqlalchemy import func
-from models import db, WasteItem, WasteBatch, InfrastructureProject, ProjectContributor, ProjectLedger
-from blockchain_tracker import create_material_journey_block
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, text
+from models import db, WasteItem, WasteBatch, InfrastructureProject, ProjectContributor
+from models import BatchAssignmentQueue, WasteBatchItem
+from blockchain_tracker import create_material_journey_block, append_ledger_entry
 from firestore_sync import write_ledger_entry
+from db_helpers import dialect_insert
+from project_allocation import (
+    find_requirement_for_batch, load_open_requirements, pick_requirement, get_batch_point,
+    consume_material_requirement
+)
 
-def auto_create_batch_from_waste_item(waste_item_id: int):
+# New items join a collected batch of the same material started within this window
+OPEN_BATCH_WINDOW_DAYS = 7
+
+# Batches at or above this weight are linked to a project
+BATCH_LINK_THRESHOLD_GRAMS = 1000.0
+
+# Weight used when an item has no estimate (grams)
+DEFAULT_ITEM_WEIGHT_GRAMS = 25.0
+
+# Queue rows claimed per coalescer pass
+BATCH_QUEUE_CLAIM_LIMIT = 500
+
+def add_to_open_batch(material_type: str, weight_grams: float):
+    """
+    Add weight to the open batch for a material, opening one if needed
+    
+    The weight is added with a single UPDATE ... RETURNING, so concurrent
+    writers queue on the batch row instead of overwriting each other's
+    totals. A unique partial index allows one open batch per material; if
+    two writers open one at the same time, the loser's INSERT does nothing
+    and it adds to the winner's batch. A batch whose collection window has
+    passed is closed first. Nothing is committed here.
+    
+    Args:
+        material_type: Material type (Plastic, Paper, Metal, etc.)
+        weight_grams: Weight to add
+    
+    Returns:
+        Tuple of (batch database ID, new total weight in grams)
+    """
+    table = WasteBatch.__table__
+    now = datetime.utcnow()
+    
+    db.session.execute(table.update().where(
+        table.c.material_type == material_type,
+        table.c.is_open.is_(True),
+        table.c.collection_date < now - timedelta(days=OPEN_BATCH_WINDOW_DAYS)
+    ).values(is_open=False, updated_at=now))
+    
+    increment = table.update().where(
+        table.c.material_type == material_type,
+        table.c.is_open.is_(True)
+    ).values(
+        total_weight_grams=table.c.total_weight_grams + weight_grams,
+        updated_at=now
+    ).returning(table.c.id, table.c.total_weight_grams)
+    
+    create = dialect_insert(table).values(
+        batch_id=str(uuid.uuid4()),
+        material_type=material_type,
+        total_weight_grams=weight_grams,
+        status='collected',
+        is_open=True,
+        collection_date=now,
+        created_at=now,
+        updated_at=now
+    ).on_conflict_do_nothing(
+        index_elements=['material_type'],
+        index_where=text('is_open')  # Matches the partial index predicate
+    ).returning(table.c.id, table.c.total_weight_grams)
+    
+    row = db.session.execute(increment).first()
+    if row is None:
+        row = db.session.execute(create).first()
+        if row is not None:
+            logging.info(f"Opened new {material_type} batch with {weight_grams}g")
+        else:
+            row = db.session.execute(increment).first()  # Another writer opened it first
+    if row is None:
+        raise RuntimeError(f"Could not find or open a batch for {material_type}")
+    return row.id, float(row.total_weight_grams)
+
+def add_batch_contributions(batch_id: int, user_weights: dict):
+    """
+    Add contribution weights to a batch in one upsert (nothing is committed)
+    
+    Args:
+        batch_id: Batch database ID
+        user_weights: Dictionary of user ID -> grams
+    """
+    if not user_weights:
+        return
+    
+    table = ProjectContributor.__table__
+    stmt = dialect_insert(table)
+    now = datetime.utcnow()
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id', 'batch_id'],
+        set_={'contribution_weight_grams': table.c.contribution_weight_grams + stmt.excluded.contribution_weight_grams}
+    ), [
+        {
+            'user_id': user_id,
+            'batch_id': batch_id,
+            'contribution_weight_grams': weight,
+            'contribution_date': now,
+            'is_top_contributor': False,
+            'created_at': now
+        }
+        for user_id, weight in user_weights.items()
+    ])
+
+def add_batch_items(batch_id: int, item_weights: dict):
+    """
+    Record which waste items went into a batch (nothing is committed)
+    
+    Args:
+        batch_id: Batch database ID
+        item_weights: Dictionary of waste item ID -> grams
+    """
+    if not item_weights:
+        return
+    
+    now = datetime.utcnow()
+    db.session.execute(
+        dialect_insert(WasteBatchItem.__table__).on_conflict_do_nothing(index_elements=['waste_item_id']),
+        [
+            {'batch_id': batch_id, 'waste_item_id': item_id, 'weight_grams': weight, 'added_at': now}
+            for item_id, weight in item_weights.items()
+        ]
+    )
+
+def claim_batch_for_linking(batch_id: int):
+    """
+    Lock an unlinked batch so one worker links it
+    
+    Uses SKIP LOCKED on PostgreSQL: if another worker is already linking the
+    batch, this returns None at once instead of waiting.
+    
+    Args:
+        batch_id: Batch database ID
+    
+    Returns:
+        WasteBatch (locked, freshly loaded) or None
+    """
+    return WasteBatch.query.filter(
+        WasteBatch.id == batch_id,
+        WasteBatch.linked_project_id.is_(None)
+    ).with_for_update(skip_locked=True).populate_existing().first()
+
+def _link_if_full(batch_id: int, total_weight: float, material_type: str, user_id: int = None):
+    """Link a batch to a project once it reaches the threshold (nothing is committed)"""
+    if total_weight < BATCH_LINK_THRESHOLD_GRAMS:
+        return False
+    batch = claim_batch_for_linking(batch_id)
+    if batch is None:
+        return False
+    requirement = find_requirement_for_batch(material_type, batch.drop_location_id)
+    if not requirement:
+        return False
+    return link_batch_to_project_auto(batch, requirement.project, user_id, requirement.id)
+
+def auto_create_batch_from_waste_item(waste_item_id: int, commit: bool = True):
     """
     Automatically create a batch from a waste item and link it to a project
     
+    The batch changes run inside a savepoint, so a failure here never undoes
+    the caller's other pending writes.
+    
     Args:
         waste_item_id: ID of the waste item
+        commit: Commit when done; pass False to leave the caller's
+            unit of work open
         
     Returns:
         True if successful, False otherwise
     """
     try:
-        waste_item = WasteItem.query.get(waste_item_id)
-        if not waste_item:
-            logging.error(f"Waste item not found: {waste_item_id}")
-            return False
-        
-        # Only process recyclable items
-        if not waste_item.is_recyclable:
-            logging.info(f"Waste item {waste_item_id} is not recyclable, skipping batch creation")
-            return False
-        
-        # Get material type
-        material_type = waste_item.material_type or waste_item.material or 'Plastic'
-        
-        # Get weight
-        weight = float(waste_item.estimated_weight_grams) if waste_item.estimated_weight_grams else 25.0
-        
-        # Find or create a batch for this material type (within last 7 days)
-        from datetime import timedelta
-        seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        
-        # Try to find an existing batch with same material type that's not yet allocated
-        existing_batch = WasteBatch.query.filter(
-            WasteBatch.material_type == material_type,
-            WasteBatch.status == 'collected',
-            WasteBatch.collection_date >= seven_days_ago
-        ).order_by(WasteBatch.collection_date.desc()).first()
-        
-        if existing_batch:
-            # Add to existing batch
-            existing_batch.total_weight_grams = float(existing_batch.total_weight_grams) + weight
-            batch = existing_batch
-            logging.info(f"Added {weight}g to existing batch {batch.batch_id}")
-        else:
-            # Create new batch
-            batch_id = str(uuid.uuid4())
-            batch = WasteBatch(
-                batch_id=batch_id,
-                material_type=material_type,
-                total_weight_grams=weight,
-                status='collected',
-                collection_date=datetime.utcnow()
-            )
-            db.session.add(batch)
-            logging.info(f"Created new batch {batch_id} with {weight}g of {material_type}")
-        
-        db.session.flush()  # Get batch.id
-        
-        # Create contributor entry if user is logged in
-        if waste_item.user_id:
-            # Check if contributor entry already exists
-            existing_contrib = ProjectContributor.query.filter_by(
-                user_id=waste_item.user_id,
-                batch_id=batch.id
-            ).first()
+        with db.session.begin_nested():
+            created = _add_waste_item_to_batch(waste_item_id)
+        if commit:
+            db.session.commit()
+        return created
             
-            if existing_contrib:
-                # Update existing contribution
-                existing_contrib.contribution_weight_grams = float(existing_contrib.contribution_weight_grams) + weight
-            else:
-                # Create new contributor entry
-                contributor = ProjectContributor(
-                    user_id=waste_item.user_id,
-                    batch_id=batch.id,
-                    contribution_weight_grams=weight,
-                    contribution_date=datetime.utcnow()
-                )
-                db.session.add(contributor)
-                logging.info(f"Created contributor entry for user {waste_item.user_id}")
-        
-        # Auto-link batch to a project if batch reaches threshold (e.g., 1000g or more)
-        if float(batch.total_weight_grams) >= 1000.0 and not batch.linked_project_id:
-            project = find_suitable_project(material_type)
-            if project:
-                link_batch_to_project_auto(batch, project, waste_item.user_id)
-        
-        db.session.commit()
-        return True
-        
     except Exception as e:
         logging.error(f"Error auto-creating batch from waste item: {e}")
-        db.session.rollback()
+        if commit:
+            db.session.rollback()
+        return False
+
+def _add_waste_item_to_batch(waste_item_id: int):
+    """Add a waste item to an open batch (creating one if needed) without committing"""
+    waste_item = db.session.get(WasteItem, waste_item_id)
+    if not waste_item:
+        logging.error(f"Waste item not found: {waste_item_id}")
         return False
+    
+    # Only process recyclable items
+    if not waste_item.is_recyclable:
+        logging.info(f"Waste item {waste_item_id} is not recyclable, skipping batch creation")
+        return False
+    
+    # An item goes into one batch only
+    if db.session.query(WasteBatchItem.id).filter_by(waste_item_id=waste_item_id).first():
+        logging.info(f"Waste item {waste_item_id} is already in a batch")
+        return False
+    
+    # Get material type
+    material_type = waste_item.material_type or waste_item.material or 'Plastic'
+    
+    # Get weight
+    weight = float(waste_item.estimated_weight_grams) if waste_item.estimated_weight_grams else DEFAULT_ITEM_WEIGHT_GRAMS
+    
+    batch_id, total_weight = add_to_open_batch(material_type, weight)
+    add_batch_items(batch_id, {waste_item_id: weight})
+    logging.info(f"Added {weight}g to batch {batch_id}")
+    
+    # Record the user's contribution
+    if waste_item.user_id:
+        add_batch_contributions(batch_id, {waste_item.user_id: weight})
+    
+    # Auto-link batch to a project if batch reaches threshold (e.g., 1000g or more)
+    _link_if_full(batch_id, total_weight, material_type, waste_item.user_id)
+    
+    return True
 
-def find_suitable_project(material_type: str):
+def find_suitable_project(material_type: str, drop_location_id: int = None):
     """
     Find a suitable infrastructure project for a material type
     
     Args:
         material_type: Type of material (Plastic, Paper, Metal, etc.)
-        
+        drop_location_id: Where the batch is held, if known
+            
     Returns:
         InfrastructureProject or None
     """
     try:
-        # Find projects that need this material type and are not completed
-        projects = InfrastructureProject.query.filter(
-            InfrastructureProject.status.in_(['planned', 'in_progress'])
-        ).all()
-        
-        # For now, assign to the first project that needs materials
-        # In the future, we could match by material type requirements
-        for project in projects:
-            # Check if project still needs materials
-            if project.total_plastic_required_grams:
-                allocated = float(project.total_plastic_allocated_grams or 0)
-                required = float(project.total_plastic_required_grams)
-                if allocated < required:
-                    return project
-        
-        # If no project found, return the first planned project
-        first_project = InfrastructureProject.query.filter_by(
-            status='planned'
-        ).first()
-        
-        return first_project
-        
+        requirement = find_requirement_for_batch(material_type, drop_location_id)
+        return requirement.project if requirement else None
+            
     except Exception as e:
         logging.error(f"Error finding suitable project: {e}")
         return None
 
-def link_batch_to_project_auto(batch: WasteBatch, project: InfrastructureProject, user_id: int = None):
+def link_batch_to_project_auto(batch: WasteBatch, project: InfrastructureProject, user_id: int = None,
+                               requirement_id: int = None):
     """
     Automatically link a batch to a project and create blockchain entries
     
+    Nothing is committed here; the caller owns the transaction.
+    
     Args:
         batch: WasteBatch instance
         project: InfrastructureProject instance
         user_id: Optional user ID for verification
-        
+        requirement_id: Material requirement the batch fills (default: the
+            project's row for the batch material, else its 'Any' row)
+            
     Returns:
         True if successful, False otherwise
     """
     try:
-        # Link batch to project
-        batch.linked_project_id = project.id
-        batch.status = 'allocated'
-        batch.processing_date = datetime.utcnow()
-        
-        # Update project allocated weight
-        project.total_plastic_allocated_grams = (
-            float(project.total_plastic_allocated_grams or 0) + float(batch.total_weight_grams)
-        )
-        
-        # Update project status if needed
-        if project.status == 'planned' and project.total_plastic_allocated_grams >= (project.total_plastic_required_grams or 0) * 0.1:
-            project.status = 'in_progress'
-            if project.date_started is None:
-                project.date_started = datetime.utcnow().date()
-        
-        # Create blockchain entry
-        verified_by = f'user_{user_id}' if user_id else 'system'
-        
-        # Create ledger entry for blockchain
-        from blockchain_tracker import calculate_block_hash
-        import json as json_lib
-        
-        # Get previous hash
-        previous_entry = ProjectLedger.query.filter_by(
-            project_id=project.project_id
-        ).order_by(ProjectLedger.timestamp.desc()).first()
-        
-        previous_hash = previous_entry.block_hash if previous_entry else None
-        
-        # Create block data
-        block_data = {
-            'batch_id': batch.batch_id,
-            'project_id': project.project_id,
-            'action': 'allocated',
-            'verified_by': verified_by,
-            'timestamp': datetime.utcnow().isoformat(),
-            'metadata': {
-                'weight': float(batch.total_weight_grams),
-                'material_type': batch.material_type,
-                'auto_linked': True
+        # Savepoint: a failed link leaves the rest of the transaction intact
+        with db.session.begin_nested():
+            # Link batch to project
+            batch.linked_project_id = project.id
+            batch.status = 'allocated'
+            batch.is_open = False
+            batch.processing_date = datetime.utcnow()
+            
+            # Update project allocated weight (in SQL, so concurrent links all count)
+            project.total_plastic_allocated_grams = (
+                func.coalesce(InfrastructureProject.total_plastic_allocated_grams, 0) + float(batch.total_weight_grams)
+            )
+            consume_material_requirement(project.id, batch.material_type, float(batch.total_weight_grams), requirement_id)
+            db.session.flush()
+            db.session.refresh(project, ['total_plastic_allocated_grams'])
+            
+            # Update project status if needed
+            if project.status == 'planned' and float(project.total_plastic_allocated_grams) >= float(project.total_plastic_required_grams or 0) * 0.1:
+                project.status = 'in_progress'
+                if project.date_started is None:
+                    project.date_started = datetime.utcnow().date()
+            
+            # Create blockchain entry
+            verified_by = f'user_{user_id}' if user_id else 'system'
+            
+            # Create block data
+            block_data = {
+                'batch_id': batch.batch_id,
+                'project_id': project.project_id,
+                'action': 'allocated',
+                'verified_by': verified_by,
+                'timestamp': datetime.utcnow().isoformat(),
+                'metadata': {
+                    'weight': float(batch.total_weight_grams),
+                    'material_type': batch.material_type,
+                    'auto_linked': True
+                }
             }
-        }
-        
-        # Calculate block hash
-        block_hash = calculate_block_hash(block_data, previous_hash)
-        
-        # Create ledger entry
-        ledger_entry = ProjectLedger(
-            project_id=project.project_id,
-            batch_reference=batch.batch_id,
-            status='allocated',
-            verified_by=verified_by,
-            previous_hash=previous_hash,
-            block_hash=block_hash,
-            data=json_lib.dumps(block_data),
-            timestamp=datetime.utcnow()
-        )
-        
-        db.session.add(ledger_entry)
-        
-        # Write to Firestore ledger
-        write_ledger_entry(
-            project_id=project.project_id,
-            batch_id=batch.batch_id,
-            weight=int(batch.total_weight_grams),
-            verified_by=verified_by,
-            status='allocated'
-        )
-        
-        # Update top contributors
-        from infrastructure_projects import update_top_contributors
-        update_top_contributors(project.id)
+            
+            # Append to the project's chain (next seq, linked to the current tail)
+            append_ledger_entry(project.project_id, 'allocated', verified_by, batch.batch_id, block_data)
+            
+            # Write to Firestore ledger
+            write_ledger_entry(
+                project_id=project.project_id,
+                batch_id=batch.batch_id,
+                weight=int(batch.total_weight_grams),
+                verified_by=verified_by,
+                status='allocated'
+            )
+            
+            # Update top contributors
+            from infrastructure_projects import update_top_contributors
+            update_top_contributors(project.id, commit=False)
         
         logging.info(f"Auto-linked batch {batch.batch_id} to project {project.project_name}")
         return True
         
     except Exception as e:
         logging.error(f"Error auto-linking batch to project: {e}")
-        db.session.rollback()
         return False
 
-def process_pending_batches():
+def pending_batches_query():
+    """Collected, unlinked batches at or above the link threshold"""
+    return WasteBatch.query.filter(
+        WasteBatch.status == 'collected',
+        WasteBatch.linked_project_id.is_(None),
+        WasteBatch.total_weight_grams >= BATCH_LINK_THRESHOLD_GRAMS
+    )
+
+def process_pending_batches(batch_ids=None):
     """
-    Process pending batches and link them to projects
+    Link every full pending batch to a project in one pass
+    
+    Open requirements for all pending materials are loaded with one query
+    and ranked in memory, capacity being used up as batches are assigned,
+    instead of searching the projects again for every batch.
     This can be called periodically to auto-link batches
+    
+    Args:
+        batch_ids: Only consider these batches (default: all pending)
+    
+    Returns:
+        Number of batches linked
     """
     try:
-        # Find batches that are collected but not yet allocated
-        pending_batches = WasteBatch.query.filter(
-            WasteBatch.status == 'collected',
-            WasteBatch.linked_project_id.is_(None)
-        ).all()
+        # Skip batches another worker is linking right now
+        query = pending_batches_query()
+        if batch_ids is not None:
+            query = query.filter(WasteBatch.id.in_(batch_ids))
+        pending_batches = query.order_by(WasteBatch.collection_date).with_for_update(skip_locked=True).all()
+        
+        if not pending_batches:
+            return 0
+        
+        requirements = load_open_requirements({batch.material_type for batch in pending_batches})
         
         linked_count = 0
         for batch in pending_batches:
-            # Link if batch has enough weight
-            if float(batch.total_weight_grams) >= 1000.0:
-                project = find_suitable_project(batch.material_type)
-                if project:
-                    if link_batch_to_project_auto(batch, project):
-                        linked_count += 1
+            requirement = pick_requirement(requirements, batch.material_type, get_batch_point(batch.drop_location_id))
+            if requirement is None:
+                continue
+            project = db.session.get(InfrastructureProject, requirement['project_id'])
+            if link_batch_to_project_auto(batch, project, requirement_id=requirement['id']):
+                requirement['remaining_grams'] -= float(batch.total_weight_grams)
+                linked_count += 1
         
+        db.session.commit()
         if linked_count > 0:
-            db.session.commit()
             logging.info(f"Auto-linked {linked_count} batches to projects")
         
         return linked_count
@@ -269,3 +387,97 @@ def process_pending_batches():
         db.session.rollback()
         return 0
 
+def enqueue_batch_assignment(waste_item):
+    """
+    Queue a recyclable waste item for the batch coalescer
+    
+    A single INSERT in the caller's transaction; nothing is committed here.
+    
+    Args:
+        waste_item: WasteItem instance (flushed, so it has an id)
+    
+    Returns:
+        True if the item was queued
+    """
+    if not waste_item.is_recyclable:
+        return False
+    db.session.execute(
+        dialect_insert(BatchAssignmentQueue.__table__)
+        .values(waste_item_id=waste_item.id, enqueued_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=['waste_item_id'])
+    )
+    return True
+
+def process_batch_assignment_queue(limit: int = BATCH_QUEUE_CLAIM_LIMIT, waste_item_ids=None):
+    """
+    Add queued waste items to batches, one write per batch
+    
+    Claims up to `limit` queue rows by deleting them (DELETE ... RETURNING;
+    the rows are picked with SKIP LOCKED on PostgreSQL, so several workers
+    can drain the queue at once and no row is claimed twice), groups the
+    items by material and for each material applies one weight increment
+    to the open batch, one bulk contributor upsert, and the project link if
+    the batch crossed the threshold. If anything fails the transaction is
+    rolled back and the rows stay queued.
+    
+    Args:
+        limit: Maximum queue rows to claim
+        waste_item_ids: Only process these items (e.g. to assign one now)
+    
+    Returns:
+        Number of queued items processed
+    """
+    try:
+        queue = BatchAssignmentQueue.__table__
+        pick = select(queue.c.id).order_by(queue.c.id).limit(limit).with_for_update(skip_locked=True)
+        if waste_item_ids is not None:
+            pick = pick.where(queue.c.waste_item_id.in_(waste_item_ids))
+        claimed_item_ids = db.session.execute(
+            queue.delete().where(queue.c.id.in_(pick)).returning(queue.c.waste_item_id)
+        ).scalars().all()
+        
+        if not claimed_item_ids:
+            db.session.commit()
+            return 0
+        
+        # Items already in a batch are not added again
+        claimed = db.session.query(
+            WasteItem.id,
+            WasteItem.user_id,
+            WasteItem.material_type,
+            WasteItem.material,
+            WasteItem.estimated_weight_grams,
+            WasteItem.is_recyclable
+        ).filter(
+            WasteItem.id.in_(claimed_item_ids),
+            ~select(WasteBatchItem.id).where(WasteBatchItem.waste_item_id == WasteItem.id).exists()
+        ).all()
+        
+        # material -> {'weight': total grams, 'users': {user_id: grams}, 'items': {item_id: grams}}
+        groups = {}
+        for row in claimed:
+            if not row.is_recyclable:
+                continue
+            material_type = row.material_type or row.material or 'Plastic'
+            weight = float(row.estimated_weight_grams) if row.estimated_weight_grams else DEFAULT_ITEM_WEIGHT_GRAMS
+            group = groups.setdefault(material_type, {'weight': 0.0, 'users': {}, 'items': {}})
+            group['weight'] += weight
+            group['items'][row.id] = weight
+            if row.user_id:
+                group['users'][row.user_id] = group['users'].get(row.user_id, 0.0) + weight
+        
+        for material_type in sorted(groups):  # Fixed order so concurrent workers lock batches alike
+            group = groups[material_type]
+            batch_id, total_weight = add_to_open_batch(material_type, group['weight'])
+            add_batch_items(batch_id, group['items'])
+            add_batch_contributions(batch_id, group['users'])
+            _link_if_full(batch_id, total_weight, material_type)
+            logging.info(f"Added {group['weight']}g of {material_type} to batch {batch_id}")
+        
+        db.session.commit()
+        return len(claimed_item_ids)
+        
+    except Exception as e:
+        logging.error(f"Error processing batch assignment queue: {e}")
+        db.session.rollback()
+        raise
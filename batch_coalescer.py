@@ -0,0 +1,122 @@
+"""
+Batch Coalescer
+Background stage that adds uploaded items to waste batches.
+
+Uploads only insert a batch_assignment_queue row. Every
+BATCH_COALESCE_WINDOW_SECONDS a daemon thread in each web process drains the
+queue with process_batch_assignment_queue(), which groups the collected
+items by material and applies one weight increment and one bulk contributor
+upsert per batch. On PostgreSQL queue rows are claimed with SKIP LOCKED, so
+several processes can drain the queue side by side.
+
+Set BATCH_COALESCER_ENABLED=false to run the stage elsewhere instead (e.g.
+one dedicated `python batch_coalescer.py run`).
+
+Usage:
+    python batch_coalescer.py run-once
+    python batch_coalescer.py run [--window 2]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from app import db
+from auto_batch_creator import process_batch_assignment_queue, BATCH_QUEUE_CLAIM_LIMIT
+
+# How long new items are collected before they are assigned (seconds)
+BATCH_COALESCE_WINDOW_SECONDS = float(os.environ.get('BATCH_COALESCE_WINDOW_SECONDS', '2'))
+
+BATCH_COALESCER_ENABLED = os.environ.get('BATCH_COALESCER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+_coalescer_thread = None
+_coalescer_lock = threading.Lock()
+
+def drain_batch_queue(limit: int = BATCH_QUEUE_CLAIM_LIMIT):
+    """
+    Process queued items until the queue is empty
+
+    Args:
+        limit: Queue rows claimed per pass
+
+    Returns:
+        Number of items processed
+    """
+    total = 0
+    while True:
+        processed = process_batch_assignment_queue(limit)
+        total += processed
+        if processed < limit:
+            return total
+
+def _run(app, window: float):
+    """Coalescer loop: wait one window, then drain the queue"""
+    while True:
+        time.sleep(window)
+        with app.app_context():
+            try:
+                processed = drain_batch_queue()
+                if processed:
+                    logging.info(f"Batch coalescer assigned {processed} items")
+            except Exception as e:
+                logging.error(f"Batch coalescer pass failed: {e}")
+            finally:
+                db.session.remove()
+
+def start_batch_coalescer(app, window: float = None):
+    """
+    Start this process's coalescer thread (once)
+
+    Args:
+        app: Flask application
+        window: Seconds between passes (default: BATCH_COALESCE_WINDOW_SECONDS)
+
+    Returns:
+        True if a thread is running
+    """
+    global _coalescer_thread
+    if not BATCH_COALESCER_ENABLED:
+        return False
+
+    with _coalescer_lock:
+        if _coalescer_thread is None or not _coalescer_thread.is_alive():
+            _coalescer_thread = threading.Thread(
+                target=_run,
+                args=(app, window or BATCH_COALESCE_WINDOW_SECONDS),
+                name='batch-coalescer',
+                daemon=True
+            )
+            _coalescer_thread.start()
+    return True
+
+def main():
+    """Drain the batch assignment queue from the command line"""
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Assign queued waste items to batches")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('run-once', help='Drain the queue and exit')
+
+    run_parser = subparsers.add_parser('run', help='Keep draining the queue')
+    run_parser.add_argument('--window', type=float, default=BATCH_COALESCE_WINDOW_SECONDS)
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        _run(app, args.window)
+        return
+
+    with app.app_context():
+        try:
+            processed = drain_batch_queue()
+            logging.info(f"Assigned {processed} queued items to batches")
+        except Exception as e:
+            logging.error(f"Batch coalescer failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
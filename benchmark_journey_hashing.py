@@ -0,0 +1,160 @@
+"""
+Journey Block Hashing Benchmark
+Times block hashing per chain mode and checks that stored chains verify.
+
+The timing part compares building a block's hash the original way
+(json.dumps + SHA-256 per nonce until two leading zeros) with the canonical
+hash chain, and with the proof of work now added in the background.
+
+The checks write a short journey through create_journey_block(), reload it
+from the database and verify it, mine it, tamper with it (full and
+checkpointed verification), and verify an original-scheme block. Everything
+created is deleted afterwards.
+
+Usage:
+    python benchmark_journey_hashing.py [--blocks 2000] [--difficulty 2]
+"""
+
+import argparse
+import logging
+import sys
+import time
+import uuid
+from datetime import datetime
+from app import app, db
+from models import User, WasteItem, WasteJourneyBlock
+import blockchain_service
+
+def _time_per_block(blocks, build):
+    """Average microseconds per call of build(i)"""
+    started = time.perf_counter()
+    for i in range(blocks):
+        build(i)
+    return (time.perf_counter() - started) / blocks * 1e6
+
+def run_benchmark(blocks=2000, difficulty=2):
+    """
+    Time hashing and mining of unsaved blocks
+
+    Args:
+        blocks: Blocks hashed per mode
+        difficulty: Proof-of-work leading zeros
+
+    Returns:
+        Dictionary of mode -> microseconds per block
+    """
+    def new_block(i, scheme):
+        block = WasteJourneyBlock(i, 'collection', 'Depot 4', 'Collected by truck 12', 'operator', 'ab' * 32)
+        if scheme is None:
+            block.hash_scheme = None
+            block.block_hash = block.calculate_hash()
+        return block
+
+    def legacy_mined(i):
+        block = new_block(i, None)
+        while not block.block_hash.startswith('0' * difficulty):
+            block.nonce += 1
+            block.block_hash = block.calculate_hash()
+
+    return {
+        f'original (inline PoW, difficulty {difficulty})': _time_per_block(blocks, legacy_mined),
+        'hash chain (request path)': _time_per_block(blocks, lambda i: new_block(i, 'v2')),
+        f'background PoW (difficulty {difficulty})': _time_per_block(blocks, lambda i: new_block(i, 'v2').mine_block(difficulty)),
+    }
+
+def run_checks():
+    """
+    Verify stored journeys end to end
+
+    Returns:
+        True if every check passed
+    """
+    run_id = uuid.uuid4().hex[:8]
+    user = User(username=f"journey_{run_id}", email=f"journey_{run_id}@example.invalid")
+    user.set_password(uuid.uuid4().hex)
+    db.session.add(user)
+    db.session.flush()
+    item = WasteItem(image_path='journey.jpg', user_id=user.id, material='Plastic', is_recyclable=True)
+    db.session.add(item)
+    db.session.commit()
+
+    checks = {}
+    try:
+        for stage in ('drop_off', 'collection', 'sorting'):
+            blockchain_service.create_journey_block(item.id, stage, 'Depot ü', f"{stage} details", 'benchmark')
+        db.session.expire_all()
+
+        blocks = blockchain_service.get_waste_journey(item.id)
+        checks['blocks reload valid'] = len(blocks) == 3 and all(b.is_valid() for b in blocks)
+        checks['blocks linked'] = all(blocks[i].previous_hash == blocks[i - 1].block_hash for i in range(1, 3))
+        checks['journey verifies'] = blockchain_service.verify_journey_integrity(item.id)
+        checks['not mined in request'] = all(b.pow_difficulty is None for b in blocks)
+
+        mined, _ = blockchain_service.mine_pending_blocks(blocks[0].id - 1, limit=3)
+        db.session.expire_all()
+        blocks = blockchain_service.get_waste_journey(item.id)
+        checks['mining keeps hashes'] = (
+            mined == 3 and all(b.pow_difficulty for b in blocks)
+            and blockchain_service.verify_journey_integrity(item.id)
+        )
+
+        # Earlier verifications moved the checkpoint to the last block, so
+        # edits before it are only caught by full verification
+        mined_nonce, target = blocks[1].nonce, '0' * blocks[1].pow_difficulty
+        blocks[1].nonce = next(n for n in range(mined_nonce + 1, mined_nonce + 10000)
+                               if not blocks[1].proof_hash(n).startswith(target))
+        checks['bad proof detected'] = not blockchain_service.verify_journey_integrity(item.id, full=True)
+        blocks[1].nonce = mined_nonce
+        blocks[1].details = 'tampered'
+        checks['tampering detected'] = not blockchain_service.verify_journey_integrity(item.id, full=True)
+        db.session.rollback()
+
+        blocks[-1].details = 'tampered'
+        checks['changed checkpoint block detected'] = not blockchain_service.verify_journey_integrity(item.id)
+        db.session.rollback()
+
+        appended = blockchain_service.create_journey_block(item.id, 'transport', 'Depot ü', 'transport details', 'benchmark')
+        appended.details = 'tampered'
+        checks['tampered block after checkpoint detected'] = not blockchain_service.verify_journey_integrity(item.id)
+        db.session.rollback()
+        checks['checkpointed journey verifies'] = blockchain_service.verify_journey_integrity(item.id)
+
+        legacy = WasteJourneyBlock(item.id, 'recycling', 'Plant', 'legacy', 'benchmark', blocks[-1].block_hash)
+        legacy.hash_scheme = None
+        legacy.timestamp = None
+        legacy.block_hash = legacy.calculate_hash()  # Hashed before the timestamp default, as before
+        legacy.timestamp = datetime.utcnow()
+        db.session.add(legacy)
+        db.session.commit()
+        db.session.expire_all()
+        checks['original-scheme block valid'] = db.session.get(WasteJourneyBlock, legacy.id).is_valid()
+    finally:
+        db.session.rollback()
+        WasteJourneyBlock.query.filter_by(waste_item_id=item.id).delete(synchronize_session=False)
+        WasteItem.query.filter_by(id=item.id).delete(synchronize_session=False)
+        User.query.filter_by(id=user.id).delete(synchronize_session=False)
+        db.session.commit()
+
+    for name, passed in checks.items():
+        print(f"[{'OK' if passed else 'FAIL'}] {name}")
+    return all(checks.values())
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark journey block hashing and verify stored chains")
+    parser.add_argument('--blocks', type=int, default=2000, help='Blocks hashed per mode')
+    parser.add_argument('--difficulty', type=int, default=2, help='Proof-of-work leading zeros')
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            for mode, micros in run_benchmark(args.blocks, args.difficulty).items():
+                print(f"{mode:<40} {micros:10.1f} us/block")
+            passed = run_checks()
+        except Exception as e:
+            logging.error(f"Journey benchmark failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+    sys.exit(0 if passed else 1)
+
+if __name__ == '__main__':
+    main()
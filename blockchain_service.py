@@ -1,11 +1,26 @@
 """
 Blockchain-like waste tracking system service for ReGenWorks.
 This module manages the creation and validation of waste journey blocks.
+
+JOURNEY_CHAIN_MODE selects how blocks are sealed:
+    hash  - append-only hash chain only (default)
+    pow   - hash chain, plus proof of work added in the background by the
+            'mine_journey_blocks' scheduler job
+Blocks are never mined inside a request.
 """
 
+import logging
+import os
 from models import WasteJourneyBlock, WasteItem
 from app import db
 from datetime import datetime
+from chain_checkpoints import JOURNEY_CHAIN, get_checkpoint, save_checkpoint
+from request_cache import request_memoize, invalidate_request_cache
+
+JOURNEY_CHAIN_MODE = os.environ.get('JOURNEY_CHAIN_MODE', 'hash').lower()
+
+# Leading zeros required of a block's proof hash in 'pow' mode
+JOURNEY_POW_DIFFICULTY = int(os.environ.get('JOURNEY_POW_DIFFICULTY', '2'))
 
 # Define the journey stages and their descriptions
 JOURNEY_STAGES = {
@@ -67,7 +82,7 @@ def create_journey_block(waste_item_id, stage, location, details, verified_by):
     # Get the previous block for this waste item, if any
     previous_block = WasteJourneyBlock.query.filter_by(
         waste_item_id=waste_item_id
-    ).order_by(WasteJourneyBlock.timestamp.desc()).first()
+    ).order_by(WasteJourneyBlock.timestamp.desc(), WasteJourneyBlock.id.desc()).first()
     
     previous_hash = previous_block.block_hash if previous_block else None
     
@@ -81,12 +96,10 @@ def create_journey_block(waste_item_id, stage, location, details, verified_by):
         previous_hash=previous_hash
     )
     
-    # Mine the block (simulate proof of work)
-    new_block.mine_block(difficulty=2)
-    
     # Save to database
     db.session.add(new_block)
     db.session.commit()
+    invalidate_request_cache(get_waste_journey, verify_journey_integrity)
     
     # Update the waste item status if this is the final stage
     if stage == 'completed':
@@ -98,9 +111,10 @@ def create_journey_block(waste_item_id, stage, location, details, verified_by):
     
     return new_block
 
+@request_memoize
 def get_waste_journey(waste_item_id):
     """
-    Get the complete journey of a waste item.
+    Get the complete journey of a waste item (queried once per request).
     
     Args:
         waste_item_id: ID of the waste item
@@ -110,41 +124,93 @@ def get_waste_journey(waste_item_id):
     """
     blocks = WasteJourneyBlock.query.filter_by(
         waste_item_id=waste_item_id
-    ).order_by(WasteJourneyBlock.timestamp).all()
+    ).order_by(WasteJourneyBlock.timestamp, WasteJourneyBlock.id).all()
     
     return blocks
 
-def verify_journey_integrity(waste_item_id):
+@request_memoize
+def verify_journey_integrity(waste_item_id, full=False):
     """
     Verify the integrity of the waste journey blockchain.
     
+    Blocks before the chain's checkpoint were verified before and are not
+    re-hashed; the checkpoint block itself and blocks appended since are
+    checked, after which the checkpoint moves to the newest block.
+    
     Args:
         waste_item_id: ID of the waste item
+        full: Verify every block, ignoring (and not moving) the checkpoint
         
     Returns:
         True if all blocks are valid and linked correctly, False otherwise
     """
+    checkpoint = None if full else get_checkpoint(JOURNEY_CHAIN, waste_item_id)
+    
     blocks = get_waste_journey(waste_item_id)
+    if checkpoint:
+        blocks = [block for block in blocks if block.id >= checkpoint.block_id]
     
-    if not blocks:
-        return True  # No blocks yet, so integrity is intact
+    if checkpoint:
+        # The checkpoint block must still be first and unchanged
+        if not blocks or blocks[0].id != checkpoint.block_id or blocks[0].block_hash != checkpoint.block_hash:
+            return False
+        if not blocks[0].is_valid() or not blocks[0].has_valid_proof():
+            return False
+        previous_block, new_blocks = blocks[0], blocks[1:]
+    else:
+        previous_block, new_blocks = None, blocks
+    
+    if not new_blocks:
+        return True  # No blocks yet, or none since the checkpoint
     
     # Check each block
-    for i in range(len(blocks)):
-        current_block = blocks[i]
-        
+    for current_block in new_blocks:
         # Verify the block's hash
-        if not current_block.is_valid():
+        if not current_block.is_valid() or not current_block.has_valid_proof():
             return False
         
         # Check link to previous block
-        if i > 0:
-            previous_block = blocks[i-1]
-            if current_block.previous_hash != previous_block.block_hash:
-                return False
+        if previous_block and current_block.previous_hash != previous_block.block_hash:
+            return False
+        previous_block = current_block
+    
+    if not full:
+        block_count = (checkpoint.block_count if checkpoint else 0) + len(new_blocks)
+        save_checkpoint(JOURNEY_CHAIN, waste_item_id, previous_block.id, previous_block.block_hash, block_count)
     
     return True
 
+def mine_pending_blocks(after_id=0, limit=100, difficulty=None):
+    """
+    Add proof of work to unmined blocks (the 'pow' chain mode's background step)
+    
+    Args:
+        after_id: Only blocks with a higher ID are mined
+        limit: Maximum number of blocks mined
+        difficulty: Leading zeros required (default: JOURNEY_POW_DIFFICULTY)
+        
+    Returns:
+        Tuple of (blocks mined, ID of the last block mined or None)
+    """
+    difficulty = difficulty or JOURNEY_POW_DIFFICULTY
+    blocks = WasteJourneyBlock.query.filter(
+        WasteJourneyBlock.id > after_id,
+        WasteJourneyBlock.hash_scheme.isnot(None),
+        WasteJourneyBlock.pow_difficulty.is_(None)
+    ).order_by(WasteJourneyBlock.id).limit(limit).all()
+    
+    for block in blocks:
+        block.mine_block(difficulty)
+    
+    try:
+        db.session.commit()
+    except Exception as e:
+        logging.error(f"Error mining journey blocks: {e}")
+        db.session.rollback()
+        raise
+    
+    return len(blocks), (blocks[-1].id if blocks else None)
+
 def generate_qr_code_data(waste_item_id):
     """
     Generate data for QR code to track waste item.
@@ -161,9 +227,8 @@ def generate_qr_code_data(waste_item_id):
         return None
     
     # Get the latest block
-    latest_block = WasteJourneyBlock.query.filter_by(
-        waste_item_id=waste_item_id
-    ).order_by(WasteJourneyBlock.timestamp.desc()).first()
+    blocks = get_waste_journey(waste_item_id)
+    latest_block = blocks[-1] if blocks else None
     
     # Prepare data for QR code
     qr_data = {
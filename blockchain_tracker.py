@@ -8,11 +8,59 @@ import json
 import logging
 from datetime import datetime
 from typing import Dict, List, Optional, Any
-from sqlalchemy import func
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
 from models import (
     db, WasteItem, WasteBatch, InfrastructureProject, 
-    ProjectContributor, ProjectLedger, User
+    ProjectContributor, ProjectLedger, User, WasteBatchItem, ChainCheckpoint
 )
+from chain_checkpoints import PROJECT_CHAIN, get_checkpoint, save_checkpoint
+from request_cache import request_memoize, invalidate_request_cache
+from db_helpers import is_postgres
+
+# Most ledger entries shown for one batch in a material journey
+JOURNEY_MAX_LEDGER_ENTRIES = 50
+
+# Tries before an append gives up when other writers keep taking the next seq
+LEDGER_APPEND_ATTEMPTS = 10
+
+def canonical_block_bytes(data: Dict[str, Any]) -> bytes:
+    """
+    Canonical encoding of block data (sorted keys), stored as canonical_data
+    
+    Args:
+        data: Block data dictionary
+        
+    Returns:
+        Bytes hashed into the block hash
+    """
+    return json.dumps(data, sort_keys=True, default=str).encode('utf-8')
+
+def hash_block_bytes(canonical_data: bytes, previous_hash: Optional[str] = None) -> str:
+    """
+    Hash a block's canonical bytes, chained to the previous block
+    
+    Args:
+        canonical_data: Bytes from canonical_block_bytes()
+        previous_hash: Hash of previous block (for chain linking)
+        
+    Returns:
+        SHA-256 hash string
+    """
+    prefix = previous_hash.encode('utf-8') if previous_hash else b''
+    return hashlib.sha256(prefix + canonical_data).hexdigest()
+
+def _block_data(entry: ProjectLedger) -> Dict[str, Any]:
+    """A ledger entry's data (rows not yet migrated hold it JSON-encoded)"""
+    if isinstance(entry.data, str):
+        return json.loads(entry.data)
+    return entry.data or {}
+
+def _hashed_block_data(entry: ProjectLedger) -> Dict[str, Any]:
+    """The data a ledger entry's hash covers (its canonical bytes, when stored)"""
+    if entry.canonical_data is not None:
+        return json.loads(bytes(entry.canonical_data))
+    return _block_data(entry)
 
 def calculate_block_hash(data: Dict[str, Any], previous_hash: Optional[str] = None) -> str:
     """
@@ -25,12 +73,67 @@ def calculate_block_hash(data: Dict[str, Any], previous_hash: Optional[str] = No
     Returns:
         SHA-256 hash string
     """
-    # Create a deterministic string representation
-    block_string = json.dumps(data, sort_keys=True, default=str)
-    if previous_hash:
-        block_string = f"{previous_hash}{block_string}"
+    return hash_block_bytes(canonical_block_bytes(data), previous_hash)
+
+def append_ledger_entry(
+    project_id: str,
+    status: str,
+    verified_by: str,
+    batch_reference: Optional[str],
+    block_data: Dict[str, Any]
+) -> ProjectLedger:
+    """
+    Append an entry to a project's ledger chain (flushed, not committed)
     
-    return hashlib.sha256(block_string.encode()).hexdigest()
+    The entry takes the next per-project seq and links to the entry holding
+    the previous one. UNIQUE(project_id, seq) means two concurrent appends
+    cannot both link to the same predecessor: the loser's insert fails, its
+    savepoint is rolled back and it retries against the new tail. On
+    PostgreSQL appends to one project also queue on a transaction-level
+    advisory lock, so retries are rare.
+    
+    Args:
+        project_id: Project UUID/ID
+        status: Ledger status/action
+        verified_by: User/system that verified the entry
+        batch_reference: Batch ID, if any
+        block_data: Data hashed into the block and stored with it
+        
+    Returns:
+        The new ProjectLedger entry
+    """
+    if is_postgres():
+        db.session.execute(text('SELECT pg_advisory_xact_lock(hashtext(:key))'), {'key': f'project_ledger:{project_id}'})
+    
+    for attempt in range(LEDGER_APPEND_ATTEMPTS):
+        try:
+            with db.session.begin_nested():
+                previous_entry = ProjectLedger.query.filter(
+                    ProjectLedger.project_id == project_id,
+                    ProjectLedger.seq.isnot(None)
+                ).order_by(ProjectLedger.seq.desc()).first()
+                
+                previous_hash = previous_entry.block_hash if previous_entry else None
+                canonical_data = canonical_block_bytes(block_data)
+                ledger_entry = ProjectLedger(
+                    project_id=project_id,
+                    seq=previous_entry.seq + 1 if previous_entry else 1,
+                    batch_reference=batch_reference,
+                    status=status,
+                    verified_by=verified_by,
+                    previous_hash=previous_hash,
+                    block_hash=hash_block_bytes(canonical_data, previous_hash),
+                    data=block_data,
+                    canonical_data=canonical_data,
+                    timestamp=datetime.utcnow()
+                )
+                db.session.add(ledger_entry)
+            invalidate_request_cache(get_project_blockchain)
+            return ledger_entry
+        except IntegrityError:
+            # Another writer took this seq; read the new tail and try again
+            if attempt == LEDGER_APPEND_ATTEMPTS - 1:
+                raise
 
 def create_material_journey_block(
     waste_item_id: int,
@@ -55,13 +158,6 @@ def create_material_journey_block(
         Block dictionary with hash
     """
     try:
-        # Get previous block hash for this material journey
-        previous_block = ProjectLedger.query.filter_by(
-            project_id=project_id
-        ).order_by(ProjectLedger.timestamp.desc()).first()
-        
-        previous_hash = previous_block.block_hash if previous_block else None
-        
         # Create block data
         block_data = {
             'waste_item_id': waste_item_id,
@@ -73,22 +169,8 @@ def create_material_journey_block(
             'metadata': metadata or {}
         }
         
-        # Calculate block hash
-        block_hash = calculate_block_hash(block_data, previous_hash)
-        
-        # Create ledger entry
-        ledger_entry = ProjectLedger(
-            project_id=project_id,
-            batch_reference=batch_id,
-            status=action,
-            verified_by=verified_by,
-            previous_hash=previous_hash,
-            block_hash=block_hash,
-            data=json.dumps(block_data),
-            timestamp=datetime.utcnow()
-        )
-        
-        db.session.add(ledger_entry)
+        # Append to the project's chain
+        ledger_entry = append_ledger_entry(project_id, action, verified_by, batch_id, block_data)
         db.session.commit()
         
         # Sync to Firestore
@@ -102,8 +184,8 @@ def create_material_journey_block(
         )
         
         return {
-            'block_hash': block_hash,
-            'previous_hash': previous_hash,
+            'block_hash': ledger_entry.block_hash,
+            'previous_hash': ledger_entry.previous_hash,
             'data': block_data,
             'timestamp': datetime.utcnow().isoformat()
         }
@@ -143,54 +225,63 @@ def get_material_journey(waste_item_id: int) -> List[Dict]:
             'block_type': 'waste_item'
         })
         
-        # Step 2: Find if item is in a batch
-        # This requires a link table - for now, we'll check via material type and date
-        batches = WasteBatch.query.filter_by(
-            material_type=waste_item.material or 'Plastic'
-        ).filter(
-            WasteBatch.collection_date >= waste_item.created_at
-        ).all()
+        # Step 2: The batch the item went into (one indexed lookup)
+        membership = db.session.query(
+            WasteBatchItem.weight_grams.label('item_weight'),
+            WasteBatch.batch_id,
+            WasteBatch.material_type,
+            WasteBatch.total_weight_grams,
+            WasteBatch.status,
+            WasteBatch.collection_date,
+            WasteBatchItem.added_at,
+            InfrastructureProject.project_id,
+            InfrastructureProject.project_name
+        ).join(
+            WasteBatch, WasteBatch.id == WasteBatchItem.batch_id
+        ).outerjoin(
+            InfrastructureProject, InfrastructureProject.id == WasteBatch.linked_project_id
+        ).filter(WasteBatchItem.waste_item_id == waste_item_id).first()
+        
+        if membership is None:
+            return journey
+        
+        added_at = membership.added_at or membership.collection_date
+        journey.append({
+            'step': len(journey) + 1,
+            'action': 'batched',
+            'description': f'Material added to batch {membership.batch_id}',
+            'batch_id': membership.batch_id,
+            'material': membership.material_type,
+            'weight': float(membership.total_weight_grams),
+            'item_weight': float(membership.item_weight),
+            'timestamp': added_at.isoformat() if added_at else None,
+            'verified_by': 'system',
+            'status': membership.status,
+            'block_type': 'batch'
+        })
         
-        for batch in batches:
-            # Step 2: Batched
-            journey.append({
-                'step': len(journey) + 1,
-                'action': 'batched',
-                'description': f'Material added to batch {batch.batch_id}',
-                'batch_id': batch.batch_id,
-                'material': batch.material_type,
-                'weight': float(batch.total_weight_grams),
-                'timestamp': batch.collection_date.isoformat() if batch.collection_date else None,
-                'verified_by': 'system',
-                'status': batch.status,
-                'block_type': 'batch'
-            })
+        # Step 3: Ledger entries for the batch's project
+        if membership.project_id:
+            ledger_entries = ProjectLedger.query.filter_by(
+                project_id=membership.project_id,
+                batch_reference=membership.batch_id
+            ).order_by(ProjectLedger.seq).limit(JOURNEY_MAX_LEDGER_ENTRIES).all()
             
-            # Step 3: Check if batch is linked to project
-            if batch.linked_project_id:
-                project = InfrastructureProject.query.get(batch.linked_project_id)
-                if project:
-                    # Get ledger entries for this project
-                    ledger_entries = ProjectLedger.query.filter_by(
-                        project_id=project.project_id,
-                        batch_reference=batch.batch_id
-                    ).order_by(ProjectLedger.timestamp).all()
-                    
-                    for entry in ledger_entries:
-                        journey.append({
-                            'step': len(journey) + 1,
-                            'action': entry.status,
-                            'description': f'Material allocated to project: {project.project_name}',
-                            'project_id': project.project_id,
-                            'project_name': project.project_name,
-                            'batch_id': batch.batch_id,
-                            'timestamp': entry.timestamp.isoformat() if entry.timestamp else None,
-                            'verified_by': entry.verified_by,
-                            'status': entry.status,
-                            'block_hash': entry.block_hash,
-                            'previous_hash': entry.previous_hash,
-                            'block_type': 'ledger'
-                        })
+            for entry in ledger_entries:
+                journey.append({
+                    'step': len(journey) + 1,
+                    'action': entry.status,
+                    'description': f'Material allocated to project: {membership.project_name}',
+                    'project_id': membership.project_id,
+                    'project_name': membership.project_name,
+                    'batch_id': membership.batch_id,
+                    'timestamp': entry.timestamp.isoformat() if entry.timestamp else None,
+                    'verified_by': entry.verified_by,
+                    'status': entry.status,
+                    'block_hash': entry.block_hash,
+                    'previous_hash': entry.previous_hash,
+                    'block_type': 'ledger'
+                })
         
         return journey
         
@@ -198,9 +289,74 @@ def get_material_journey(waste_item_id: int) -> List[Dict]:
         logging.error(f"Error getting material journey: {e}")
         return []
 
+def _validate_chain(entries: List[ProjectLedger], checkpoint: Optional[ChainCheckpoint],
+                    check_data: bool = False) -> List[bool]:
+    """
+    Validate ledger entries in chain order
+    
+    Entries before a still-intact checkpoint only get their links checked;
+    the checkpoint entry itself and everything after it are re-hashed.
+    
+    Args:
+        entries: Ledger entries in chain (seq) order
+        checkpoint: The chain's checkpoint, if any
+        check_data: Also check each re-hashed entry's data against its canonical bytes
+        
+    Returns:
+        List of validity flags, one per entry
+    """
+    trusted_id = None
+    if checkpoint and any(
+        entry.id == checkpoint.block_id and entry.block_hash == checkpoint.block_hash for entry in entries
+    ):
+        trusted_id = checkpoint.block_id
+    
+    flags = []
+    trusted = trusted_id is not None
+    for i, entry in enumerate(entries):
+        previous_entry = entries[i-1] if i > 0 else None
+        if trusted and entry.id != trusted_id:
+            flags.append(previous_entry is None or entry.previous_hash == previous_entry.block_hash)
+        else:
+            flags.append(_validate_block(entry, previous_entry, check_data))
+            trusted = False
+    return flags
+
+def _advance_checkpoint(project_id: str, entries: List[ProjectLedger], flags: List[bool],
+                        checkpoint: Optional[ChainCheckpoint]):
+    """Move a project's checkpoint to the end of the valid prefix of its chain"""
+    valid_count = len(flags) if all(flags) else flags.index(False)
+    if valid_count == 0 or (checkpoint and checkpoint.block_count >= valid_count):
+        return
+    last = entries[valid_count - 1]
+    save_checkpoint(PROJECT_CHAIN, project_id, last.id, last.block_hash, valid_count)
+
+def verify_project_chain(project_id: str, full: bool = False) -> bool:
+    """
+    Verify a project's ledger chain
+    
+    Args:
+        project_id: Project UUID/ID
+        full: Re-hash every entry and check its data against the hashed bytes,
+            ignoring (and not moving) the checkpoint
+        
+    Returns:
+        True if every entry is valid and linked correctly
+    """
+    entries = ProjectLedger.query.filter_by(
+        project_id=project_id
+    ).order_by(ProjectLedger.seq, ProjectLedger.id).all()
+    
+    checkpoint = None if full else get_checkpoint(PROJECT_CHAIN, project_id)
+    flags = _validate_chain(entries, checkpoint, check_data=full)
+    if not full:
+        _advance_checkpoint(project_id, entries, flags, checkpoint)
+    return all(flags)
+
+@request_memoize
 def get_project_blockchain(project_id: str) -> List[Dict]:
     """
-    Get the complete blockchain for an infrastructure project
+    Get the complete blockchain for an infrastructure project (built once per request)
     
     Args:
         project_id: Project UUID/ID
@@ -216,11 +372,16 @@ def get_project_blockchain(project_id: str) -> List[Dict]:
         # Get all ledger entries for this project
         ledger_entries = ProjectLedger.query.filter_by(
             project_id=project_id
-        ).order_by(ProjectLedger.timestamp).all()
+        ).order_by(ProjectLedger.seq, ProjectLedger.id).all()
+        
+        # Only entries after the verified checkpoint are re-hashed
+        checkpoint = get_checkpoint(PROJECT_CHAIN, project_id)
+        validity = _validate_chain(ledger_entries, checkpoint)
         
         blockchain = []
         for i, entry in enumerate(ledger_entries):
-            block_data = json.loads(entry.data) if entry.data else {}
+            # Show the data the hash covers, not the (editable) data column
+            block_data = _hashed_block_data(entry)
             
             blockchain.append({
                 'block_number': i + 1,
@@ -231,22 +392,26 @@ def get_project_blockchain(project_id: str) -> List[Dict]:
                 'verified_by': entry.verified_by,
                 'batch_id': entry.batch_reference,
                 'data': block_data,
-                'is_valid': _validate_block(entry, ledger_entries[i-1] if i > 0 else None)
+                'is_valid': validity[i]
             })
         
+        _advance_checkpoint(project_id, ledger_entries, validity, checkpoint)
+        
         return blockchain
         
     except Exception as e:
         logging.error(f"Error getting project blockchain: {e}")
         return []
 
-def _validate_block(block: ProjectLedger, previous_block: Optional[ProjectLedger]) -> bool:
+def _validate_block(block: ProjectLedger, previous_block: Optional[ProjectLedger],
+                    check_data: bool = False) -> bool:
     """
     Validate a blockchain block by checking hash integrity
     
     Args:
         block: Current block
         previous_block: Previous block in chain
+        check_data: Also require the data column to match the hashed canonical bytes
         
     Returns:
         True if block is valid, False otherwise
@@ -255,9 +420,13 @@ def _validate_block(block: ProjectLedger, previous_block: Optional[ProjectLedger
         if previous_block and block.previous_hash != previous_block.block_hash:
             return False
         
-        # Recalculate hash to verify
-        block_data = json.loads(block.data) if block.data else {}
-        calculated_hash = calculate_block_hash(block_data, block.previous_hash)
+        # Recalculate hash to verify (one SHA-256 over the stored bytes)
+        if block.canonical_data is not None:
+            if check_data and canonical_block_bytes(_block_data(block)) != bytes(block.canonical_data):
+                return False
+            calculated_hash = hash_block_bytes(block.canonical_data, block.previous_hash)
+        else:
+            calculated_hash = calculate_block_hash(_block_data(block), block.previous_hash)
         
         return calculated_hash == block.block_hash
         
@@ -265,9 +434,10 @@ def _validate_block(block: ProjectLedger, previous_block: Optional[ProjectLedger
         logging.error(f"Error validating block: {e}")
         return False
 
+@request_memoize
 def get_user_contribution_chain(user_id: int) -> List[Dict]:
     """
-    Get the complete contribution chain for a user showing their materials' journey
+    Get the complete contribution chain for a user showing their materials' journey (built once per request)
     
     Args:
         user_id: User ID
@@ -3,6 +3,22 @@ Carbon Emission Calculator for Waste Items
 Calculates CO2 equivalent emissions based on material type and weight
 """
 
+# Version of CARBON_EMISSION_FACTORS below; stored with every persisted
+# emission figure so numbers computed with different factors never mix.
+# The factors themselves are versioned in the database (see emission_factors.py);
+# this dict seeds version 1 and is the fallback when no set is stored.
+EMISSION_FACTOR_VERSION = 1
+
+# Disposal methods every factor set defines, in matrix column order
+DISPOSAL_METHODS = ('production', 'landfill', 'incineration', 'recycling')
+
+# Equivalent comparisons
+CAR_MILES_PER_KG_CO2 = 2.5  # 1 kg CO2 ≈ driving 2.5 miles in average car
+TREE_DAYS_PER_KG_CO2 = 0.1  # 1 kg CO2 ≈ 0.1 tree days of CO2 absorption
+
+# Default weight (grams) used when no estimate is available
+DEFAULT_ITEM_WEIGHT_GRAMS = 25.0
+
 # Carbon emission factors (kg CO2e per kg of material)
 # Sources: EPA, IPCC, and industry standards
 CARBON_EMISSION_FACTORS = {
@@ -56,7 +72,7 @@ CARBON_EMISSION_FACTORS = {
     }
 }
 
-def calculate_carbon_emissions(material_type, weight_grams, disposal_method='landfill'):
+def calculate_carbon_emissions(material_type, weight_grams, disposal_method='landfill', factor_set=None):
     """
     Calculate carbon emissions for a waste item
     
@@ -64,13 +80,18 @@ def calculate_carbon_emissions(material_type, weight_grams, disposal_method='lan
         material_type: Type of material (Plastic, Paper, Metal, etc.)
         weight_grams: Weight in grams
         disposal_method: 'landfill', 'incineration', 'recycling', or 'production'
+        factor_set: Optional {material: {method: factor}} mapping to use instead
+            of CARBON_EMISSION_FACTORS
     
     Returns:
         Dictionary with emission calculations
     """
+    if factor_set is None:
+        factor_set = CARBON_EMISSION_FACTORS
+    
     # Get emission factors for material
-    material = material_type if material_type in CARBON_EMISSION_FACTORS else 'Unknown'
-    factors = CARBON_EMISSION_FACTORS.get(material, CARBON_EMISSION_FACTORS['Unknown'])
+    material = material_type if material_type in factor_set else 'Unknown'
+    factors = factor_set.get(material, factor_set['Unknown'])
     
     # Convert grams to kg
     weight_kg = weight_grams / 1000.0
@@ -91,10 +112,8 @@ def calculate_carbon_emissions(material_type, weight_grams, disposal_method='lan
         is_savings = False
     
     # Calculate equivalent comparisons
-    # 1 kg CO2 ≈ driving 2.5 miles in average car
-    # 1 kg CO2 ≈ 0.1 tree days of CO2 absorption
-    car_miles_equivalent = abs(co2_emissions) * 2.5
-    tree_days_equivalent = abs(co2_emissions) * 0.1
+    car_miles_equivalent = abs(co2_emissions) * CAR_MILES_PER_KG_CO2
+    tree_days_equivalent = abs(co2_emissions) * TREE_DAYS_PER_KG_CO2
     
     return {
         'material_type': material_type,
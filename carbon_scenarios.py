@@ -0,0 +1,219 @@
+"""
+City-wide "What-If" Carbon Scenario Simulator
+Projects CO2e for alternative disposal mixes using stored per-material weights
+
+Weights are aggregated once per request as a (materials x disposal methods)
+matrix. Every scenario is a matrix of disposal shares, so all scenarios are
+evaluated together as one (scenarios x materials x disposal methods) product.
+"""
+
+import numpy as np
+from sqlalchemy import func
+from app import db
+from models import WasteItem
+from carbon_calculator import DEFAULT_ITEM_WEIGHT_GRAMS, CAR_MILES_PER_KG_CO2, TREE_DAYS_PER_KG_CO2
+from carbon_service import get_item_material_key
+from emission_factors import get_active_emission_factors, get_emission_factors
+
+# Disposal methods a waste item can end up in ('production' is not a disposal route)
+SCENARIO_DISPOSAL_METHODS = ('landfill', 'incineration', 'recycling')
+
+# Upper bound on scenarios evaluated per request
+MAX_SCENARIOS = 1000
+
+def load_material_disposal_weights(start=None, end=None):
+    """
+    Aggregate stored item weights by material and disposal method in one query
+
+    Args:
+        start: Optional inclusive datetime lower bound on created_at
+        end: Optional exclusive datetime upper bound on created_at
+
+    Returns:
+        Tuple of (material list, weights array of shape materials x methods in grams)
+    """
+    material_key = get_item_material_key()
+    weight = func.coalesce(WasteItem.estimated_weight_grams, DEFAULT_ITEM_WEIGHT_GRAMS)
+
+    query = db.session.query(
+        material_key.label('material_type'),
+        WasteItem.disposal_method,
+        func.sum(weight).label('weight_grams')
+    ).filter(WasteItem.disposal_method.in_(SCENARIO_DISPOSAL_METHODS))
+
+    if start is not None:
+        query = query.filter(WasteItem.created_at >= start)
+    if end is not None:
+        query = query.filter(WasteItem.created_at < end)
+
+    rows = query.group_by(material_key, WasteItem.disposal_method).all()
+
+    materials = sorted({row.material_type for row in rows})
+    material_index = {material_type: i for i, material_type in enumerate(materials)}
+    method_index = {method: i for i, method in enumerate(SCENARIO_DISPOSAL_METHODS)}
+
+    weights = np.zeros((len(materials), len(SCENARIO_DISPOSAL_METHODS)))
+    for row in rows:
+        weights[material_index[row.material_type], method_index[row.disposal_method]] = float(row.weight_grams)
+
+    return materials, weights
+
+def _material_targets(materials, material_type):
+    """Indices a scenario key applies to; '*' means every material"""
+    if material_type == '*':
+        return list(range(len(materials)))
+    return [i for i, m in enumerate(materials) if m == material_type]
+
+def build_scenario_shares(materials, baseline_shares, scenarios):
+    """
+    Turn scenario definitions into disposal share matrices
+
+    Each scenario starts from the observed mix and may contain:
+    - mix: {material: {method: share}} absolute shares (normalised to 1)
+    - recycling_rate_change: {material: points} added to the recycling share,
+      e.g. 0.2 for +20 percentage points; other methods shrink proportionally
+
+    Either kind of key may be '*' to apply to every material.
+
+    Args:
+        materials: Material list from load_material_disposal_weights()
+        baseline_shares: Observed shares, shape materials x methods
+        scenarios: List of scenario dictionaries
+
+    Returns:
+        Array of shape scenarios x materials x methods
+
+    Raises:
+        ValueError: If a scenario is malformed
+    """
+    recycling = SCENARIO_DISPOSAL_METHODS.index('recycling')
+    landfill = SCENARIO_DISPOSAL_METHODS.index('landfill')
+    shares = np.repeat(baseline_shares[np.newaxis, :, :], len(scenarios), axis=0)
+
+    for k, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict):
+            raise ValueError(f"Scenario {k} must be an object")
+
+        mixes = scenario.get('mix') or {}
+        rate_changes = scenario.get('recycling_rate_change') or {}
+        if not isinstance(mixes, dict):
+            raise ValueError(f"Scenario {k}: mix must be an object")
+        if not isinstance(rate_changes, dict):
+            raise ValueError(f"Scenario {k}: recycling_rate_change must be an object")
+
+        for material_type, mix in mixes.items():
+            if not isinstance(mix, dict):
+                raise ValueError(f"Scenario {k}: mix for {material_type} must be an object")
+            unknown_methods = [m for m in mix if m not in SCENARIO_DISPOSAL_METHODS]
+            if unknown_methods:
+                raise ValueError(f"Scenario {k}: unknown disposal method(s) {', '.join(unknown_methods)}")
+            row = np.array([float(mix.get(m, 0)) for m in SCENARIO_DISPOSAL_METHODS])
+            if (row < 0).any() or row.sum() <= 0:
+                raise ValueError(f"Scenario {k}: mix for {material_type} must be non-negative and non-zero")
+            shares[k, _material_targets(materials, material_type)] = row / row.sum()
+
+        for material_type, change in rate_changes.items():
+            targets = _material_targets(materials, material_type)
+            if not targets:
+                continue
+            current = shares[k, targets]
+            old_rate = current[:, recycling]
+            new_rate = np.clip(old_rate + float(change), 0.0, 1.0)
+            remainder = 1.0 - old_rate
+
+            # Scale the non-recycling methods to fill what recycling leaves
+            scale = np.divide(1.0 - new_rate, remainder, out=np.zeros_like(remainder), where=remainder > 0)
+            updated = current * scale[:, np.newaxis]
+            updated[:, recycling] = new_rate
+            # Fully-recycled materials have nothing to scale; send the rest to landfill
+            updated[remainder <= 0, landfill] = 1.0 - new_rate[remainder <= 0]
+            shares[k, targets] = updated
+
+    return shares
+
+def _equivalents(co2e_grams):
+    """Car-mile and tree-day equivalents for a CO2e figure (array or scalar)"""
+    co2e_kg = np.abs(co2e_grams) / 1000.0
+    return co2e_kg * CAR_MILES_PER_KG_CO2, co2e_kg * TREE_DAYS_PER_KG_CO2
+
+def simulate_scenarios(scenarios, start=None, end=None, factor_version=None):
+    """
+    Project city-wide CO2e for many disposal-mix scenarios at once
+
+    Args:
+        scenarios: List of scenario dictionaries (see build_scenario_shares)
+        start: Optional inclusive datetime lower bound on created_at
+        end: Optional exclusive datetime upper bound on created_at
+        factor_version: Emission factor version (defaults to the active one)
+
+    Returns:
+        Dictionary with the baseline and one projection per scenario
+
+    Raises:
+        ValueError: If the scenarios or factor version are invalid
+    """
+    if not isinstance(scenarios, list) or not scenarios:
+        raise ValueError("scenarios must be a non-empty list")
+    if len(scenarios) > MAX_SCENARIOS:
+        raise ValueError(f"At most {MAX_SCENARIOS} scenarios can be evaluated per request")
+
+    if factor_version is None:
+        factor_version, factor_set = get_active_emission_factors()
+    else:
+        factor_set = get_emission_factors(factor_version)
+        if factor_set is None:
+            raise ValueError(f"Emission factor version {factor_version} does not exist")
+
+    materials, weights = load_material_disposal_weights(start, end)
+
+    material_weights = weights.sum(axis=1)
+    baseline_shares = np.divide(
+        weights, material_weights[:, np.newaxis],
+        out=np.zeros_like(weights), where=material_weights[:, np.newaxis] > 0
+    )
+    factors = np.array([
+        [float(factor_set.get(m, factor_set['Unknown'])[method]) for method in SCENARIO_DISPOSAL_METHODS]
+        for m in materials
+    ]).reshape(len(materials), len(SCENARIO_DISPOSAL_METHODS))
+
+    shares = build_scenario_shares(materials, baseline_shares, scenarios)
+
+    # grams x (kg CO2e / kg) = grams CO2e, per scenario and material
+    by_material = np.einsum('m,kmd,md->km', material_weights, shares, factors)
+    totals = by_material.sum(axis=1)
+    baseline_by_material = np.einsum('md,md->m', weights, factors)
+    baseline_total = float(baseline_by_material.sum())
+
+    car_miles, tree_days = _equivalents(totals)
+    baseline_miles, baseline_tree_days = _equivalents(baseline_total)
+    recycling = SCENARIO_DISPOSAL_METHODS.index('recycling')
+
+    return {
+        'factor_version': factor_version,
+        'materials': materials,
+        'baseline': {
+            'co2e_grams': round(baseline_total, 2),
+            'car_miles_equivalent': round(float(baseline_miles), 2),
+            'tree_days_equivalent': round(float(baseline_tree_days), 2),
+            'weight_grams': round(float(material_weights.sum()), 2),
+            'recycling_rate': {
+                m: round(float(baseline_shares[i, recycling]), 4) for i, m in enumerate(materials)
+            }
+        },
+        'scenarios': [
+            {
+                'name': scenario.get('name') or f"Scenario {k + 1}",
+                'co2e_grams': round(float(totals[k]), 2),
+                'co2e_change_grams': round(float(totals[k]) - baseline_total, 2),
+                'car_miles_equivalent': round(float(car_miles[k]), 2),
+                'tree_days_equivalent': round(float(tree_days[k]), 2),
+                'by_material': {
+                    m: round(float(by_material[k, i]), 2) for i, m in enumerate(materials)
+                },
+                'recycling_rate': {
+                    m: round(float(shares[k, i, recycling]), 4) for i, m in enumerate(materials)
+                }
+            }
+            for k, scenario in enumerate(scenarios)
+        ]
+    }
@@ -0,0 +1,737 @@
+"""
+Carbon Emission Persistence and Reporting
+Stores per-item CO2e figures at write time so carbon totals are plain SQL SUMs
+
+Usage:
+    python carbon_service.py backfill [--chunk-size 1000]
+    python carbon_service.py rebuild-rollups [--chunk-size 1000]
+    python carbon_service.py recompute [--to-version N] [--chunk-size 5000]
+    python carbon_service.py version-totals [--version N] [--refresh]
+"""
+
+import argparse
+import json
+import logging
+import sys
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+from sqlalchemy import and_, case, func, or_, update
+from app import db
+from models import WasteItem, CarbonUserRollup, CarbonCityRollup, EmissionFactorVersionTotal
+from carbon_calculator import (
+    calculate_carbon_emissions, EMISSION_FACTOR_VERSION, DEFAULT_ITEM_WEIGHT_GRAMS, DISPOSAL_METHODS
+)
+from db_helpers import dialect_insert
+from emission_factors import get_active_emission_factors, get_active_factor_version, get_emission_factors
+from footprint_updater import get_period_start
+
+# Rollup granularities maintained for every item
+ROLLUP_PERIODS = ('day', 'week', 'month')
+
+# Additive measures stored on both rollup tables
+ROLLUP_MEASURES = ('co2e_grams', 'co2e_saved_grams', 'weight_grams', 'item_count')
+
+# EmissionFactorVersionTotal.snapshot_kind values
+SNAPSHOT_CURRENT = 'current'
+SNAPSHOT_DEPARTING = 'departing'
+SNAPSHOT_DEPARTED = 'departed'
+
+def get_disposal_method(is_recyclable):
+    """Disposal method assumed for an item based on its recyclability"""
+    return 'recycling' if is_recyclable else 'landfill'
+
+def calculate_emissions(material_type, weight_grams, disposal_method='landfill'):
+    """
+    Calculate carbon emissions with the active emission factor set
+
+    Args:
+        material_type: Type of material (Plastic, Paper, Metal, etc.)
+        weight_grams: Weight in grams
+        disposal_method: 'landfill', 'incineration', 'recycling', or 'production'
+
+    Returns:
+        Dictionary from calculate_carbon_emissions() plus 'emission_factor_version'
+    """
+    version, factor_set = get_active_emission_factors()
+    carbon_data = calculate_carbon_emissions(material_type, weight_grams, disposal_method, factor_set=factor_set)
+    carbon_data['emission_factor_version'] = version
+    return carbon_data
+
+def apply_carbon_to_item(waste_item: WasteItem, carbon_data: dict):
+    """
+    Copy a calculate_emissions() result onto a waste item
+
+    Args:
+        waste_item: WasteItem instance (not committed here)
+        carbon_data: Dictionary from calculate_emissions()
+    """
+    waste_item.co2e_grams = carbon_data['co2_emissions_grams']
+    waste_item.disposal_method = carbon_data['disposal_method']
+    waste_item.emission_factor_version = carbon_data.get('emission_factor_version', EMISSION_FACTOR_VERSION)
+
+def calculate_item_carbon(waste_item: WasteItem):
+    """
+    Calculate and store carbon emissions for a waste item from its own fields
+
+    Args:
+        waste_item: WasteItem instance (not committed here)
+
+    Returns:
+        Dictionary from calculate_emissions()
+    """
+    material_type = waste_item.material_type or waste_item.material or 'Unknown'
+    weight = float(waste_item.estimated_weight_grams) if waste_item.estimated_weight_grams else DEFAULT_ITEM_WEIGHT_GRAMS
+    carbon_data = calculate_emissions(material_type, weight, get_disposal_method(waste_item.is_recyclable))
+    apply_carbon_to_item(waste_item, carbon_data)
+    return carbon_data
+
+def get_carbon_totals(user_id: int = None, start=None, end=None):
+    """
+    Sum stored carbon figures with a single aggregate query
+
+    Args:
+        user_id: Optional user filter
+        start: Optional inclusive datetime lower bound on created_at
+        end: Optional exclusive datetime upper bound on created_at
+
+    Returns:
+        Dictionary with net CO2e, CO2e saved by recycling, weight and item count
+    """
+    saved = func.sum(
+        case((WasteItem.co2e_grams < 0, -WasteItem.co2e_grams), else_=0)
+    )
+    query = db.session.query(
+        func.coalesce(func.sum(WasteItem.co2e_grams), 0),
+        func.coalesce(saved, 0),
+        func.coalesce(func.sum(WasteItem.estimated_weight_grams), 0),
+        func.count(WasteItem.id)
+    ).filter(WasteItem.co2e_grams.isnot(None))
+
+    if user_id is not None:
+        query = query.filter(WasteItem.user_id == user_id)
+    if start is not None:
+        query = query.filter(WasteItem.created_at >= start)
+    if end is not None:
+        query = query.filter(WasteItem.created_at < end)
+
+    net_grams, saved_grams, weight_grams, item_count = query.one()
+    return {
+        'co2e_grams': float(net_grams),
+        'co2e_saved_grams': float(saved_grams),
+        'weight_grams': float(weight_grams),
+        'item_count': int(item_count)
+    }
+
+def backfill_item_carbon(chunk_size: int = 1000):
+    """
+    One-time backfill of carbon columns for items created before they existed
+
+    Items are read in primary-key order and written back with one bulk
+    UPDATE and commit per chunk, so the job can be interrupted and re-run.
+
+    Args:
+        chunk_size: Number of waste items per chunk
+
+    Returns:
+        Number of waste items updated
+    """
+    updated_count = 0
+    last_id = 0
+
+    while True:
+        rows = db.session.query(
+            WasteItem.id,
+            WasteItem.material_type,
+            WasteItem.material,
+            WasteItem.estimated_weight_grams,
+            WasteItem.is_recyclable
+        ).filter(
+            WasteItem.id > last_id,
+            WasteItem.co2e_grams.is_(None)
+        ).order_by(WasteItem.id).limit(chunk_size).all()
+
+        if not rows:
+            break
+
+        last_id = rows[-1].id
+
+        item_updates = []
+        for row in rows:
+            material_type = row.material_type or row.material or 'Unknown'
+            weight = float(row.estimated_weight_grams) if row.estimated_weight_grams else DEFAULT_ITEM_WEIGHT_GRAMS
+            carbon_data = calculate_emissions(material_type, weight, get_disposal_method(row.is_recyclable))
+            item_updates.append({
+                'id': row.id,
+                'co2e_grams': carbon_data['co2_emissions_grams'],
+                'disposal_method': carbon_data['disposal_method'],
+                'emission_factor_version': carbon_data['emission_factor_version']
+            })
+
+        db.session.execute(update(WasteItem), item_updates)
+        db.session.commit()
+
+        updated_count += len(item_updates)
+        logging.info(f"Backfilled carbon for {updated_count} waste items (last id {last_id})")
+
+    return updated_count
+
+def _item_rollup_deltas(user_id, material_type, created_at, co2e_grams, weight_grams, item_count=1):
+    """
+    Expand one item's carbon figures into per-period rollup deltas
+
+    Returns:
+        List of (period, period_start, material_type, user_id, measures) tuples
+    """
+    co2e_grams = float(co2e_grams or 0)
+    return _rollup_deltas(user_id, material_type, created_at, {
+        'co2e_grams': co2e_grams,
+        'co2e_saved_grams': max(0.0, -co2e_grams),
+        'weight_grams': float(weight_grams or 0),
+        'item_count': item_count
+    })
+
+def _rollup_deltas(user_id, material_type, created_at, measures):
+    """Expand a measures dictionary into one rollup delta per period"""
+    return [
+        (period, get_period_start(period, created_at), material_type or 'Unknown', user_id, measures)
+        for period in ROLLUP_PERIODS
+    ]
+
+def apply_rollup_deltas(deltas):
+    """
+    Add deltas to the user and city rollup tables with ON CONFLICT upserts
+
+    Deltas for the same rollup key are merged first so each table gets a
+    single multi-row upsert. The caller owns the transaction.
+
+    Args:
+        deltas: Iterable of (period, period_start, material_type, user_id, measures)
+            tuples; user_id may be None for items without an owner
+    """
+    user_totals = defaultdict(lambda: dict.fromkeys(ROLLUP_MEASURES, 0))
+    city_totals = defaultdict(lambda: dict.fromkeys(ROLLUP_MEASURES, 0))
+
+    for period, period_start, material_type, user_id, measures in deltas:
+        targets = [city_totals[(period, period_start, material_type)]]
+        if user_id is not None:
+            targets.append(user_totals[(period, period_start, material_type, user_id)])
+        for totals in targets:
+            for measure in ROLLUP_MEASURES:
+                totals[measure] += measures[measure]
+
+    now = datetime.utcnow()
+    user_rows = [
+        dict(period=key[0], period_start=key[1], material_type=key[2], user_id=key[3], updated_at=now, **totals)
+        for key, totals in user_totals.items()
+    ]
+    city_rows = [
+        dict(period=key[0], period_start=key[1], material_type=key[2], updated_at=now, **totals)
+        for key, totals in city_totals.items()
+    ]
+
+    for model, rows, key_columns in (
+        (CarbonUserRollup, user_rows, ['period', 'period_start', 'material_type', 'user_id']),
+        (CarbonCityRollup, city_rows, ['period', 'period_start', 'material_type']),
+    ):
+        if not rows:
+            continue
+        stmt = dialect_insert(model)
+        set_ = {measure: getattr(model, measure) + getattr(stmt.excluded, measure) for measure in ROLLUP_MEASURES}
+        set_['updated_at'] = stmt.excluded.updated_at
+        db.session.execute(stmt.on_conflict_do_update(index_elements=key_columns, set_=set_), rows)
+
+def record_item_carbon(waste_item: WasteItem):
+    """
+    Add a newly stored waste item to the carbon rollups
+
+    Call after calculate_item_carbon()/apply_carbon_to_item() in the same
+    transaction as the item insert.
+
+    Args:
+        waste_item: WasteItem with carbon columns populated
+    """
+    if waste_item.co2e_grams is None:
+        return
+    apply_rollup_deltas(_item_rollup_deltas(
+        waste_item.user_id,
+        waste_item.material_type or waste_item.material,
+        waste_item.created_at or datetime.utcnow(),
+        waste_item.co2e_grams,
+        waste_item.estimated_weight_grams
+    ))
+
+def item_carbon_change(item, material, is_recyclable):
+    """
+    Carbon columns and rollup deltas for an item whose material or recyclability changed
+
+    The item is recomputed with its own emission factor version, so it stays
+    on that version. The deltas move the item's old figures out of the
+    rollups and its new ones in; the caller applies them with
+    apply_rollup_deltas() in the same transaction as the item update.
+
+    Args:
+        item: Row with id, user_id, created_at, material_type, material,
+            is_recyclable, estimated_weight_grams, co2e_grams and
+            emission_factor_version (the stored values)
+        material: New material
+        is_recyclable: New recyclability
+
+    Returns:
+        Tuple of (column values for the item, rollup deltas), or None if the
+        item has no carbon figures or neither input changed
+    """
+    if item.co2e_grams is None or (material == item.material and is_recyclable == item.is_recyclable):
+        return None
+
+    factor_set = get_emission_factors(item.emission_factor_version)
+    version = item.emission_factor_version
+    if factor_set is None:
+        version, factor_set = get_active_emission_factors()
+
+    weight = float(item.estimated_weight_grams) if item.estimated_weight_grams else DEFAULT_ITEM_WEIGHT_GRAMS
+    carbon_data = calculate_carbon_emissions(
+        item.material_type or material or 'Unknown', weight, get_disposal_method(is_recyclable), factor_set=factor_set
+    )
+    values = {
+        'co2e_grams': carbon_data['co2_emissions_grams'],
+        'disposal_method': carbon_data['disposal_method'],
+        'emission_factor_version': version
+    }
+
+    created_at = item.created_at or datetime.utcnow()
+    old_co2e = float(item.co2e_grams)
+    old_deltas = _rollup_deltas(item.user_id, item.material_type or item.material, created_at, {
+        'co2e_grams': -old_co2e,
+        'co2e_saved_grams': -max(0.0, -old_co2e),
+        'weight_grams': -float(item.estimated_weight_grams or 0),
+        'item_count': -1
+    })
+    new_deltas = _item_rollup_deltas(
+        item.user_id, item.material_type or material, created_at, values['co2e_grams'], item.estimated_weight_grams
+    )
+    return values, old_deltas + new_deltas
+
+def rebuild_carbon_rollups(chunk_size: int = 1000):
+    """
+    Recompute both rollup tables from the stored per-item carbon columns
+
+    Existing rollups are deleted and re-accumulated in primary-key chunks
+    inside a single transaction, so readers never see partial totals.
+
+    Args:
+        chunk_size: Number of waste items per chunk
+
+    Returns:
+        Number of waste items rolled up
+    """
+    try:
+        db.session.query(CarbonUserRollup).delete(synchronize_session=False)
+        db.session.query(CarbonCityRollup).delete(synchronize_session=False)
+
+        item_count = 0
+        last_id = 0
+        while True:
+            rows = db.session.query(
+                WasteItem.id,
+                WasteItem.user_id,
+                WasteItem.material_type,
+                WasteItem.material,
+                WasteItem.created_at,
+                WasteItem.co2e_grams,
+                WasteItem.estimated_weight_grams
+            ).filter(
+                WasteItem.id > last_id,
+                WasteItem.co2e_grams.isnot(None)
+            ).order_by(WasteItem.id).limit(chunk_size).all()
+
+            if not rows:
+                break
+
+            last_id = rows[-1].id
+            deltas = []
+            for row in rows:
+                deltas.extend(_item_rollup_deltas(
+                    row.user_id,
+                    row.material_type or row.material,
+                    row.created_at or datetime.utcnow(),
+                    row.co2e_grams,
+                    row.estimated_weight_grams
+                ))
+            apply_rollup_deltas(deltas)
+            item_count += len(rows)
+
+        db.session.commit()
+        return item_count
+    except Exception:
+        db.session.rollback()
+        raise
+
+def get_carbon_summary(period='month', start=None, end=None, group_by=('period',), user_id=None):
+    """
+    Read aggregated carbon figures from the rollup tables
+
+    Args:
+        period: Rollup granularity ('day', 'week' or 'month')
+        start: Optional inclusive date lower bound on period_start
+        end: Optional inclusive date upper bound on period_start
+        group_by: Any of 'period' and 'material'; empty for a single total
+        user_id: Read the user's rollup instead of the city-wide one
+
+    Returns:
+        List of dictionaries, one per group
+    """
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"Unknown period: {period}")
+
+    model = CarbonUserRollup if user_id is not None else CarbonCityRollup
+    group_columns = []
+    if 'period' in group_by:
+        group_columns.append(model.period_start)
+    if 'material' in group_by:
+        group_columns.append(model.material_type)
+
+    query = db.session.query(
+        *group_columns,
+        *[func.coalesce(func.sum(getattr(model, measure)), 0).label(measure) for measure in ROLLUP_MEASURES]
+    ).filter(model.period == period)
+
+    if user_id is not None:
+        query = query.filter(model.user_id == user_id)
+    if start is not None:
+        query = query.filter(model.period_start >= start)
+    if end is not None:
+        query = query.filter(model.period_start <= end)
+    if group_columns:
+        query = query.group_by(*group_columns).order_by(*group_columns)
+
+    summary = []
+    for row in query.all():
+        entry = {}
+        if 'period' in group_by:
+            entry['period_start'] = row.period_start.isoformat()
+        if 'material' in group_by:
+            entry['material_type'] = row.material_type
+        entry.update({
+            'co2e_grams': float(row.co2e_grams),
+            'co2e_saved_grams': float(row.co2e_saved_grams),
+            'weight_grams': float(row.weight_grams),
+            'item_count': int(row.item_count)
+        })
+        summary.append(entry)
+    return summary
+
+def get_item_material_key():
+    """SQL expression for the material an item's carbon figures are keyed on"""
+    return func.coalesce(
+        func.nullif(WasteItem.material_type, ''),
+        func.nullif(WasteItem.material, ''),
+        'Unknown'
+    )
+
+def _changed_factor_conditions(material_key, old_factors, new_factors):
+    """
+    Build filters matching only items whose factor differs between two sets
+
+    Materials missing from a set fall back to its 'Unknown' factors, the same
+    way calculate_carbon_emissions() resolves them.
+
+    Returns:
+        List of SQL conditions to OR together (empty if nothing changed)
+    """
+    def factor(factor_set, material_type, method):
+        return factor_set.get(material_type, factor_set['Unknown'])[method]
+
+    conditions = []
+    known_materials = sorted(set(old_factors) | set(new_factors))
+    for material_type in known_materials:
+        changed_methods = [
+            method for method in DISPOSAL_METHODS
+            if factor(old_factors, material_type, method) != factor(new_factors, material_type, method)
+        ]
+        if changed_methods:
+            conditions.append(and_(
+                material_key == material_type,
+                WasteItem.disposal_method.in_(changed_methods)
+            ))
+
+    changed_fallback = [
+        method for method in DISPOSAL_METHODS
+        if old_factors['Unknown'][method] != new_factors['Unknown'][method]
+    ]
+    if changed_fallback:
+        conditions.append(and_(
+            material_key.notin_(known_materials),
+            WasteItem.disposal_method.in_(changed_fallback)
+        ))
+    return conditions
+
+def recompute_item_carbon(to_version: int = None, chunk_size: int = 5000):
+    """
+    Move stored item emissions and rollups onto another emission factor version
+
+    Only items whose (material, disposal method) factor actually changed are
+    read back. Each chunk is recomputed as one NumPy array operation, written
+    with a bulk UPDATE, and its rollup deltas are applied in the same commit.
+    Unaffected items are then relabelled with a single UPDATE.
+
+    Per-version totals are snapshotted before items leave a version and after
+    they arrive, so both sides stay queryable via get_version_totals(). The
+    departing snapshot is taken fresh for every move, unless an earlier move
+    away from the same version was interrupted; its snapshot still covers the
+    items that already left.
+
+    Args:
+        to_version: Target factor version (defaults to the active version)
+        chunk_size: Number of affected items per chunk
+
+    Returns:
+        Number of waste items whose CO2e changed
+    """
+    to_version = to_version or get_active_factor_version()
+    new_factors = get_emission_factors(to_version)
+    if new_factors is None:
+        raise ValueError(f"Emission factor version {to_version} does not exist")
+
+    materials = sorted(new_factors)
+    material_index = {material_type: i for i, material_type in enumerate(materials)}
+    method_index = {method: i for i, method in enumerate(DISPOSAL_METHODS)}
+    unknown_index = material_index['Unknown']
+    landfill_index = method_index['landfill']
+    factor_matrix = np.array([
+        [float(new_factors[material_type][method]) for method in DISPOSAL_METHODS]
+        for material_type in materials
+    ])
+
+    material_key = get_item_material_key()
+    from_versions = [
+        version for (version,) in db.session.query(WasteItem.emission_factor_version).filter(
+            WasteItem.emission_factor_version != to_version,
+            WasteItem.co2e_grams.isnot(None)
+        ).distinct().all()
+    ]
+
+    updated_count = 0
+    for from_version in from_versions:
+        departing = EmissionFactorVersionTotal.query.filter_by(
+            version=from_version, snapshot_kind=SNAPSHOT_DEPARTING
+        ).first()
+        if departing is None:
+            snapshot_version_totals(from_version, kind=SNAPSHOT_DEPARTING)
+
+        old_factors = get_emission_factors(from_version)
+        if old_factors is None:
+            logging.warning(f"Emission factor version {from_version} is not stored; recomputing all of its items")
+            affected = None
+        else:
+            conditions = _changed_factor_conditions(material_key, old_factors, new_factors)
+            affected = or_(*conditions) if conditions else None
+
+        if old_factors is None or affected is not None:
+            last_id = 0
+            while True:
+                query = db.session.query(
+                    WasteItem.id,
+                    WasteItem.user_id,
+                    WasteItem.material_type,
+                    WasteItem.material,
+                    WasteItem.created_at,
+                    WasteItem.disposal_method,
+                    WasteItem.estimated_weight_grams,
+                    WasteItem.co2e_grams
+                ).filter(
+                    WasteItem.id > last_id,
+                    WasteItem.emission_factor_version == from_version,
+                    WasteItem.co2e_grams.isnot(None)
+                )
+                if affected is not None:
+                    query = query.filter(affected)
+
+                rows = query.order_by(WasteItem.id).limit(chunk_size).all()
+                if not rows:
+                    break
+
+                last_id = rows[-1].id
+                count = len(rows)
+                material_keys = [row.material_type or row.material or 'Unknown' for row in rows]
+
+                material_idx = np.fromiter(
+                    (material_index.get(key, unknown_index) for key in material_keys), dtype=np.intp, count=count
+                )
+                method_idx = np.fromiter(
+                    (method_index.get(row.disposal_method, landfill_index) for row in rows), dtype=np.intp, count=count
+                )
+                weights = np.fromiter(
+                    (float(row.estimated_weight_grams) if row.estimated_weight_grams else DEFAULT_ITEM_WEIGHT_GRAMS for row in rows),
+                    dtype=np.float64, count=count
+                )
+                old_co2e = np.fromiter((float(row.co2e_grams) for row in rows), dtype=np.float64, count=count)
+
+                # kg CO2e/kg x grams = grams CO2e
+                new_co2e = np.round(factor_matrix[material_idx, method_idx] * weights, 2)
+                co2e_delta = new_co2e - old_co2e
+                saved_delta = np.maximum(0.0, -new_co2e) - np.maximum(0.0, -old_co2e)
+
+                item_updates = [
+                    {'id': row.id, 'co2e_grams': float(co2e), 'emission_factor_version': to_version}
+                    for row, co2e in zip(rows, new_co2e)
+                ]
+                db.session.execute(update(WasteItem), item_updates)
+
+                deltas = []
+                for i in np.flatnonzero(co2e_delta):
+                    row = rows[i]
+                    deltas.extend(_rollup_deltas(
+                        row.user_id,
+                        material_keys[i],
+                        row.created_at or datetime.utcnow(),
+                        {
+                            'co2e_grams': float(co2e_delta[i]),
+                            'co2e_saved_grams': float(saved_delta[i]),
+                            'weight_grams': 0,
+                            'item_count': 0
+                        }
+                    ))
+                apply_rollup_deltas(deltas)
+                db.session.commit()
+
+                updated_count += int(np.count_nonzero(co2e_delta))
+                logging.info(f"Recomputed carbon v{from_version}->v{to_version} through waste item {last_id}")
+
+        # Items whose factors did not change keep their figures
+        db.session.query(WasteItem).filter(
+            WasteItem.emission_factor_version == from_version
+        ).update({'emission_factor_version': to_version}, synchronize_session=False)
+        EmissionFactorVersionTotal.query.filter_by(
+            version=from_version
+        ).update({'snapshot_kind': SNAPSHOT_DEPARTED}, synchronize_session=False)
+        db.session.commit()
+
+    snapshot_version_totals(to_version)
+    return updated_count
+
+def snapshot_version_totals(version: int, kind: str = SNAPSHOT_CURRENT):
+    """
+    Store per-material carbon totals of the items currently on a factor version
+
+    Any earlier snapshot of the version is replaced.
+
+    Args:
+        version: Factor version to snapshot
+        kind: SNAPSHOT_CURRENT, or SNAPSHOT_DEPARTING when items are about to leave
+
+    Returns:
+        Number of material rows written
+    """
+    material_key = get_item_material_key()
+    saved = func.sum(case((WasteItem.co2e_grams < 0, -WasteItem.co2e_grams), else_=0))
+    rows = db.session.query(
+        material_key.label('material_type'),
+        func.coalesce(func.sum(WasteItem.co2e_grams), 0).label('co2e_grams'),
+        func.coalesce(saved, 0).label('co2e_saved_grams'),
+        func.coalesce(func.sum(WasteItem.estimated_weight_grams), 0).label('weight_grams'),
+        func.count(WasteItem.id).label('item_count')
+    ).filter(
+        WasteItem.emission_factor_version == version,
+        WasteItem.co2e_grams.isnot(None)
+    ).group_by(material_key).all()
+
+    try:
+        EmissionFactorVersionTotal.query.filter_by(version=version).delete(synchronize_session=False)
+        now = datetime.utcnow()
+        for row in rows:
+            db.session.add(EmissionFactorVersionTotal(
+                version=version,
+                material_type=row.material_type,
+                co2e_grams=row.co2e_grams,
+                co2e_saved_grams=row.co2e_saved_grams,
+                weight_grams=row.weight_grams,
+                item_count=row.item_count,
+                snapshot_kind=kind,
+                computed_at=now
+            ))
+        db.session.commit()
+        return len(rows)
+    except Exception as e:
+        logging.error(f"Error snapshotting carbon totals for v{version}: {e}")
+        db.session.rollback()
+        raise
+
+def get_version_totals(version: int = None):
+    """
+    Read audited per-version carbon totals
+
+    Args:
+        version: Optional factor version filter
+
+    Returns:
+        List of dictionaries ordered by version and material
+    """
+    query = EmissionFactorVersionTotal.query
+    if version is not None:
+        query = query.filter_by(version=version)
+
+    return [
+        {
+            'version': total.version,
+            'material_type': total.material_type,
+            'co2e_grams': float(total.co2e_grams),
+            'co2e_saved_grams': float(total.co2e_saved_grams),
+            'weight_grams': float(total.weight_grams),
+            'item_count': total.item_count,
+            'snapshot_kind': total.snapshot_kind or SNAPSHOT_CURRENT,
+            'computed_at': total.computed_at.isoformat() if total.computed_at else None
+        }
+        for total in query.order_by(EmissionFactorVersionTotal.version, EmissionFactorVersionTotal.material_type).all()
+    ]
+
+def main():
+    """Run carbon maintenance tasks from the command line"""
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Carbon emission maintenance tasks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backfill_parser = subparsers.add_parser('backfill', help='Fill carbon columns on existing waste items')
+    backfill_parser.add_argument('--chunk-size', type=int, default=1000)
+
+    rebuild_parser = subparsers.add_parser('rebuild-rollups', help='Recompute carbon rollup tables from waste items')
+    rebuild_parser.add_argument('--chunk-size', type=int, default=1000)
+
+    recompute_parser = subparsers.add_parser('recompute', help='Move items onto another emission factor version')
+    recompute_parser.add_argument('--to-version', type=int, default=None, help='Target version (default: active)')
+    recompute_parser.add_argument('--chunk-size', type=int, default=5000)
+
+    totals_parser = subparsers.add_parser('version-totals', help='Show audited per-version carbon totals')
+    totals_parser.add_argument('--version', type=int, default=None)
+    totals_parser.add_argument('--refresh', action='store_true', help='Re-snapshot the version from current items first')
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.command == 'backfill':
+                count = backfill_item_carbon(chunk_size=args.chunk_size)
+                logging.info(f"Carbon backfill complete: {count} waste items updated")
+            elif args.command == 'rebuild-rollups':
+                count = rebuild_carbon_rollups(chunk_size=args.chunk_size)
+                logging.info(f"Carbon rollup rebuild complete: {count} waste items rolled up")
+            elif args.command == 'recompute':
+                count = recompute_item_carbon(to_version=args.to_version, chunk_size=args.chunk_size)
+                logging.info(f"Carbon recompute complete: {count} waste items changed")
+            elif args.command == 'version-totals':
+                if args.refresh and args.version is not None:
+                    if EmissionFactorVersionTotal.query.filter_by(
+                        version=args.version, snapshot_kind=SNAPSHOT_DEPARTING
+                    ).first():
+                        logging.warning(f"A recompute away from v{args.version} is unfinished; keeping its snapshot")
+                    else:
+                        snapshot_version_totals(args.version)
+                print(json.dumps(get_version_totals(args.version), indent=2))
+        except Exception as e:
+            logging.error(f"Carbon maintenance failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
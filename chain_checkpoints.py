@@ -0,0 +1,162 @@
+"""
+Chain Verification Checkpoints
+Remembers how far each hash chain has been verified so page views only
+re-hash blocks appended since.
+
+Two kinds of chain are tracked:
+    journey - a waste item's WasteJourneyBlock chain (key: waste item ID)
+    project - a project's ProjectLedger chain (key: project ID)
+
+A checkpoint stores the ID and hash of the last verified block. Verifiers
+trust everything up to it as long as that block still carries the stored
+hash, and move the checkpoint forward after verifying new blocks. The
+'audit_chains' scheduler job re-verifies whole chains; a chain that fails
+loses its checkpoint, so every later view verifies it in full (and fails).
+
+Usage:
+    python chain_checkpoints.py audit
+    python chain_checkpoints.py show
+"""
+
+import argparse
+import logging
+import sys
+from datetime import datetime
+from app import db
+from models import ChainCheckpoint
+from db_helpers import dialect_insert
+
+JOURNEY_CHAIN = 'journey'
+PROJECT_CHAIN = 'project'
+
+def get_checkpoint(chain_type: str, chain_key):
+    """
+    Get a chain's checkpoint
+
+    Args:
+        chain_type: JOURNEY_CHAIN or PROJECT_CHAIN
+        chain_key: Waste item ID or project ID
+
+    Returns:
+        ChainCheckpoint, or None if the chain has no verified prefix
+    """
+    checkpoint = ChainCheckpoint.query.filter_by(chain_type=chain_type, chain_key=str(chain_key)).first()
+    if checkpoint is None or checkpoint.block_id is None:
+        return None
+    return checkpoint
+
+def save_checkpoint(chain_type: str, chain_key, block_id: int, block_hash: str, block_count: int):
+    """
+    Record that a chain is verified up to a block
+
+    Written in its own transaction, so the caller's session is neither
+    committed nor expired. A failed write is logged and ignored; the chain
+    is verified again next time.
+
+    Args:
+        chain_type: JOURNEY_CHAIN or PROJECT_CHAIN
+        chain_key: Waste item ID or project ID
+        block_id: Last verified block ID
+        block_hash: Its hash
+        block_count: Blocks in the chain up to and including it
+    """
+    table = ChainCheckpoint.__table__
+    stmt = dialect_insert(table)
+    now = datetime.utcnow()
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(stmt.values(
+                chain_type=chain_type,
+                chain_key=str(chain_key),
+                block_id=block_id,
+                block_hash=block_hash,
+                block_count=block_count,
+                verified_at=now
+            ).on_conflict_do_update(
+                index_elements=['chain_type', 'chain_key'],
+                set_={
+                    'block_id': stmt.excluded.block_id,
+                    'block_hash': stmt.excluded.block_hash,
+                    'block_count': stmt.excluded.block_count,
+                    'verified_at': stmt.excluded.verified_at
+                }
+            ))
+    except Exception as e:
+        logging.error(f"Error saving {chain_type} checkpoint for {chain_key}: {e}")
+
+def _verify_full_chain(checkpoint: ChainCheckpoint) -> bool:
+    """Re-verify a checkpointed chain from its first block"""
+    if checkpoint.chain_type == JOURNEY_CHAIN:
+        from blockchain_service import verify_journey_integrity
+        return verify_journey_integrity(int(checkpoint.chain_key), full=True)
+
+    from blockchain_tracker import verify_project_chain
+    return verify_project_chain(checkpoint.chain_key, full=True)
+
+def audit_chain_checkpoints(after_id: int = 0, limit: int = 100):
+    """
+    Fully re-verify checkpointed chains (the 'audit_chains' scheduler job)
+
+    Args:
+        after_id: Only checkpoints with a higher ID are audited
+        limit: Maximum number of chains audited
+
+    Returns:
+        Tuple of (chains audited, ID of the last checkpoint audited or None)
+    """
+    checkpoints = ChainCheckpoint.query.filter(
+        ChainCheckpoint.id > after_id
+    ).order_by(ChainCheckpoint.id).limit(limit).all()
+
+    for checkpoint in checkpoints:
+        valid = _verify_full_chain(checkpoint)
+        checkpoint.last_audit_at = datetime.utcnow()
+        checkpoint.audit_valid = valid
+        if not valid:
+            logging.error(f"Chain audit failed for {checkpoint.chain_type} {checkpoint.chain_key}")
+            checkpoint.block_id = None
+            checkpoint.block_hash = None
+            checkpoint.block_count = 0
+
+    try:
+        db.session.commit()
+    except Exception as e:
+        logging.error(f"Error recording chain audits: {e}")
+        db.session.rollback()
+        raise
+
+    return len(checkpoints), (checkpoints[-1].id if checkpoints else None)
+
+def main():
+    """Audit or list chain checkpoints from the command line"""
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Chain verification checkpoints")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('audit', help='Fully re-verify every checkpointed chain')
+    subparsers.add_parser('show', help='List checkpoints')
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.command == 'audit':
+                audited, cursor = audit_chain_checkpoints()
+                total = audited
+                while cursor is not None:
+                    audited, cursor = audit_chain_checkpoints(cursor)
+                    total += audited
+                failed = ChainCheckpoint.query.filter_by(audit_valid=False).count()
+                logging.info(f"Audited {total} chains, {failed} failed")
+                if failed:
+                    sys.exit(1)
+            elif args.command == 'show':
+                for checkpoint in ChainCheckpoint.query.order_by(ChainCheckpoint.chain_type, ChainCheckpoint.chain_key).all():
+                    print(f"{checkpoint.chain_type}\t{checkpoint.chain_key}\tblock {checkpoint.block_id or '-'}\t"
+                          f"{checkpoint.block_count} blocks\taudit {checkpoint.last_audit_at or '-'} {checkpoint.audit_valid}")
+        except Exception as e:
+            logging.error(f"Checkpoint command failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Footprint Dashboard Snapshots
+Precomputes each user's footprint dashboard into one row so page views are a
+single key lookup. Every scan write bumps the row's generation in the same
+transaction; the next read rebuilds it. A rebuild is only stored if no write
+happened while it was being built, so a slow reader can never cache stale data.
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime
+from sqlalchemy import update
+from app import db
+from models import User, PlasticFootprintScan, FootprintDashboardSnapshot
+from db_helpers import dialect_insert
+from footprint_updater import get_footprint_history, get_week_start
+
+# How much history a snapshot holds
+SNAPSHOT_WEEKS = 12
+SNAPSHOT_MONTHS = 12
+RECENT_SCAN_LIMIT = 10
+
+# Per-process hit/miss counters (each gunicorn worker reports its own)
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+def _record(outcome):
+    """Increment a hit/miss counter"""
+    with _stats_lock:
+        _stats[outcome] += 1
+
+def get_snapshot_cache_stats():
+    """
+    Get this process's snapshot hit ratio
+
+    Returns:
+        Dictionary with hits, misses, hit_ratio and the worker pid
+    """
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'pid': os.getpid(),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None
+    }
+
+def _history_json(history):
+    """Serialise get_footprint_history() rows"""
+    return [dict(h, period_start=h['period_start'].isoformat()) for h in history]
+
+def build_dashboard_snapshot(user_id: int):
+    """
+    Compute a user's dashboard data from the rollups and recent scans
+
+    Args:
+        user_id: User ID
+
+    Returns:
+        JSON-serialisable dictionary
+    """
+    user = db.session.query(User.lifetime_weight_grams, User.badge_level).filter(User.id == user_id).first()
+
+    recent_scans = db.session.query(
+        PlasticFootprintScan.id,
+        PlasticFootprintScan.material_type,
+        PlasticFootprintScan.estimated_weight_grams,
+        PlasticFootprintScan.ml_confidence_score,
+        PlasticFootprintScan.manual_override,
+        PlasticFootprintScan.timestamp
+    ).filter(
+        PlasticFootprintScan.user_id == user_id
+    ).order_by(PlasticFootprintScan.timestamp.desc()).limit(RECENT_SCAN_LIMIT).all()
+
+    return {
+        'lifetime_weight_grams': float(user.lifetime_weight_grams or 0) if user else 0.0,
+        'badge_level': (user.badge_level if user else None) or 'Bronze',
+        'weekly_history': _history_json(get_footprint_history(user_id, 'week', limit=SNAPSHOT_WEEKS)),
+        'monthly_history': _history_json(get_footprint_history(user_id, 'month', limit=SNAPSHOT_MONTHS)),
+        'recent_scans': [
+            {
+                'id': scan.id,
+                'material_type': scan.material_type,
+                'estimated_weight_grams': float(scan.estimated_weight_grams),
+                'ml_confidence_score': float(scan.ml_confidence_score) if scan.ml_confidence_score is not None else None,
+                'manual_override': bool(scan.manual_override),
+                'timestamp': scan.timestamp.isoformat() if scan.timestamp else None
+            }
+            for scan in recent_scans
+        ]
+    }
+
+def _decode_snapshot(payload, today):
+    """Turn a stored payload back into dates/datetimes and add the current periods"""
+    for key in ('weekly_history', 'monthly_history'):
+        for entry in payload[key]:
+            entry['period_start'] = date.fromisoformat(entry['period_start'])
+    for scan in payload['recent_scans']:
+        scan['timestamp'] = datetime.fromisoformat(scan['timestamp']) if scan['timestamp'] else None
+
+    weekly, monthly = payload['weekly_history'], payload['monthly_history']
+    payload['current_weekly'] = weekly[0] if weekly and weekly[0]['period_start'] == get_week_start(today) else None
+    payload['current_monthly'] = monthly[0] if monthly and monthly[0]['period_start'] == today.replace(day=1) else None
+    return payload
+
+def get_dashboard_snapshot(user_id: int):
+    """
+    Get a user's dashboard data, rebuilding the snapshot only if it was invalidated
+
+    Snapshots are also rebuilt on the first read of a new day, since the
+    current week/month depend on the date.
+
+    Args:
+        user_id: User ID
+
+    Returns:
+        Dictionary with lifetime_weight_grams, badge_level, weekly_history,
+        monthly_history (newest first), recent_scans, current_weekly and
+        current_monthly
+    """
+    today = date.today()
+    row = db.session.query(
+        FootprintDashboardSnapshot.generation,
+        FootprintDashboardSnapshot._payload,
+        FootprintDashboardSnapshot.built_for
+    ).filter(FootprintDashboardSnapshot.user_id == user_id).first()
+
+    if row and row._payload and row.built_for == today:
+        _record('hits')
+        return _decode_snapshot(json.loads(row._payload), today)
+
+    _record('misses')
+    payload = build_dashboard_snapshot(user_id)
+
+    try:
+        values = {'payload': json.dumps(payload), 'built_for': today, 'built_at': datetime.utcnow()}
+        if row is None:
+            db.session.execute(
+                dialect_insert(FootprintDashboardSnapshot.__table__)
+                .values(user_id=user_id, generation=0, **values)
+                .on_conflict_do_nothing(index_elements=['user_id'])
+            )
+        else:
+            # Only store if no scan was written since the generation was read
+            db.session.execute(
+                update(FootprintDashboardSnapshot.__table__)
+                .where(
+                    FootprintDashboardSnapshot.user_id == user_id,
+                    FootprintDashboardSnapshot.generation == row.generation
+                )
+                .values(**values)
+            )
+        db.session.commit()
+    except Exception as e:
+        logging.error(f"Error storing dashboard snapshot for user {user_id}: {e}")
+        db.session.rollback()
+
+    return _decode_snapshot(payload, today)
+
+def invalidate_dashboard_snapshots(user_ids):
+    """
+    Mark users' snapshots as out of date
+
+    Call in the same transaction as the scan/footprint write; nothing is
+    committed here.
+
+    Args:
+        user_ids: Iterable of user IDs
+    """
+    rows = [{'user_id': user_id, 'generation': 1} for user_id in set(user_ids)]
+    if not rows:
+        return
+
+    table = FootprintDashboardSnapshot.__table__
+    stmt = dialect_insert(table)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={'generation': table.c.generation + 1, 'payload': None, 'built_for': None}
+    ), rows)
+
+def invalidate_dashboard_snapshot(user_id: int):
+    """Mark one user's snapshot as out of date (see invalidate_dashboard_snapshots)"""
+    invalidate_dashboard_snapshots([user_id])
+
+def invalidate_all_dashboard_snapshots():
+    """Mark every existing snapshot as out of date (after bulk rebuilds); no commit"""
+    db.session.execute(
+        update(FootprintDashboardSnapshot.__table__).values(
+            generation=FootprintDashboardSnapshot.generation + 1, payload=None, built_for=None
+        )
+    )
@@ -0,0 +1,318 @@
+"""
+Personal Data Export
+Streams a user's waste items, footprint scans, rewards, batch contributions
+and the ledger entries for those batches as NDJSON or CSV.
+
+Every section is a plain column SELECT executed with yield_per, so rows are
+fetched in fixed-size batches (server-side cursors on PostgreSQL) and
+encoded one at a time. Output can be gzip-compressed on the fly. Memory use
+does not depend on how many records a user has.
+
+Usage:
+    python data_export.py --user-id 42 [--format ndjson|csv] [--section scans] [--output export.ndjson.gz]
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import sys
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import select
+from app import db
+from models import (
+    WasteItem, PlasticFootprintScan, Reward, ProjectContributor, WasteBatch,
+    InfrastructureProject, ProjectLedger
+)
+
+EXPORT_FORMAT_VERSION = 1
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+# Rows fetched from the database per round trip
+EXPORT_BATCH_SIZE = 1000
+
+# Output is emitted in chunks of roughly this size
+OUTPUT_CHUNK_BYTES = 64 * 1024
+
+def _waste_items_query(user_id):
+    return select(
+        WasteItem.id,
+        WasteItem.created_at,
+        WasteItem.material,
+        WasteItem.material_type,
+        WasteItem.is_recyclable,
+        WasteItem.is_ewaste,
+        WasteItem.estimated_weight_grams,
+        WasteItem.disposal_method,
+        WasteItem.co2e_grams,
+        WasteItem.emission_factor_version,
+        WasteItem.summary,
+        WasteItem.is_listed,
+        WasteItem.is_dropped_off,
+        WasteItem.drop_location_id,
+        WasteItem.drop_date,
+        WasteItem.recycling_completed,
+        WasteItem.recycling_completion_date
+    ).where(WasteItem.user_id == user_id).order_by(WasteItem.id)
+
+def _scans_query(user_id):
+    return select(
+        PlasticFootprintScan.id,
+        PlasticFootprintScan.timestamp,
+        PlasticFootprintScan.waste_item_id,
+        PlasticFootprintScan.material_type,
+        PlasticFootprintScan.estimated_weight_grams,
+        PlasticFootprintScan.ml_confidence_score,
+        PlasticFootprintScan.manual_override
+    ).where(PlasticFootprintScan.user_id == user_id).order_by(PlasticFootprintScan.timestamp, PlasticFootprintScan.id)
+
+def _rewards_query(user_id):
+    return select(
+        Reward.id,
+        Reward.created_at,
+        Reward.points,
+        Reward.reward_type,
+        Reward.description
+    ).where(Reward.user_id == user_id).order_by(Reward.id)
+
+def _contributions_query(user_id):
+    return select(
+        ProjectContributor.id,
+        ProjectContributor.contribution_date,
+        ProjectContributor.contribution_weight_grams,
+        ProjectContributor.is_top_contributor,
+        WasteBatch.batch_id,
+        WasteBatch.material_type,
+        WasteBatch.status.label('batch_status'),
+        InfrastructureProject.project_id,
+        InfrastructureProject.project_name,
+        InfrastructureProject.status.label('project_status')
+    ).join(
+        WasteBatch, WasteBatch.id == ProjectContributor.batch_id
+    ).outerjoin(
+        InfrastructureProject, InfrastructureProject.id == WasteBatch.linked_project_id
+    ).where(ProjectContributor.user_id == user_id).order_by(ProjectContributor.id)
+
+def _ledger_query(user_id):
+    contributed_batches = select(WasteBatch.batch_id).join(
+        ProjectContributor, ProjectContributor.batch_id == WasteBatch.id
+    ).where(ProjectContributor.user_id == user_id)
+
+    return select(
+        ProjectLedger.id,
+        ProjectLedger.timestamp,
+        ProjectLedger.project_id,
+        ProjectLedger.batch_reference,
+        ProjectLedger.status,
+        ProjectLedger.verified_by,
+        ProjectLedger.previous_hash,
+        ProjectLedger.block_hash
+    ).where(ProjectLedger.batch_reference.in_(contributed_batches)).order_by(ProjectLedger.id)
+
+# Section name -> query builder taking a user ID
+EXPORT_SECTIONS = {
+    'waste_items': _waste_items_query,
+    'scans': _scans_query,
+    'rewards': _rewards_query,
+    'contributions': _contributions_query,
+    'ledger': _ledger_query,
+}
+
+def _plain(value):
+    """Convert a column value to a JSON/CSV-friendly one"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def iter_section_rows(section: str, user_id: int, batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Yield (column names, row) pairs for one export section, batch_size rows at a time
+
+    Args:
+        section: Name from EXPORT_SECTIONS
+        user_id: User whose records are exported
+        batch_size: Rows fetched per round trip
+
+    Yields:
+        Tuple of (column names, row values)
+    """
+    result = db.session.execute(EXPORT_SECTIONS[section](user_id).execution_options(yield_per=batch_size))
+    columns = tuple(result.keys())
+    for row in result:
+        yield columns, tuple(_plain(value) for value in row)
+
+def iter_ndjson(user_id: int, sections=None):
+    """
+    Yield an NDJSON export: a header line, then one line per record
+
+    Every record line has a "section" key naming where it came from.
+
+    Args:
+        user_id: User whose records are exported
+        sections: Section names (default: all)
+
+    Yields:
+        Encoded lines (bytes)
+    """
+    sections = list(sections or EXPORT_SECTIONS)
+    header = {
+        'section': 'export',
+        'format_version': EXPORT_FORMAT_VERSION,
+        'user_id': user_id,
+        'sections': sections,
+        'generated_at': datetime.utcnow().isoformat()
+    }
+    yield (json.dumps(header) + '\n').encode('utf-8')
+
+    for section in sections:
+        for columns, row in iter_section_rows(section, user_id):
+            record = {'section': section}
+            record.update(zip(columns, row))
+            yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+def iter_csv(user_id: int, section: str):
+    """
+    Yield a CSV export of one section, with a header row
+
+    Args:
+        user_id: User whose records are exported
+        section: Name from EXPORT_SECTIONS
+
+    Yields:
+        Encoded lines (bytes)
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+
+    def take():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    for columns, row in iter_section_rows(section, user_id):
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerow(row)
+        yield take()
+
+    if not header_written:
+        # No records: still emit the column names
+        result = db.session.execute(EXPORT_SECTIONS[section](user_id).limit(0))
+        writer.writerow(result.keys())
+        yield take()
+
+def _coalesce(chunks, chunk_bytes: int = OUTPUT_CHUNK_BYTES):
+    """Join small byte strings into chunks of roughly chunk_bytes"""
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= chunk_bytes:
+            yield b''.join(pending)
+            pending, pending_size = [], 0
+    if pending:
+        yield b''.join(pending)
+
+def gzip_stream(chunks, chunk_bytes: int = OUTPUT_CHUNK_BYTES):
+    """
+    Gzip-compress a stream of byte strings on the fly
+
+    Args:
+        chunks: Iterable of bytes
+        chunk_bytes: Approximate size of each compressed chunk emitted
+
+    Yields:
+        Compressed bytes forming one gzip member
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            pending.append(compressed)
+            pending_size += len(compressed)
+            if pending_size >= chunk_bytes:
+                yield b''.join(pending)
+                pending, pending_size = [], 0
+    pending.append(compressor.flush())
+    yield b''.join(pending)
+
+def build_export_stream(user_id: int, export_format: str = 'ndjson', sections=None, compress: bool = True):
+    """
+    Build a streaming export for a user
+
+    Args:
+        user_id: User whose records are exported
+        export_format: 'ndjson' (any sections) or 'csv' (exactly one section)
+        sections: Section names (default: all; required for CSV)
+        compress: Gzip the output
+
+    Returns:
+        Tuple of (generator of bytes, mimetype, file name)
+
+    Raises:
+        ValueError: If the format or sections are invalid
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    sections = list(sections or [])
+    unknown = [s for s in sections if s not in EXPORT_SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown section(s): {', '.join(unknown)}. Available: {', '.join(EXPORT_SECTIONS)}")
+
+    stamp = date.today().isoformat()
+    if export_format == 'csv':
+        if len(sections) != 1:
+            raise ValueError("CSV exports take exactly one section")
+        chunks = iter_csv(user_id, sections[0])
+        mimetype = 'text/csv'
+        filename = f"regenworks-{sections[0]}-{user_id}-{stamp}.csv"
+    else:
+        chunks = iter_ndjson(user_id, sections or None)
+        mimetype = 'application/x-ndjson'
+        filename = f"regenworks-export-{user_id}-{stamp}.ndjson"
+
+    if compress:
+        return gzip_stream(chunks), mimetype, filename
+    return _coalesce(chunks), mimetype, filename
+
+def main():
+    """Write a user's export to a file or stdout (for auditors and support)"""
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Export a user's data as NDJSON or CSV")
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+    parser.add_argument('--section', action='append', choices=sorted(EXPORT_SECTIONS), default=None,
+                        help='Section to export (repeatable; default: all for NDJSON)')
+    parser.add_argument('--output', default=None, help='Output file (gzip if it ends in .gz; default: stdout)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            compress = bool(args.output and args.output.endswith('.gz'))
+            chunks, _, _ = build_export_stream(args.user_id, args.format, args.section, compress)
+            out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+            try:
+                for chunk in chunks:
+                    out.write(chunk)
+            finally:
+                if args.output:
+                    out.close()
+        except Exception as e:
+            logging.error(f"Export failed: {e}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
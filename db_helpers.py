@@ -0,0 +1,74 @@
+"""
+Database helpers shared by the rollup and upsert code paths
+Works with both SQLite and PostgreSQL
+"""
+
+from sqlalchemy import Date, cast, func
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+
+def is_postgres():
+    """Check if the active database is PostgreSQL"""
+    return db.engine.dialect.name == 'postgresql'
+
+def dialect_insert(model):
+    """
+    Build an INSERT for the active dialect that supports ON CONFLICT clauses
+
+    Both PostgreSQL and SQLite (3.24+) accept
+    `INSERT ... ON CONFLICT (...) DO UPDATE`, but SQLAlchemy exposes it
+    through dialect-specific insert() constructs.
+
+    Args:
+        model: Model class or Table to insert into
+
+    Returns:
+        Dialect-specific Insert construct
+    """
+    if is_postgres():
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def week_start_expression(column):
+    """
+    SQL expression for the Monday of the week containing a timestamp column
+
+    Matches footprint_updater.get_week_start(). PostgreSQL's date_trunc('week')
+    is ISO (Monday-based); SQLite moves to the next Sunday and back six days.
+
+    Args:
+        column: Timestamp column or expression
+
+    Returns:
+        SQL expression yielding a date (a 'YYYY-MM-DD' string on SQLite)
+    """
+    if is_postgres():
+        return cast(func.date_trunc('week', column), Date)
+    return func.date(column, 'weekday 0', '-6 days')
+
+def period_start_expression(period, column):
+    """
+    SQL expression truncating a timestamp column to a day, week or month
+
+    Matches footprint_updater.get_period_start().
+
+    Args:
+        period: 'day', 'week' or 'month'
+        column: Timestamp column or expression
+
+    Returns:
+        SQL expression yielding a date (a 'YYYY-MM-DD' string on SQLite)
+    """
+    if period == 'week':
+        return week_start_expression(column)
+    if is_postgres():
+        if period == 'day':
+            return cast(column, Date)
+        if period == 'month':
+            return cast(func.date_trunc('month', column), Date)
+    else:
+        if period == 'day':
+            return func.date(column)
+        if period == 'month':
+            return func.date(column, 'start of month')
+    raise ValueError(f"Unknown period: {period}")
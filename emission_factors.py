@@ -0,0 +1,236 @@
+"""
+Versioned Carbon Emission Factors
+Factor sets are stored as immutable, versioned database rows and cached
+in memory per process. Exactly one set is active for new items.
+
+Usage:
+    python emission_factors.py seed
+    python emission_factors.py create --version 2 --file factors.json [--description "..."] [--source "..."]
+    python emission_factors.py activate --version 2
+    python emission_factors.py list
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime
+from app import db
+from models import EmissionFactorSet, EmissionFactor
+from carbon_calculator import CARBON_EMISSION_FACTORS, EMISSION_FACTOR_VERSION, DISPOSAL_METHODS
+
+# How long a process trusts its cached idea of the active version
+ACTIVE_VERSION_TTL_SECONDS = 60
+
+# version -> {material: {method: factor}}; sets never change once stored
+_factor_set_cache = {}
+_active_version_cache = {'version': None, 'expires_at': 0.0}
+
+def clear_emission_factor_cache():
+    """Drop cached factor sets and the cached active version"""
+    _factor_set_cache.clear()
+    _active_version_cache['version'] = None
+    _active_version_cache['expires_at'] = 0.0
+
+def get_emission_factors(version: int):
+    """
+    Get a factor set as a {material: {method: kg CO2e per kg}} dictionary
+
+    The result is cached for the life of the process and shared between
+    callers, so it must not be modified.
+
+    Args:
+        version: Factor set version
+
+    Returns:
+        Factor dictionary, or None if the version does not exist
+    """
+    factors = _factor_set_cache.get(version)
+    if factors is not None:
+        return factors
+
+    rows = db.session.query(
+        EmissionFactor.material_type,
+        EmissionFactor.disposal_method,
+        EmissionFactor.kg_co2e_per_kg
+    ).filter(EmissionFactor.version == version).all()
+
+    if not rows:
+        # Version 1 is the built-in dict even before it has been seeded
+        return CARBON_EMISSION_FACTORS if version == EMISSION_FACTOR_VERSION else None
+
+    factors = {}
+    for material_type, disposal_method, value in rows:
+        factors.setdefault(material_type, {})[disposal_method] = float(value)
+
+    _factor_set_cache[version] = factors
+    return factors
+
+def get_active_factor_version():
+    """Get the version of the active factor set (cached for a short TTL)"""
+    now = time.monotonic()
+    if _active_version_cache['version'] is not None and now < _active_version_cache['expires_at']:
+        return _active_version_cache['version']
+
+    version = db.session.query(EmissionFactorSet.version).filter_by(is_active=True).scalar()
+    version = version or EMISSION_FACTOR_VERSION
+
+    _active_version_cache['version'] = version
+    _active_version_cache['expires_at'] = now + ACTIVE_VERSION_TTL_SECONDS
+    return version
+
+def get_active_emission_factors():
+    """
+    Get the factor set new items should be calculated with
+
+    Returns:
+        Tuple of (version, factor dictionary)
+    """
+    version = get_active_factor_version()
+    return version, get_emission_factors(version)
+
+def validate_factor_set(factors: dict):
+    """
+    Check a factor dictionary defines every disposal method, including 'Unknown'
+
+    Raises:
+        ValueError: If the set is incomplete or has non-numeric values
+    """
+    if 'Unknown' not in factors:
+        raise ValueError("Factor set must define an 'Unknown' material")
+    for material_type, methods in factors.items():
+        missing = [m for m in DISPOSAL_METHODS if m not in methods]
+        if missing:
+            raise ValueError(f"{material_type} is missing factors for: {', '.join(missing)}")
+        for method in DISPOSAL_METHODS:
+            float(methods[method])
+
+def create_factor_set(version: int, factors: dict, description: str = None, source: str = None):
+    """
+    Store a new factor set; existing versions are never overwritten
+
+    Args:
+        version: New version number
+        factors: {material: {method: kg CO2e per kg}} dictionary
+        description: Optional description of what changed
+        source: Optional reference for the figures
+
+    Returns:
+        EmissionFactorSet instance
+    """
+    validate_factor_set(factors)
+
+    if EmissionFactorSet.query.filter_by(version=version).first():
+        raise ValueError(f"Emission factor version {version} already exists")
+
+    try:
+        factor_set = EmissionFactorSet(version=version, description=description, source=source)
+        db.session.add(factor_set)
+        for material_type, methods in factors.items():
+            for method in DISPOSAL_METHODS:
+                db.session.add(EmissionFactor(
+                    version=version,
+                    material_type=material_type,
+                    disposal_method=method,
+                    kg_co2e_per_kg=methods[method]
+                ))
+        db.session.commit()
+        return factor_set
+    except Exception as e:
+        logging.error(f"Error creating emission factor set v{version}: {e}")
+        db.session.rollback()
+        raise
+
+def activate_factor_set(version: int):
+    """
+    Make a factor set the one used for new items
+
+    Other processes pick up the change within ACTIVE_VERSION_TTL_SECONDS.
+    Existing items keep their version until recompute_item_carbon() runs.
+
+    Args:
+        version: Version to activate
+    """
+    factor_set = EmissionFactorSet.query.filter_by(version=version).first()
+    if not factor_set:
+        raise ValueError(f"Emission factor version {version} does not exist")
+
+    try:
+        EmissionFactorSet.query.filter(
+            EmissionFactorSet.is_active.is_(True),
+            EmissionFactorSet.version != version
+        ).update({'is_active': False}, synchronize_session=False)
+        factor_set.is_active = True
+        factor_set.activated_at = datetime.utcnow()
+        db.session.commit()
+        clear_emission_factor_cache()
+    except Exception as e:
+        logging.error(f"Error activating emission factor set v{version}: {e}")
+        db.session.rollback()
+        raise
+
+def seed_default_factor_set():
+    """
+    Store CARBON_EMISSION_FACTORS as the active version 1 if no sets exist
+
+    Returns:
+        True if the default set was created
+    """
+    if EmissionFactorSet.query.count() > 0:
+        return False
+
+    create_factor_set(
+        EMISSION_FACTOR_VERSION,
+        CARBON_EMISSION_FACTORS,
+        description='Initial factors',
+        source='EPA, IPCC, and industry standards'
+    )
+    activate_factor_set(EMISSION_FACTOR_VERSION)
+    return True
+
+def main():
+    """Manage emission factor sets from the command line"""
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Manage versioned carbon emission factors")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('seed', help='Store the built-in factors as version 1')
+
+    create_parser = subparsers.add_parser('create', help='Store a new factor set from a JSON file')
+    create_parser.add_argument('--version', type=int, required=True)
+    create_parser.add_argument('--file', required=True, help='JSON file of {material: {method: factor}}')
+    create_parser.add_argument('--description', default=None)
+    create_parser.add_argument('--source', default=None)
+
+    activate_parser = subparsers.add_parser('activate', help='Use a factor set for new items')
+    activate_parser.add_argument('--version', type=int, required=True)
+
+    subparsers.add_parser('list', help='List stored factor sets')
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.command == 'seed':
+                created = seed_default_factor_set()
+                logging.info("Seeded emission factor v1" if created else "Emission factor sets already exist")
+            elif args.command == 'create':
+                with open(args.file) as f:
+                    factors = json.load(f)
+                create_factor_set(args.version, factors, args.description, args.source)
+                logging.info(f"Created emission factor set v{args.version}")
+            elif args.command == 'activate':
+                activate_factor_set(args.version)
+                logging.info(f"Activated emission factor set v{args.version}")
+            elif args.command == 'list':
+                for factor_set in EmissionFactorSet.query.order_by(EmissionFactorSet.version).all():
+                    print(f"v{factor_set.version}\t{'active' if factor_set.is_active else ''}\t{factor_set.description or ''}")
+        except Exception as e:
+            logging.error(f"Emission factor command failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,186 +1,601 @@
 """
 Footprint Updater - Manually update weekly footprint records
 This ensures weekly footprint data is created/updated when scans are added
+
+Usage:
+    python footprint_updater.py sync [--user-id 42] [--chunk-size 500]
+    python footprint_updater.py recalculate-lifetime
+    python footprint_updater.py rebuild-rollups [--user-id 42]
 """
 
+import argparse
 import logging
+import sys
 from datetime import datetime, date, timedelta
-from sqlalchemy import func
+from sqlalchemy import case, func, literal, select, update
 from models import db, PlasticFootprintScan, UserPlasticFootprintMonthly, User
+from models import FootprintDailyRollup, FootprintWeeklyRollup, FootprintMonthlyRollup
+from db_helpers import dialect_insert, week_start_expression, period_start_expression
+
+# Badge thresholds on lifetime weight (in grams), highest first
+BADGE_THRESHOLDS = (
+    (10000, 'Champion'),
+    (5000, 'Gold'),
+    (2000, 'Silver'),
+)
+
+# Rollup model and its period key column for each granularity
+FOOTPRINT_ROLLUPS = {
+    'day': (FootprintDailyRollup, 'day'),
+    'week': (FootprintWeeklyRollup, 'week_start'),
+    'month': (FootprintMonthlyRollup, 'month_start'),
+}
+
+# Weight used when a material has no MaterialWeightLookup row (grams)
+DEFAULT_SCAN_WEIGHT_GRAMS = 25.0
+
+def get_estimated_weight(material_type: str):
+    """
+    Get the average item weight for a material from the reference data cache
+    
+    Args:
+        material_type: Material type (Plastic, Paper, Metal, etc.)
+    
+    Returns:
+        Weight in grams (DEFAULT_SCAN_WEIGHT_GRAMS if the material is unknown)
+    """
+    from reference_cache import get_material_weight
+    material_weight = get_material_weight(material_type)
+    return material_weight.average_weight_grams if material_weight else DEFAULT_SCAN_WEIGHT_GRAMS
 
 def get_week_start(date_obj):
     """Get the Monday of the week for a given date"""
     days_since_monday = date_obj.weekday()  # Monday is 0
     return date_obj - timedelta(days=days_since_monday)
 
-def update_weekly_footprint(user_id: int, weight_grams: float):
+def get_period_start(period, date_obj):
+    """
+    Get the first day of the day/week/month period containing a date
+    
+    Args:
+        period: 'day', 'week' (starting Monday) or 'month'
+        date_obj: date (or datetime) to truncate
+    """
+    if isinstance(date_obj, datetime):
+        date_obj = date_obj.date()
+    if period == 'day':
+        return date_obj
+    if period == 'week':
+        return get_week_start(date_obj)
+    if period == 'month':
+        return date_obj.replace(day=1)
+    raise ValueError(f"Unknown period: {period}")
+
+def get_badge_level(total_lifetime_grams):
+    """
+    Get the badge level for a lifetime footprint weight
+    
+    Args:
+        total_lifetime_grams: Lifetime scanned weight in grams
+    """
+    for threshold, badge in BADGE_THRESHOLDS:
+        if total_lifetime_grams >= threshold:
+            return badge
+    return 'Bronze'
+
+def shift_period_start(period, period_start, periods):
     """
-    Update or create weekly footprint record for a user
+    Move a period start date forwards (or backwards, if negative) by whole periods
+    
+    Args:
+        period: 'day', 'week' or 'month'
+        period_start: Start date of a period
+        periods: Number of periods to move
+    """
+    if period == 'day':
+        return period_start + timedelta(days=periods)
+    if period == 'week':
+        return period_start + timedelta(weeks=periods)
+    if period == 'month':
+        month_index = period_start.year * 12 + period_start.month - 1 + periods
+        return date(month_index // 12, month_index % 12 + 1, 1)
+    raise ValueError(f"Unknown period: {period}")
+
+def _badge_case(total_expression):
+    """SQL CASE expression mirroring get_badge_level()"""
+    return case(
+        *[(total_expression >= threshold, badge) for threshold, badge in BADGE_THRESHOLDS],
+        else_='Bronze'
+    )
+
+def update_weekly_footprint(user_id: int, weight_grams: float, timestamp=None, commit: bool = True):
+    """
+    Add a scan's weight to the user's weekly footprint and lifetime total
+    
+    Uses two atomic statements and no aggregate scans:
+    an UPDATE ... RETURNING on the user's lifetime total (which also sets the
+    badge), and an INSERT ... ON CONFLICT (user_id, month) DO UPDATE that adds
+    the weight to the week row and derives the comparison from the previous
+    week's row. Concurrent scans cannot lose each other's updates.
     
     Args:
         user_id: User ID
         weight_grams: Weight in grams to add
+        timestamp: When the scan happened (defaults to now)
+        commit: Commit when done; with False the caller owns the transaction
+            and errors are re-raised instead of rolled back
+    
+    Returns:
+        Dictionary with week_start, weekly_total, lifetime_total, badge_level
+        and comparison_percentage, or None on error
     """
     try:
-        # Get current week start (Monday)
-        today = date.today()
-        current_week_start = get_week_start(today)
+        scan_date = timestamp.date() if timestamp else date.today()
+        week_start = get_week_start(scan_date)
+        prev_week_start = week_start - timedelta(days=7)
+        weight_grams = float(weight_grams)
         
-        # Get or create weekly record (using month field to store week start)
-        weekly = UserPlasticFootprintMonthly.query.filter_by(
-            user_id=user_id,
-            month=current_week_start
+        # Lifetime total and badge in one atomic UPDATE
+        new_lifetime = func.coalesce(User.lifetime_weight_grams, 0) + weight_grams
+        user_row = db.session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(lifetime_weight_grams=new_lifetime, badge_level=_badge_case(new_lifetime))
+            .returning(User.lifetime_weight_grams, User.badge_level)
         ).first()
         
-        if weekly:
-            # Update existing record
-            weekly.total_weight_grams = float(weekly.total_weight_grams) + weight_grams
+        if user_row:
+            lifetime_total, badge_level = float(user_row.lifetime_weight_grams), user_row.badge_level
         else:
-            # Create new record
-            weekly = UserPlasticFootprintMonthly(
-                user_id=user_id,
-                month=current_week_start,  # Using month field to store week start
-                total_weight_grams=weight_grams
+            lifetime_total, badge_level = weight_grams, get_badge_level(weight_grams)
+        
+        # Weekly row upsert (using month field to store week start)
+        weekly = UserPlasticFootprintMonthly.__table__
+        prev_total = select(weekly.c.total_weight_grams).where(
+            weekly.c.user_id == user_id,
+            weekly.c.month == prev_week_start
+        ).scalar_subquery()
+        
+        def comparison(current_total):
+            return case(
+                (prev_total > 0, (current_total - prev_total) * 100.0 / prev_total),
+                else_=100.0  # First week or no previous data
             )
-            db.session.add(weekly)
         
-        # Calculate comparison percentage (vs previous week)
-        prev_week_start = current_week_start - timedelta(days=7)
-        prev_weekly = UserPlasticFootprintMonthly.query.filter_by(
+        now = datetime.utcnow()
+        stmt = dialect_insert(weekly).values(
             user_id=user_id,
-            month=prev_week_start
-        ).first()
+            month=week_start,
+            total_weight_grams=weight_grams,
+            comparison_percentage=comparison(literal(weight_grams)),
+            badge_level=badge_level,
+            created_at=now,
+            updated_at=now
+        )
+        updated_total = weekly.c.total_weight_grams + stmt.excluded.total_weight_grams
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'month'],
+            set_={
+                'total_weight_grams': updated_total,
+                'comparison_percentage': comparison(updated_total),
+                'badge_level': stmt.excluded.badge_level,
+                'updated_at': stmt.excluded.updated_at
+            }
+        ).returning(weekly.c.total_weight_grams, weekly.c.comparison_percentage)
         
-        if prev_weekly and float(prev_weekly.total_weight_grams) > 0:
-            prev_weight = float(prev_weekly.total_weight_grams)
-            current_weight = float(weekly.total_weight_grams)
-            comparison_pct = ((current_weight - prev_weight) / prev_weight) * 100.0
-        else:
-            comparison_pct = 100.0  # First week or no previous data
+        weekly_row = db.session.execute(stmt).first()
         
-        weekly.comparison_percentage = comparison_pct
+        from dashboard_snapshot import invalidate_dashboard_snapshot
+        invalidate_dashboard_snapshot(user_id)
+        if commit:
+            db.session.commit()
         
-        # Calculate badge level based on total lifetime weight
-        total_lifetime = db.session.query(
-            func.sum(UserPlasticFootprintMonthly.total_weight_grams)
-        ).filter_by(user_id=user_id).scalar() or 0.0
+        weekly_total = float(weekly_row.total_weight_grams)
+        logging.info(f"Updated weekly footprint for user {user_id}: {weight_grams}g added, total: {weekly_total}g")
+        return {
+            'week_start': week_start,
+            'weekly_total': weekly_total,
+            'lifetime_total': lifetime_total,
+            'badge_level': badge_level,
+            'comparison_percentage': float(weekly_row.comparison_percentage)
+        }
         
-        total_lifetime = float(total_lifetime)
+    except Exception as e:
+        logging.error(f"Error updating weekly footprint: {e}")
+        if not commit:
+            raise
+        db.session.rollback()
+        return None
+
+def record_scan_rollups(user_id: int, weight_grams: float, timestamp=None):
+    """
+    Add a scan to the user's day, week and month rollups
+    
+    Each rollup is one INSERT ... ON CONFLICT DO UPDATE. Nothing is committed
+    here, so the caller can keep the rollups in the scan's own transaction.
+    
+    Args:
+        user_id: User ID
+        weight_grams: Scanned weight in grams
+        timestamp: When the scan happened (defaults to now)
+    """
+    scan_time = timestamp or datetime.utcnow()
+    now = datetime.utcnow()
+    
+    for period, (model, key_column) in FOOTPRINT_ROLLUPS.items():
+        table = model.__table__
+        stmt = dialect_insert(table).values({
+            'user_id': user_id,
+            key_column: get_period_start(period, scan_time),
+            'total_weight_grams': float(weight_grams),
+            'scan_count': 1,
+            'updated_at': now
+        })
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', key_column],
+            set_={
+                'total_weight_grams': table.c.total_weight_grams + stmt.excluded.total_weight_grams,
+                'scan_count': table.c.scan_count + 1,
+                'updated_at': stmt.excluded.updated_at
+            }
+        )
+        db.session.execute(stmt)
+    
+    from dashboard_snapshot import invalidate_dashboard_snapshot
+    invalidate_dashboard_snapshot(user_id)
+
+def get_scan_retention_cutoff():
+    """
+    Get the day before which raw scans have been pruned
+    
+    Returns:
+        date, or None if the retention job has never run
+    """
+    from models import ScanRetentionRun
+    return db.session.query(func.max(ScanRetentionRun.pruned_before)).scalar()
+
+def get_retained_period_start(period, cutoff=None):
+    """
+    Get the first day/week/month whose scans are all still stored
+    
+    Periods before this are only kept in the rollups, so rebuilds from raw
+    scans must leave them alone.
+    
+    Args:
+        period: 'day', 'week' or 'month'
+        cutoff: Retention cutoff (defaults to get_scan_retention_cutoff())
+    
+    Returns:
+        date, or None if no scans have been pruned
+    """
+    cutoff = cutoff or get_scan_retention_cutoff()
+    if cutoff is None:
+        return None
+    period_start = get_period_start(period, cutoff)
+    return period_start if period_start == cutoff else shift_period_start(period, period_start, 1)
+
+def rebuild_rollup_range(period, start=None, end=None, user_id: int = None):
+    """
+    Replace one granularity's rollup rows for [start, end) with totals from scans
+    
+    Nothing is committed here.
+    
+    Args:
+        period: 'day', 'week' or 'month'
+        start: First period start to rebuild (default: unbounded)
+        end: Period start to stop before (default: unbounded)
+        user_id: Only rebuild this user's rows (default: all users)
+    
+    Returns:
+        Number of rollup rows written
+    """
+    model, key_column = FOOTPRINT_ROLLUPS[period]
+    table = model.__table__
+    scan_time = func.coalesce(PlasticFootprintScan.timestamp, PlasticFootprintScan.created_at, func.current_timestamp())
+    period_start = period_start_expression(period, scan_time)
+    
+    delete_stmt = table.delete()
+    grouped = select(
+        PlasticFootprintScan.user_id,
+        period_start,
+        func.sum(PlasticFootprintScan.estimated_weight_grams),
+        func.count(PlasticFootprintScan.id),
+        literal(datetime.utcnow())
+    ).group_by(PlasticFootprintScan.user_id, period_start)
+    
+    if start is not None:
+        delete_stmt = delete_stmt.where(table.c[key_column] >= start)
+        grouped = grouped.where(scan_time >= datetime.combine(start, datetime.min.time()))
+    if end is not None:
+        delete_stmt = delete_stmt.where(table.c[key_column] < end)
+        grouped = grouped.where(scan_time < datetime.combine(end, datetime.min.time()))
+    if user_id is not None:
+        delete_stmt = delete_stmt.where(table.c.user_id == user_id)
+        grouped = grouped.where(PlasticFootprintScan.user_id == user_id)
+    
+    db.session.execute(delete_stmt)
+    result = db.session.execute(table.insert().from_select(
+        ['user_id', key_column, 'total_weight_grams', 'scan_count', 'updated_at'],
+        grouped
+    ))
+    return result.rowcount
+
+def rebuild_footprint_rollups(user_id: int = None):
+    """
+    Recompute the day/week/month rollups from scans with INSERT ... SELECT
+    
+    Existing rows are replaced inside one transaction, so this is safe to
+    re-run at any time. Periods older than the scan retention cutoff are
+    left as they are, since their raw scans no longer exist.
+    
+    Args:
+        user_id: Only rebuild this user's rollups (default: all users)
+    
+    Returns:
+        Dictionary of rows written per period
+    """
+    try:
+        cutoff = get_scan_retention_cutoff()
+        counts = {}
+        for period in FOOTPRINT_ROLLUPS:
+            counts[period] = rebuild_rollup_range(
+                period, start=get_retained_period_start(period, cutoff), user_id=user_id
+            )
         
-        # Badge thresholds (in grams)
-        if total_lifetime >= 10000:
-            new_badge = 'Champion'
-        elif total_lifetime >= 5000:
-            new_badge = 'Gold'
-        elif total_lifetime >= 2000:
-            new_badge = 'Silver'
+        from dashboard_snapshot import invalidate_dashboard_snapshot, invalidate_all_dashboard_snapshots
+        if user_id is not None:
+            invalidate_dashboard_snapshot(user_id)
         else:
-            new_badge = 'Bronze'
-        
-        weekly.badge_level = new_badge
-        
-        # Update user's badge level
-        user = User.query.get(user_id)
-        if user:
-            user.badge_level = new_badge
+            invalidate_all_dashboard_snapshots()
         
         db.session.commit()
-        logging.info(f"Updated weekly footprint for user {user_id}: {weight_grams}g added, total: {weekly.total_weight_grams}g")
-        return True
+        return counts
         
     except Exception as e:
-        logging.error(f"Error updating weekly footprint: {e}")
+        logging.error(f"Error rebuilding footprint rollups: {e}")
+        db.session.rollback()
+        raise
+
+def get_footprint_history(user_id: int, period: str = 'week', start=None, end=None, limit: int = None):
+    """
+    Read a user's footprint for a range of periods with one indexed query
+    
+    Args:
+        user_id: User ID
+        period: 'day', 'week' or 'month'
+        start: Optional first date of the range
+        end: Optional last date of the range (default: today)
+        limit: Return the last N calendar periods up to end (overrides start)
+    
+    Returns:
+        List of dictionaries, newest first, with period_start, total_weight_grams,
+        scan_count and comparison_percentage (vs the preceding period)
+    """
+    if period not in FOOTPRINT_ROLLUPS:
+        raise ValueError(f"Unknown period: {period}")
+    
+    model, key_column = FOOTPRINT_ROLLUPS[period]
+    key = getattr(model, key_column)
+    end = get_period_start(period, end or date.today())
+    if limit:
+        start = shift_period_start(period, end, -(limit - 1))
+    elif start is not None:
+        start = get_period_start(period, start)
+    
+    # Read one extra period so the oldest row also gets a comparison
+    query = db.session.query(key, model.total_weight_grams, model.scan_count).filter(
+        model.user_id == user_id,
+        key <= end
+    )
+    if start is not None:
+        query = query.filter(key >= shift_period_start(period, start, -1))
+    
+    rows = query.order_by(key).all()
+    totals = {row[0]: float(row.total_weight_grams) for row in rows}
+    
+    history = []
+    for period_start, total_weight, scan_count in rows:
+        if start is not None and period_start < start:
+            continue
+        prev_total = totals.get(shift_period_start(period, period_start, -1), 0.0)
+        if prev_total > 0:
+            comparison_pct = ((float(total_weight) - prev_total) / prev_total) * 100.0
+        else:
+            comparison_pct = 100.0  # First period or no previous data
+        history.append({
+            'period_start': period_start,
+            'total_weight_grams': float(total_weight),
+            'scan_count': scan_count,
+            'comparison_percentage': round(comparison_pct, 2)
+        })
+    
+    history.reverse()
+    return history
+
+def _update_lifetime_totals(user_filter=None):
+    """Set lifetime totals and badges from weekly rows with one UPDATE (no commit)"""
+    lifetime = func.coalesce(
+        select(func.sum(UserPlasticFootprintMonthly.total_weight_grams))
+        .where(UserPlasticFootprintMonthly.user_id == User.id)
+        .scalar_subquery(),
+        0
+    )
+    stmt = update(User).values(lifetime_weight_grams=lifetime, badge_level=_badge_case(lifetime))
+    if user_filter is not None:
+        stmt = stmt.where(user_filter)
+    return db.session.execute(stmt).rowcount
+
+def recalculate_lifetime_totals():
+    """
+    Reset every user's lifetime total and badge from their weekly rows
+    
+    One-time backfill for the lifetime_weight_grams column, and a repair
+    tool if totals ever drift.
+    
+    Returns:
+        Number of users updated
+    """
+    try:
+        from dashboard_snapshot import invalidate_all_dashboard_snapshots
+        count = _update_lifetime_totals()
+        invalidate_all_dashboard_snapshots()
+        db.session.commit()
+        return count
+    except Exception as e:
+        logging.error(f"Error recalculating lifetime totals: {e}")
         db.session.rollback()
-        return False
+        raise
 
 # Keep old function name for backward compatibility
 def update_monthly_footprint(user_id: int, weight_grams: float):
     """Alias for update_weekly_footprint for backward compatibility"""
     return update_weekly_footprint(user_id, weight_grams)
 
-def sync_all_scans_to_weekly():
+def _as_date(value):
+    """Normalise a week start returned by SQL (date, datetime or ISO string)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+def sync_weekly_chunk(after_user_id: int = 0, chunk_size: int = 500, user_id: int = None):
     """
-    Sync all existing scans to weekly records
-    Useful for initial setup or fixing missing data
+    Rebuild weekly footprint records for the next chunk of users and commit
+    
+    Args:
+        after_user_id: Start with users whose ID is greater than this
+        chunk_size: Number of users in the chunk
+        user_id: Only rebuild this user's records
+    
+    Returns:
+        Tuple of (records written, last user ID in the chunk); the user ID
+        is None when there were no users left
     """
-    try:
-        # Get all scans and group by user and week manually
-        all_scans = PlasticFootprintScan.query.all()
-        
-        # Group by user and week (week starts on Monday)
-        user_week_data = {}
-        for scan in all_scans:
-            user_id = scan.user_id
-            scan_date = scan.timestamp.date() if scan.timestamp else date.today()
-            week_start = get_week_start(scan_date)
-            
-            key = (user_id, week_start)
-            if key not in user_week_data:
-                user_week_data[key] = 0.0
-            
-            user_week_data[key] += float(scan.estimated_weight_grams)
+    from dashboard_snapshot import invalidate_dashboard_snapshots
+    
+    scan_time = func.coalesce(PlasticFootprintScan.timestamp, PlasticFootprintScan.created_at, func.current_timestamp())
+    week_start = week_start_expression(scan_time).label('week_start')
+    sync_from = get_retained_period_start('week')
+    
+    user_query = db.session.query(PlasticFootprintScan.user_id).filter(
+        PlasticFootprintScan.user_id > after_user_id
+    )
+    if user_id is not None:
+        user_query = user_query.filter(PlasticFootprintScan.user_id == user_id)
+    user_ids = [
+        row.user_id for row in user_query.distinct()
+        .order_by(PlasticFootprintScan.user_id).limit(chunk_size).all()
+    ]
+    if not user_ids:
+        return 0, None
+    
+    weekly_totals = db.session.query(
+        PlasticFootprintScan.user_id.label('user_id'),
+        week_start,
+        func.sum(PlasticFootprintScan.estimated_weight_grams).label('total_weight_grams')
+    ).filter(PlasticFootprintScan.user_id.in_(user_ids))
+    if sync_from is not None:
+        weekly_totals = weekly_totals.filter(scan_time >= datetime.combine(sync_from, datetime.min.time()))
+    weekly_totals = weekly_totals.group_by(PlasticFootprintScan.user_id, week_start).subquery()
+    
+    window = {'partition_by': weekly_totals.c.user_id, 'order_by': weekly_totals.c.week_start}
+    rows = db.session.query(
+        weekly_totals.c.user_id,
+        weekly_totals.c.week_start,
+        weekly_totals.c.total_weight_grams,
+        func.lag(weekly_totals.c.week_start).over(**window).label('prev_week_start'),
+        func.lag(weekly_totals.c.total_weight_grams).over(**window).label('prev_total'),
+        func.sum(weekly_totals.c.total_weight_grams).over(**window).label('running_total')
+    ).all()
+    
+    # Weeks whose scans were pruned: their total and the last one before sync_from
+    pruned_totals, pruned_last_week = {}, {}
+    if sync_from is not None:
+        for kept in UserPlasticFootprintMonthly.query.filter(
+            UserPlasticFootprintMonthly.user_id.in_(user_ids),
+            UserPlasticFootprintMonthly.month < sync_from
+        ).order_by(UserPlasticFootprintMonthly.month):
+            pruned_totals[kept.user_id] = pruned_totals.get(kept.user_id, 0.0) + float(kept.total_weight_grams or 0)
+            pruned_last_week[kept.user_id] = (kept.month, kept.total_weight_grams)
+    
+    now = datetime.utcnow()
+    records = []
+    for row in rows:
+        week = _as_date(row.week_start)
+        total = float(row.total_weight_grams)
+        prev_week, prev_total = _as_date(row.prev_week_start), row.prev_total
+        if prev_week is None and row.user_id in pruned_last_week:
+            prev_week, prev_total = pruned_last_week[row.user_id]
+        prev_total = float(prev_total or 0)
+        
+        # Compare against the immediately preceding week only
+        if prev_week == week - timedelta(days=7) and prev_total > 0:
+            comparison_pct = ((total - prev_total) / prev_total) * 100.0
+        else:
+            comparison_pct = 100.0  # First week or no previous data
         
+        records.append({
+            'user_id': row.user_id,
+            'month': week,  # Using month field to store week start
+            'total_weight_grams': total,
+            'comparison_percentage': comparison_pct,
+            'badge_level': get_badge_level(float(row.running_total) + pruned_totals.get(row.user_id, 0.0)),
+            'created_at': now,
+            'updated_at': now
+        })
+    
+    if records:
+        weekly = UserPlasticFootprintMonthly.__table__
+        upsert = dialect_insert(weekly)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=['user_id', 'month'],
+            set_={
+                'total_weight_grams': upsert.excluded.total_weight_grams,
+                'comparison_percentage': upsert.excluded.comparison_percentage,
+                'badge_level': upsert.excluded.badge_level,
+                'updated_at': upsert.excluded.updated_at
+            }
+        )
+        db.session.execute(upsert, records)
+    
+    # Lifetime totals and badges for this chunk of users in one UPDATE
+    _update_lifetime_totals(User.id.in_(user_ids))
+    invalidate_dashboard_snapshots(user_ids)
+    db.session.commit()
+    
+    return len(records), user_ids[-1]
+
+def sync_all_scans_to_weekly(user_id: int = None, chunk_size: int = 500):
+    """
+    Rebuild weekly footprint records from scans with set-based SQL
+    
+    Scans are grouped by user and week start in the database. A window pass
+    (LAG for the previous week, a running SUM for the lifetime badge) runs over
+    the grouped rows, and the results are written with chunked
+    INSERT ... ON CONFLICT upserts. Each chunk of users commits on its own
+    (see sync_weekly_chunk()). The rebuild replaces totals rather than adding
+    to them, so it is safe to re-run or resume. Weeks before the scan
+    retention cutoff are kept as they are and count towards later weeks'
+    badges and comparisons.
+    
+    Args:
+        user_id: Only rebuild this user's records (default: all users)
+        chunk_size: Number of users per upsert chunk
+    
+    Returns:
+        Number of weekly records written
+    """
+    try:
         updated_count = 0
-        for (user_id, week_start), total_weight in user_week_data.items():
-            
-            # Get or create weekly record (using month field to store week start)
-            weekly = UserPlasticFootprintMonthly.query.filter_by(
-                user_id=user_id,
-                month=week_start
-            ).first()
-            
-            if weekly:
-                weekly.total_weight_grams = total_weight
-            else:
-                weekly = UserPlasticFootprintMonthly(
-                    user_id=user_id,
-                    month=week_start,  # Using month field to store week start
-                    total_weight_grams=total_weight
-                )
-                db.session.add(weekly)
-            
-            # Calculate comparison percentage
-            prev_week_start = week_start - timedelta(days=7)
-            prev_weekly = UserPlasticFootprintMonthly.query.filter_by(
-                user_id=user_id,
-                month=prev_week_start
-            ).first()
-            
-            if prev_weekly and float(prev_weekly.total_weight_grams) > 0:
-                prev_weight = float(prev_weekly.total_weight_grams)
-                current_weight = float(weekly.total_weight_grams)
-                comparison_pct = ((current_weight - prev_weight) / prev_weight) * 100.0
-            else:
-                comparison_pct = 100.0  # First week or no previous data
-            
-            weekly.comparison_percentage = comparison_pct
-            
-            # Calculate badge
-            total_lifetime = db.session.query(
-                func.sum(UserPlasticFootprintMonthly.total_weight_grams)
-            ).filter_by(user_id=user_id).scalar() or 0.0
-            
-            total_lifetime = float(total_lifetime)
-            
-            if total_lifetime >= 10000:
-                new_badge = 'Champion'
-            elif total_lifetime >= 5000:
-                new_badge = 'Gold'
-            elif total_lifetime >= 2000:
-                new_badge = 'Silver'
-            else:
-                new_badge = 'Bronze'
-            
-            weekly.badge_level = new_badge
-            
-            # Update user badge
-            user = User.query.get(user_id)
-            if user:
-                user.badge_level = new_badge
-            
-            updated_count += 1
+        last_user_id = 0
+        while True:
+            written, last_user_id = sync_weekly_chunk(last_user_id, chunk_size, user_id)
+            if last_user_id is None:
+                break
+            updated_count += written
+            logging.info(f"Synced {updated_count} weekly footprint records (through user {last_user_id})")
         
-        db.session.commit()
         logging.info(f"Synced {updated_count} weekly footprint records from scans")
         return updated_count
         
@@ -194,3 +609,39 @@ def sync_all_scans_to_monthly():
     """Alias for sync_all_scans_to_weekly for backward compatibility"""
     return sync_all_scans_to_weekly()
 
+def main():
+    """Rebuild footprint records from the command line"""
+    from app import app
+    
+    parser = argparse.ArgumentParser(description="Footprint maintenance tasks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    sync_parser = subparsers.add_parser('sync', help='Rebuild weekly records from scans')
+    sync_parser.add_argument('--user-id', type=int, default=None, help='Only rebuild this user')
+    sync_parser.add_argument('--chunk-size', type=int, default=500, help='Users per chunk')
+    
+    subparsers.add_parser('recalculate-lifetime', help='Reset lifetime totals from weekly records')
+    
+    rollup_parser = subparsers.add_parser('rebuild-rollups', help='Rebuild day/week/month rollups from scans')
+    rollup_parser.add_argument('--user-id', type=int, default=None, help='Only rebuild this user')
+    
+    args = parser.parse_args()
+    
+    with app.app_context():
+        try:
+            if args.command == 'sync':
+                count = sync_all_scans_to_weekly(user_id=args.user_id, chunk_size=args.chunk_size)
+                logging.info(f"Footprint sync complete: {count} weekly records written")
+            elif args.command == 'recalculate-lifetime':
+                count = recalculate_lifetime_totals()
+                logging.info(f"Lifetime totals recalculated for {count} users")
+            elif args.command == 'rebuild-rollups':
+                counts = rebuild_footprint_rollups(user_id=args.user_id)
+                logging.info(f"Footprint rollups rebuilt: {counts}")
+        except Exception as e:
+            logging.error(f"Footprint maintenance failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Gemini Response Archive
+Stores every raw Gemini response and re-runs the current parser/formatter
+over the archive offline, so parser improvements cost no extra API calls.
+
+Usage:
+    python gemini_archive.py [--chunk-size 200] [--workers 4] [--prompt-version v1] [--dry-run]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import update
+from app import app, db
+from models import WasteItem, GeminiResponseArchive, EmissionFactorVersionTotal
+from gemini_formatter import parse_gemini_analysis
+from carbon_service import SNAPSHOT_CURRENT, apply_rollup_deltas, item_carbon_change, snapshot_version_totals
+
+# WasteItem columns that are derived from the raw Gemini response
+REPARSED_FIELDS = (
+    'is_recyclable',
+    'is_ewaste',
+    'material',
+    'summary',
+    'full_analysis',
+    'recycling_instructions',
+    'environmental_impact',
+    'disposal_recommendations',
+)
+
+def archive_gemini_response(waste_item_id: int, analysis_result: dict):
+    """
+    Add the raw Gemini response from an analysis result to the archive
+
+    The caller owns the transaction; nothing is committed here.
+
+    Args:
+        waste_item_id: ID of the waste item the response belongs to
+        analysis_result: Dictionary returned by analyze_waste()
+
+    Returns:
+        GeminiResponseArchive instance, or None if there was no raw response
+    """
+    raw_response = analysis_result.get('raw_response')
+    if not raw_response:
+        return None
+
+    archive = GeminiResponseArchive(
+        waste_item_id=waste_item_id,
+        model_name=analysis_result.get('model_name', 'unknown'),
+        prompt_version=analysis_result.get('prompt_version', 'unknown')
+    )
+    archive.raw_response = raw_response
+    db.session.add(archive)
+    return archive
+
+def _load_material_detection(raw_value):
+    """Decode the JSON material detection column of a WasteItem row"""
+    if not raw_value:
+        return None
+    try:
+        return json.loads(raw_value)
+    except (TypeError, ValueError):
+        return None
+
+def _init_parser_worker():
+    """
+    Prepare a forked parser process
+
+    Drops the database connections inherited from the parent (without
+    closing them, so the parent's stay usable) and pushes an empty request
+    context, so the formatter's localization lookups fall back to the
+    default language instead of failing outside a request.
+    """
+    db.engine.dispose(close=False)
+    app.test_request_context().push()
+
+def _refresh_version_totals(versions):
+    """Re-snapshot the current carbon totals of factor versions whose items changed"""
+    for version in sorted(versions):
+        snapshot = db.session.query(EmissionFactorVersionTotal.snapshot_kind).filter_by(version=version).first()
+        if snapshot is not None and (snapshot.snapshot_kind or SNAPSHOT_CURRENT) == SNAPSHOT_CURRENT:
+            snapshot_version_totals(version)
+
+def reparse_archive(chunk_size: int = 200, workers: int = None, prompt_version: str = None, dry_run: bool = False):
+    """
+    Re-run parse_gemini_analysis over archived responses and bulk-update WasteItems
+
+    Archive rows are read in primary-key order, one chunk at a time. Each chunk
+    is parsed in parallel worker processes and written back with a single bulk
+    UPDATE and one commit. Items whose material or recyclability changed get
+    their CO2e recomputed and their carbon rollups moved in the same commit;
+    current per-version carbon snapshots are refreshed at the end.
+
+    Args:
+        chunk_size: Number of archived responses per chunk
+        workers: Number of parser processes (defaults to CPU count)
+        prompt_version: Only re-parse responses produced by this prompt version
+        dry_run: Parse everything but roll back instead of committing
+
+    Returns:
+        Number of waste items updated
+    """
+    updated_count = 0
+    last_id = 0
+    workers = workers or os.cpu_count() or 1
+    carbon_versions = set()  # Factor versions whose items' CO2e changed
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_parser_worker) as executor:
+        while True:
+            query = db.session.query(
+                GeminiResponseArchive.id,
+                GeminiResponseArchive.waste_item_id,
+                GeminiResponseArchive._raw_response,
+                WasteItem._material_detection,
+                WasteItem.user_id,
+                WasteItem.created_at,
+                WasteItem.material_type,
+                WasteItem.material,
+                WasteItem.is_recyclable,
+                WasteItem.estimated_weight_grams,
+                WasteItem.co2e_grams,
+                WasteItem.emission_factor_version
+            ).join(
+                WasteItem, WasteItem.id == GeminiResponseArchive.waste_item_id
+            ).filter(
+                GeminiResponseArchive.id > last_id
+            )
+
+            if prompt_version:
+                query = query.filter(GeminiResponseArchive.prompt_version == prompt_version)
+
+            rows = query.order_by(GeminiResponseArchive.id).limit(chunk_size).all()
+            if not rows:
+                break
+
+            last_id = rows[-1].id
+
+            # Decompress in the parent so workers only receive plain text
+            texts = [zlib.decompress(row._raw_response).decode('utf-8') for row in rows]
+            detections = [_load_material_detection(row._material_detection) for row in rows]
+
+            parsed_results = executor.map(
+                parse_gemini_analysis, texts, detections,
+                chunksize=max(1, len(rows) // (workers * 4))
+            )
+
+            item_updates = []
+            carbon_updates = []
+            rollup_deltas = []
+            for row, parsed in zip(rows, parsed_results):
+                values = {field: parsed.get(field) for field in REPARSED_FIELDS}
+                values['id'] = row.waste_item_id
+                item_updates.append(values)
+
+                change = item_carbon_change(row, values['material'], values['is_recyclable'])
+                if change is not None:
+                    carbon_values, deltas = change
+                    carbon_updates.append(dict(carbon_values, id=row.waste_item_id))
+                    rollup_deltas.extend(deltas)
+                    carbon_versions.update((row.emission_factor_version, carbon_values['emission_factor_version']))
+
+            db.session.execute(update(WasteItem), item_updates)
+            if carbon_updates:
+                db.session.execute(update(WasteItem), carbon_updates)
+                apply_rollup_deltas(rollup_deltas)
+            db.session.execute(update(GeminiResponseArchive), [
+                {'id': row.id, 'reparsed_at': datetime.utcnow()} for row in rows
+            ])
+
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+
+            updated_count += len(item_updates)
+            logging.info(f"Re-parsed {updated_count} archived responses (last archive id {last_id})")
+
+    if not dry_run:
+        _refresh_version_totals(carbon_versions)
+
+    return updated_count
+
+def main():
+    """Re-parse the Gemini response archive from the command line"""
+    parser = argparse.ArgumentParser(description="Re-parse archived Gemini responses into WasteItem fields")
+    parser.add_argument('--chunk-size', type=int, default=200, help='Archived responses per chunk')
+    parser.add_argument('--workers', type=int, default=None, help='Parser processes (default: CPU count)')
+    parser.add_argument('--prompt-version', default=None, help='Only re-parse this prompt version')
+    parser.add_argument('--dry-run', action='store_true', help='Parse but do not commit')
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            count = reparse_archive(
+                chunk_size=args.chunk_size,
+                workers=args.workers,
+                prompt_version=args.prompt_version,
+                dry_run=args.dry_run
+            )
+            logging.info(f"Re-parse complete: {count} waste items {'checked' if args.dry_run else 'updated'}")
+        except Exception as e:
+            logging.error(f"Re-parse failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
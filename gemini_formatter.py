@@ -510,3 +510,171 @@ def extract_sections_from_raw_text(raw_text):
     result["is_recyclable"] = (recyclable_status == "Recyclable")
     
     return result
+
+def parse_gemini_analysis(analysis_text, material_detection_result=None):
+    """
+    Parse a raw Gemini analysis into the structured result used by the app.
+    Kept free of API calls so archived responses can be re-parsed offline.
+    
+    Args:
+        analysis_text: The raw text returned by Gemini
+        material_detection_result: Optional material detection output for the image
+        
+    Returns:
+        Dictionary containing analysis results
+    """
+    # Extract key information more robustly
+    is_recyclable = False
+    is_ewaste = False
+    material = "Unknown"
+    recycling_instructions = ""
+    environmental_impact = ""
+    disposal_recommendations = ""
+    
+    # More robust parsing strategy that's less dependent on specific formatting
+    analysis_lower = analysis_text.lower()
+    
+    # Check for recyclability - be more lenient: if it "could" be recyclable, mark it as recyclable
+    recyclable_indicators = ["1. is it recyclable", "recyclable:", "recyclability:"]
+    for indicator in recyclable_indicators:
+        if indicator in analysis_lower:
+            # Look for a Yes/No response within 100 characters after the indicator
+            segment = analysis_lower[analysis_lower.find(indicator):analysis_lower.find(indicator) + 100]
+            # Check for explicit "yes" or phrases indicating it could be recyclable
+            if "yes" in segment and not ("no" in segment and segment.find("no") < segment.find("yes")):
+                is_recyclable = True
+            elif any(phrase in segment for phrase in ["could be", "can be", "may be", "potentially", "possibly"]):
+                # If it says "could be recyclable", "can be recycled", etc., mark as recyclable
+                is_recyclable = True
+            break
+    
+    # Also check the full text for recyclability indicators (more lenient)
+    if not is_recyclable:
+        # Look for phrases indicating recyclability potential
+        recyclable_phrases = [
+            "could be recyclable", "can be recycled", "may be recyclable", 
+            "potentially recyclable", "possibly recyclable", "might be recyclable",
+            "components could be", "materials can be", "parts may be"
+        ]
+        for phrase in recyclable_phrases:
+            if phrase in analysis_lower:
+                is_recyclable = True
+                break
+    
+    # Check for e-waste
+    ewaste_indicators = ["2. is it e-waste", "e-waste:", "electronic waste:"]
+    for indicator in ewaste_indicators:
+        if indicator in analysis_lower:
+            # Look for a Yes/No response within 100 characters after the indicator
+            segment = analysis_lower[analysis_lower.find(indicator):analysis_lower.find(indicator) + 100]
+            is_ewaste = "yes" in segment and not ("no" in segment and segment.find("no") < segment.find("yes"))
+            break
+    
+    # Extract material using a more flexible approach
+    material_indicators = ["3. primary material", "material composition:", "primary material:"]
+    for indicator in material_indicators:
+        if indicator in analysis_lower:
+            # Get the 150 characters after the indicator to find material
+            material_section = analysis_lower[analysis_lower.find(indicator):analysis_lower.find(indicator) + 150]
+            
+            # Look for specific materials
+            materials = {
+                "plastic": "Plastic",
+                "paper": "Paper",
+                "cardboard": "Paper",
+                "metal": "Metal",
+                "aluminum": "Metal",
+                "steel": "Metal",
+                "glass": "Glass",
+                "organic": "Organic",
+                "food": "Organic",
+                "textile": "Textile",
+                "fabric": "Textile",
+                "clothing": "Textile",
+                "electronic": "Electronic",
+                "battery": "Electronic"
+            }
+            
+            # Find the first material mentioned
+            for key, value in materials.items():
+                if key in material_section:
+                    material = value
+                    break
+            
+            break
+    
+    # Extract recycling instructions
+    try:
+        if "4. recycling preparation" in analysis_lower:
+            start = analysis_lower.find("4. recycling preparation")
+            next_section = analysis_lower.find("5.", start)
+            if next_section == -1:  # If there's no next section
+                next_section = len(analysis_lower)
+            recycling_instructions = analysis_text[start:next_section].strip()
+        elif "preparation" in analysis_lower:
+            start = analysis_lower.find("preparation")
+            end = analysis_lower.find("\n\n", start)
+            if end == -1:
+                end = len(analysis_lower)
+            recycling_instructions = analysis_text[start:end].strip()
+    except:
+        # Error messages will be localized by the caller
+        recycling_instructions = ""
+        
+    # Extract environmental impact
+    try:
+        if "5. environmental impact" in analysis_lower:
+            start = analysis_lower.find("5. environmental impact")
+            next_section = analysis_lower.find("6.", start)
+            if next_section == -1:
+                next_section = len(analysis_lower)
+            environmental_impact = analysis_text[start:next_section].strip()
+    except:
+        # Error messages will be localized by the caller
+        environmental_impact = ""
+        
+    # Extract disposal recommendations
+    try:
+        if "6. disposal" in analysis_lower:
+            start = analysis_lower.find("6. disposal")
+            next_section = analysis_lower.find("\n\n", start + 15)
+            if next_section == -1:
+                next_section = len(analysis_lower)
+            disposal_recommendations = analysis_text[start:next_section].strip()
+    except:
+        # Error messages will be localized by the caller
+        disposal_recommendations = ""
+    
+    # Format the result with additional information
+    result = {
+        "full_analysis": analysis_text,
+        "is_recyclable": is_recyclable,
+        "is_ewaste": is_ewaste,
+        "material": material,
+        "recycling_instructions": recycling_instructions,
+        "environmental_impact": environmental_impact,
+        "disposal_recommendations": disposal_recommendations
+    }
+    
+    # Include material detection results if available
+    if material_detection_result and not material_detection_result.get('error'):
+        result["material_detection"] = material_detection_result
+    
+    # Use our formatter to clean up the text and improve presentation
+    formatted_result = format_gemini_response(result)
+    
+    # If we have a full analysis but missing section data, try to extract it
+    if (not recycling_instructions or not environmental_impact or not disposal_recommendations) and analysis_text:
+        extracted_sections = extract_sections_from_raw_text(analysis_text)
+        
+        # Only update missing sections
+        if not formatted_result["recycling_instructions"] and extracted_sections["recycling_instructions"]:
+            formatted_result["recycling_instructions"] = extracted_sections["recycling_instructions"]
+            
+        if not formatted_result["environmental_impact"] and extracted_sections["environmental_impact"]:
+            formatted_result["environmental_impact"] = extracted_sections["environmental_impact"]
+            
+        if not formatted_result["disposal_recommendations"] and extracted_sections["disposal_recommendations"]:
+            formatted_result["disposal_recommendations"] = extracted_sections["disposal_recommendations"]
+    
+    return formatted_result
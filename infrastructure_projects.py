@@ -7,7 +7,7 @@ from flask import render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from app import db
 from models import InfrastructureProject, WasteBatch, ProjectContributor, ProjectLedger
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, select
 from blockchain_tracker import get_project_blockchain, get_user_contribution_chain
 import uuid
 import logging
@@ -226,8 +226,11 @@ def register_infrastructure_project_routes(app):
     def submit_contribution(waste_item_id, project_id):
         """Submit contribution of waste item to infrastructure project"""
         try:
-            from models import WasteItem
-            from auto_batch_creator import link_batch_to_project_auto
+            from models import WasteItem, WasteBatchItem, BatchAssignmentQueue
+            from auto_batch_creator import (
+                auto_create_batch_from_waste_item, claim_batch_for_linking,
+                link_batch_to_project_auto, process_batch_assignment_queue
+            )
             
             project = InfrastructureProject.query.get_or_404(project_id)
             
@@ -244,29 +247,38 @@ def register_infrastructure_project_routes(app):
                     flash("Only recyclable items can be contributed to infrastructure projects.", "warning")
                     return redirect(url_for('index'))
                 
-                # Create or update batch
-                from auto_batch_creator import auto_create_batch_from_waste_item
-                auto_create_batch_from_waste_item(waste_item.id)
+                def find_item_batch():
+                    """The batch this waste item was assigned to, if any"""
+                    return WasteBatch.query.join(
+                        WasteBatchItem, WasteBatchItem.batch_id == WasteBatch.id
+                    ).filter(WasteBatchItem.waste_item_id == waste_item.id).first()
                 
-                # Find the batch for this waste item
-                material_type = waste_item.material_type or waste_item.material or 'Plastic'
-                from datetime import timedelta
-                seven_days_ago = datetime.utcnow() - timedelta(days=7)
+                # Assign the item to a batch now if the coalescer has not done so yet
+                process_batch_assignment_queue(waste_item_ids=[waste_item.id])
+                batch = find_item_batch()
+                queued = db.session.query(BatchAssignmentQueue.id).filter_by(
+                    waste_item_id=waste_item.id
+                ).first() is not None
                 
-                batch = WasteBatch.query.filter(
-                    WasteBatch.material_type == material_type,
-                    WasteBatch.collection_date >= seven_days_ago
-                ).order_by(WasteBatch.collection_date.desc()).first()
+                if batch is None and not queued:
+                    # Never queued (uploaded before the queue, or the enqueue was lost)
+                    auto_create_batch_from_waste_item(waste_item.id)
+                    batch = find_item_batch()
                 
                 if batch:
-                    # Link batch to selected project
-                    if not batch.linked_project_id:
-                        link_batch_to_project_auto(batch, project, current_user.id)
+                    # Lock the batch first; None if it is linked or another worker is linking it
+                    claimed = claim_batch_for_linking(batch.id)
+                    if claimed is not None:
+                        link_batch_to_project_auto(claimed, project, current_user.id)
+                        db.session.commit()
                         flash(f"Successfully contributed {waste_item.estimated_weight_grams or 25}g to {project.project_name}!", "success")
                     else:
+                        db.session.rollback()
                         flash(f"This material is already part of a batch linked to another project.", "info")
-                else:
+                elif queued:
                     flash("Batch creation in progress. Your contribution will be linked soon.", "info")
+                else:
+                    flash("This item could not be added to a batch. Please try again.", "danger")
             else:
                 # No specific waste item - show message to scan first
                 flash("Please scan a recyclable waste item first, then contribute it to this project.", "info")
@@ -354,11 +366,14 @@ def link_batch_to_project(batch_id: str, project_id: str, verified_by: str = Non
         # Link batch to project
         batch.linked_project_id = project.id
         batch.status = 'allocated'
+        batch.is_open = False
         
-        # Update project allocated weight
+        # Update project allocated weight (in SQL, so concurrent links all count)
         project.total_plastic_allocated_grams = (
-            (project.total_plastic_allocated_grams or 0) + float(batch.total_weight_grams)
+            func.coalesce(InfrastructureProject.total_plastic_allocated_grams, 0) + float(batch.total_weight_grams)
         )
+        from project_allocation import consume_material_requirement
+        consume_material_requirement(project.id, batch.material_type, float(batch.total_weight_grams))
         
         db.session.commit()
         
@@ -385,12 +400,14 @@ def link_batch_to_project(batch_id: str, project_id: str, verified_by: str = Non
         db.session.rollback()
         return False
 
-def update_top_contributors(project_id: int):
+def update_top_contributors(project_id: int, commit: bool = True):
     """
     Update top contributor flags for a project (top 10%)
     
     Args:
         project_id: Project database ID
+        commit: Commit when done; pass False to leave the caller's
+            unit of work open (errors are then re-raised)
     """
     try:
         # Get all contributors for this project
@@ -414,16 +431,20 @@ def update_top_contributors(project_id: int):
         top_contributors = contributors[:top_count]
         top_user_ids = [c.user_id for c in top_contributors]
         
-        # Update flags
-        ProjectContributor.query.join(WasteBatch).filter(
-            WasteBatch.linked_project_id == project_id
+        # Update flags (bulk UPDATE cannot join, so match the project's batches by subquery)
+        project_batch_ids = select(WasteBatch.id).where(WasteBatch.linked_project_id == project_id)
+        ProjectContributor.query.filter(
+            ProjectContributor.batch_id.in_(project_batch_ids)
         ).update({
             ProjectContributor.is_top_contributor: ProjectContributor.user_id.in_(top_user_ids)
         }, synchronize_session=False)
         
-        db.session.commit()
+        if commit:
+            db.session.commit()
         
     except Exception as e:
         logging.error(f"Error updating top contributors: {e}")
+        if not commit:
+            raise
         db.session.rollback()
 
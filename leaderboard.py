@@ -0,0 +1,319 @@
+"""
+Footprint Leaderboards
+Weekly and monthly leaderboards by scanned weight, city-wide or per city.
+
+Each leaderboard is a precomputed snapshot: one INSERT ... SELECT ranks the
+period's rollup rows with RANK()/ROW_NUMBER() and stores every user's
+position. Lookups are then index probes: a user's entry by (snapshot, user),
+a page or a user's neighbours by (snapshot, position).
+
+Snapshots for the current periods are rebuilt in the background by the
+'refresh_leaderboards' scheduler job (city-wide and every city, in chunks of
+cities) or by the refresh command; reads serve the stored snapshot as it is.
+A read only builds a board synchronously when it has no snapshot yet, and
+rebuilds a finished period once after it ends, after which it never changes.
+A board with no rollup rows (an unknown city, a period without scans) is
+served empty without storing a snapshot, so reads cannot add rows at will.
+
+Usage:
+    python leaderboard.py refresh [--period week] [--city Bengaluru]
+"""
+
+import argparse
+import logging
+import sys
+from datetime import date, datetime
+from sqlalchemy import func, literal, select
+from app import db
+from models import User, LeaderboardSnapshot, LeaderboardEntry
+from db_helpers import dialect_insert
+from footprint_updater import FOOTPRINT_ROLLUPS, get_period_start, shift_period_start
+
+LEADERBOARD_PERIODS = ('week', 'month')
+
+MAX_PAGE_SIZE = 100
+MAX_NEIGHBOURS = 25
+
+def normalize_city(city):
+    """Canonical form of a city name ('' for none)"""
+    return ' '.join((city or '').split()).title()
+
+def _is_fresh(snapshot, period):
+    """Check if a stored snapshot can be served without rebuilding"""
+    if snapshot.built_at is None:
+        return False
+    period_end = shift_period_start(period, snapshot.period_start, 1)
+    if snapshot.built_at.date() >= period_end:
+        return True  # Built after the period ended; it can no longer change
+    return date.today() < period_end  # Current period; the scheduler job keeps it up to date
+
+def refresh_leaderboard(period: str, period_start, city: str = '', force: bool = True):
+    """
+    Re-rank one leaderboard from the footprint rollups
+
+    The snapshot row is locked while it is rebuilt, so concurrent readers
+    wait for one rebuild instead of each running their own.
+
+    Args:
+        period: 'week' or 'month'
+        period_start: First day of the period
+        city: City name, or '' for all users
+        force: Rebuild even if another process has just refreshed it
+
+    Returns:
+        LeaderboardSnapshot instance
+    """
+    if period not in LEADERBOARD_PERIODS:
+        raise ValueError(f"period must be one of: {', '.join(LEADERBOARD_PERIODS)}")
+
+    try:
+        db.session.execute(
+            dialect_insert(LeaderboardSnapshot.__table__)
+            .values(period=period, period_start=period_start, city=city, entry_count=0)
+            .on_conflict_do_nothing(index_elements=['period', 'period_start', 'city'])
+        )
+        snapshot = LeaderboardSnapshot.query.filter_by(
+            period=period, period_start=period_start, city=city
+        ).with_for_update().populate_existing().one()
+
+        if not force and _is_fresh(snapshot, period):
+            db.session.commit()  # Rebuilt while we waited for the lock
+            return snapshot
+
+        model, key_column = FOOTPRINT_ROLLUPS[period]
+        weight = model.total_weight_grams
+        ranked = select(
+            literal(snapshot.id),
+            model.user_id,
+            func.row_number().over(order_by=(weight.desc(), model.user_id)),
+            func.rank().over(order_by=weight.desc()),
+            weight,
+            model.scan_count
+        ).where(getattr(model, key_column) == period_start, weight > 0)
+        if city:
+            ranked = ranked.join(User, User.id == model.user_id).where(User.city == city)
+
+        db.session.execute(LeaderboardEntry.__table__.delete().where(LeaderboardEntry.snapshot_id == snapshot.id))
+        result = db.session.execute(LeaderboardEntry.__table__.insert().from_select(
+            ['snapshot_id', 'user_id', 'position', 'rank', 'total_weight_grams', 'scan_count'],
+            ranked
+        ))
+
+        snapshot.entry_count = result.rowcount
+        snapshot.built_at = datetime.utcnow()
+        db.session.commit()
+        return snapshot
+    except Exception as e:
+        logging.error(f"Error refreshing {period} leaderboard for {period_start} city={city!r}: {e}")
+        db.session.rollback()
+        raise
+
+def _has_rollup_rows(period: str, period_start, city: str) -> bool:
+    """Check if a leaderboard would have any entries"""
+    model, key_column = FOOTPRINT_ROLLUPS[period]
+    query = db.session.query(model.user_id).filter(
+        getattr(model, key_column) == period_start,
+        model.total_weight_grams > 0
+    )
+    if city:
+        query = query.join(User, User.id == model.user_id).filter(User.city == city)
+    return db.session.query(query.exists()).scalar()
+
+def get_leaderboard_snapshot(period: str, period_start=None, city: str = None):
+    """
+    Get a leaderboard snapshot, rebuilding it first if it is stale
+
+    Args:
+        period: 'week' or 'month'
+        period_start: Any day in the period (default: today)
+        city: City name (default: all users)
+
+    Returns:
+        LeaderboardSnapshot instance; an unsaved, empty one (id None) if the
+        board has no snapshot and nothing to rank
+    """
+    if period not in LEADERBOARD_PERIODS:
+        raise ValueError(f"period must be one of: {', '.join(LEADERBOARD_PERIODS)}")
+
+    period_start = get_period_start(period, period_start or date.today())
+    city = normalize_city(city)
+
+    snapshot = LeaderboardSnapshot.query.filter_by(period=period, period_start=period_start, city=city).first()
+    if snapshot is not None and _is_fresh(snapshot, period):
+        return snapshot
+    if snapshot is None and not _has_rollup_rows(period, period_start, city):
+        return LeaderboardSnapshot(period=period, period_start=period_start, city=city, entry_count=0)
+
+    return refresh_leaderboard(period, period_start, city, force=False)
+
+def _entry_rows(snapshot_id, first_position, last_position):
+    """Entries with usernames for a position range, in order"""
+    if snapshot_id is None:
+        return []  # Empty board that was never stored
+    rows = db.session.query(
+        LeaderboardEntry.position,
+        LeaderboardEntry.rank,
+        LeaderboardEntry.user_id,
+        LeaderboardEntry.total_weight_grams,
+        LeaderboardEntry.scan_count,
+        User.username,
+        User.badge_level
+    ).join(User, User.id == LeaderboardEntry.user_id).filter(
+        LeaderboardEntry.snapshot_id == snapshot_id,
+        LeaderboardEntry.position.between(first_position, last_position)
+    ).order_by(LeaderboardEntry.position).all()
+
+    return [
+        {
+            'position': row.position,
+            'rank': row.rank,
+            'user_id': row.user_id,
+            'username': row.username,
+            'badge_level': row.badge_level or 'Bronze',
+            'total_weight_grams': float(row.total_weight_grams),
+            'scan_count': row.scan_count
+        }
+        for row in rows
+    ]
+
+def _board_info(snapshot):
+    return {
+        'period': snapshot.period,
+        'period_start': snapshot.period_start,
+        'city': snapshot.city or None,
+        'total_entries': snapshot.entry_count,
+        'built_at': snapshot.built_at
+    }
+
+def get_leaderboard_page(period: str, period_start=None, city: str = None, page: int = 1, per_page: int = 20):
+    """
+    Get one page of a leaderboard
+
+    Args:
+        period: 'week' or 'month'
+        period_start: Any day in the period (default: today)
+        city: City name (default: all users)
+        page: 1-based page number
+        per_page: Entries per page (at most MAX_PAGE_SIZE)
+
+    Returns:
+        Dictionary with board details, page, per_page and entries
+    """
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), MAX_PAGE_SIZE)
+    snapshot = get_leaderboard_snapshot(period, period_start, city)
+
+    first_position = (page - 1) * per_page + 1
+    return dict(
+        _board_info(snapshot),
+        page=page,
+        per_page=per_page,
+        entries=_entry_rows(snapshot.id, first_position, first_position + per_page - 1)
+    )
+
+def get_user_rank(user_id: int, period: str, period_start=None, city: str = None, neighbours: int = 2):
+    """
+    Get a user's place on a leaderboard and the users around them
+
+    Args:
+        user_id: User ID
+        period: 'week' or 'month'
+        period_start: Any day in the period (default: today)
+        city: City name (default: all users)
+        neighbours: Entries to include above and below the user
+
+    Returns:
+        Dictionary with board details, the user's entry (None if they have
+        no scans in the period) and the neighbouring entries including theirs
+    """
+    neighbours = min(max(neighbours, 0), MAX_NEIGHBOURS)
+    snapshot = get_leaderboard_snapshot(period, period_start, city)
+
+    position = None
+    if snapshot.id is not None:
+        position = db.session.query(LeaderboardEntry.position).filter_by(
+            snapshot_id=snapshot.id, user_id=user_id
+        ).scalar()
+
+    if position is None:
+        return dict(_board_info(snapshot), me=None, neighbours=[])
+
+    entries = _entry_rows(snapshot.id, position - neighbours, position + neighbours)
+    me = next(entry for entry in entries if entry['user_id'] == user_id)
+    return dict(_board_info(snapshot), me=me, neighbours=entries)
+
+def refresh_current_leaderboards(periods=LEADERBOARD_PERIODS, city: str = None):
+    """
+    Rebuild the current period's leaderboards (city-wide and every city)
+
+    Args:
+        periods: Periods to rebuild
+        city: Only rebuild this city's board (default: city-wide and all cities)
+
+    Returns:
+        Number of leaderboards rebuilt
+    """
+    if city is not None:
+        today = date.today()
+        for period in periods:
+            refresh_leaderboard(period, get_period_start(period, today), normalize_city(city))
+        return len(periods)
+
+    count, cursor = refresh_leaderboards_chunk(periods=periods)
+    while cursor is not None:
+        rebuilt, cursor = refresh_leaderboards_chunk(cursor, periods=periods)
+        count += rebuilt
+    return count
+
+def refresh_leaderboards_chunk(after_city: str = None, limit: int = 50, periods=LEADERBOARD_PERIODS):
+    """
+    Rebuild the current period's leaderboards for the next chunk of cities (the 'refresh_leaderboards' scheduler job)
+
+    Args:
+        after_city: Only cities after this one; None starts with the
+            city-wide board and the first cities
+        limit: Maximum number of cities
+        periods: Periods to rebuild
+
+    Returns:
+        Tuple of (leaderboards rebuilt, last city rebuilt, or None when done)
+    """
+    query = db.session.query(User.city).filter(User.city.isnot(None), User.city != '')
+    if after_city is not None:
+        query = query.filter(User.city > after_city)
+    cities = [c for (c,) in query.distinct().order_by(User.city).limit(limit)]
+
+    board_cities = ([''] if after_city is None else []) + cities
+    today = date.today()
+    count = 0
+    for board_city in board_cities:
+        for period in periods:
+            refresh_leaderboard(period, get_period_start(period, today), board_city)
+            count += 1
+    return count, (cities[-1] if len(cities) == limit else None)
+
+def main():
+    """Rebuild leaderboards from the command line"""
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Footprint leaderboard maintenance")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    refresh_parser = subparsers.add_parser('refresh', help="Rebuild the current period's leaderboards")
+    refresh_parser.add_argument('--period', choices=LEADERBOARD_PERIODS, default=None)
+    refresh_parser.add_argument('--city', default=None, help='Only rebuild this city')
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            periods = (args.period,) if args.period else LEADERBOARD_PERIODS
+            count = refresh_current_leaderboards(periods, args.city)
+            logging.info(f"Refreshed {count} leaderboards")
+        except Exception as e:
+            logging.error(f"Leaderboard refresh failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+"""
+Ledger Merkle Anchors
+Periodically anchors each project's ledger under a Merkle root so a single
+entry can be proven authentic with O(log n) hashes instead of replaying the
+whole chain.
+
+Leaves are the project's ProjectLedger entries in ID order. A leaf hashes
+the entry's stored fields (so any edit breaks its proof, whichever scheme
+produced its block_hash); inner nodes hash their two children. Leaf and
+inner hashes use different prefixes, and an unpaired last node is carried up
+a level unchanged rather than paired with itself.
+
+The 'anchor_ledger_roots' scheduler job builds a new root for every project
+with entries added since its last root. Root rows are kept as history; only
+the latest tree's nodes are stored.
+
+Usage:
+    python ledger_merkle.py anchor [--project proj_001]
+    python ledger_merkle.py proof 42
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import sys
+from sqlalchemy import and_, func, or_, select
+from app import db
+from models import ProjectLedger, LedgerMerkleRoot, LedgerMerkleNode
+
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+def ledger_leaf_hash(entry: ProjectLedger) -> str:
+    """
+    Leaf hash of a ledger entry
+
+    Args:
+        entry: ProjectLedger row
+
+    Returns:
+        SHA-256 hex digest
+    """
+    fields = {
+        'id': entry.id,
+        'project_id': entry.project_id,
+        'timestamp': entry.timestamp.isoformat() if entry.timestamp else None,
+        'status': entry.status,
+        'verified_by': entry.verified_by,
+        'batch_reference': entry.batch_reference,
+        'previous_hash': entry.previous_hash,
+        'block_hash': entry.block_hash,
+        'data': entry.data,
+        'canonical_data': entry.canonical_data.hex() if entry.canonical_data is not None else None
+    }
+    encoded = json.dumps(fields, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(LEAF_PREFIX + encoded.encode('utf-8')).hexdigest()
+
+def _parent_hash(left: str, right: str) -> str:
+    return hashlib.sha256(NODE_PREFIX + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+def build_merkle_levels(leaf_hashes):
+    """
+    Build every level of a Merkle tree
+
+    Args:
+        leaf_hashes: Leaf hashes in order (at least one)
+
+    Returns:
+        List of levels, leaves first and the root level (one hash) last
+    """
+    levels = [list(leaf_hashes)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_parent_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])  # Unpaired node moves up unchanged
+        levels.append(parents)
+    return levels
+
+def _level_widths(leaf_count: int):
+    widths = [leaf_count]
+    while widths[-1] > 1:
+        widths.append((widths[-1] + 1) // 2)
+    return widths
+
+def anchor_project_ledger(project_id: str):
+    """
+    Build and store a Merkle root over a project's whole ledger (committed)
+
+    Args:
+        project_id: Project UUID/ID
+
+    Returns:
+        The new LedgerMerkleRoot, or None if the project has no entries
+    """
+    entries = ProjectLedger.query.filter_by(project_id=project_id).order_by(ProjectLedger.id).all()
+    if not entries:
+        return None
+
+    levels = build_merkle_levels([ledger_leaf_hash(entry) for entry in entries])
+    root = LedgerMerkleRoot(
+        project_id=project_id,
+        root_hash=levels[-1][0],
+        leaf_count=len(entries),
+        last_entry_id=entries[-1].id
+    )
+
+    try:
+        db.session.add(root)
+        db.session.flush()
+
+        db.session.execute(LedgerMerkleNode.__table__.insert(), [
+            {
+                'root_id': root.id,
+                'level': level,
+                'position': position,
+                'node_hash': node_hash,
+                'entry_id': entries[position].id if level == 0 else None
+            }
+            for level, hashes in enumerate(levels)
+            for position, node_hash in enumerate(hashes)
+        ])
+
+        # Only the latest tree is kept for proofs
+        older_roots = select(LedgerMerkleRoot.id).where(
+            LedgerMerkleRoot.project_id == project_id,
+            LedgerMerkleRoot.id != root.id
+        )
+        LedgerMerkleNode.query.filter(
+            LedgerMerkleNode.root_id.in_(older_roots)
+        ).delete(synchronize_session=False)
+
+        db.session.commit()
+    except Exception as e:
+        logging.error(f"Error anchoring ledger for project {project_id}: {e}")
+        db.session.rollback()
+        raise
+
+    return root
+
+def projects_to_anchor(after_project_id: str = '', limit: int = 100):
+    """
+    Projects with ledger entries newer than their latest root
+
+    Args:
+        after_project_id: Only projects with a greater ID are returned
+        limit: Maximum number of projects
+
+    Returns:
+        List of project IDs in order
+    """
+    anchored = db.session.query(
+        LedgerMerkleRoot.project_id,
+        func.max(LedgerMerkleRoot.last_entry_id).label('last_entry_id')
+    ).group_by(LedgerMerkleRoot.project_id).subquery()
+
+    rows = db.session.query(ProjectLedger.project_id).outerjoin(
+        anchored, anchored.c.project_id == ProjectLedger.project_id
+    ).filter(
+        ProjectLedger.project_id > after_project_id,
+        ProjectLedger.id > func.coalesce(anchored.c.last_entry_id, 0)
+    ).distinct().order_by(ProjectLedger.project_id).limit(limit).all()
+
+    return [project_id for (project_id,) in rows]
+
+def anchor_ledger_roots(after_project_id: str = '', limit: int = 100):
+    """
+    Anchor every project with unanchored entries (the 'anchor_ledger_roots' scheduler job)
+
+    Args:
+        after_project_id: Only projects with a greater ID are anchored
+        limit: Maximum number of projects anchored
+
+    Returns:
+        Tuple of (projects anchored, last project ID anchored or None)
+    """
+    project_ids = projects_to_anchor(after_project_id, limit)
+    for project_id in project_ids:
+        anchor_project_ledger(project_id)
+    return len(project_ids), (project_ids[-1] if project_ids else None)
+
+def get_inclusion_proof(entry_id: int):
+    """
+    Sibling path proving a ledger entry is under its project's latest root
+
+    Reads one root, one leaf and at most log2(n) sibling nodes.
+
+    Args:
+        entry_id: ProjectLedger ID
+
+    Returns:
+        Dictionary with the root and path, or None if the entry does not
+        exist or has not been anchored yet
+    """
+    entry = db.session.get(ProjectLedger, entry_id)
+    if entry is None:
+        return None
+
+    root = LedgerMerkleRoot.query.filter(
+        LedgerMerkleRoot.project_id == entry.project_id,
+        LedgerMerkleRoot.last_entry_id >= entry.id
+    ).order_by(LedgerMerkleRoot.last_entry_id.desc(), LedgerMerkleRoot.id.desc()).first()
+    if root is None:
+        return None
+
+    leaf = LedgerMerkleNode.query.filter_by(root_id=root.id, entry_id=entry.id, level=0).first()
+    if leaf is None:
+        return None  # An older root; its nodes were replaced by a newer anchor
+
+    # Sibling position at each level (None where the node is carried up alone)
+    wanted = []
+    position = leaf.position
+    for level, width in enumerate(_level_widths(root.leaf_count)[:-1]):
+        sibling = position ^ 1
+        wanted.append((level, sibling if sibling < width else None))
+        position //= 2
+
+    pairs = [(level, sibling) for level, sibling in wanted if sibling is not None]
+    siblings = {}
+    if pairs:
+        siblings = {
+            (node.level, node.position): node.node_hash
+            for node in LedgerMerkleNode.query.filter(
+                LedgerMerkleNode.root_id == root.id,
+                or_(*[and_(LedgerMerkleNode.level == level, LedgerMerkleNode.position == sibling)
+                      for level, sibling in pairs])
+            )
+        }
+
+    return {
+        'entry_id': entry.id,
+        'project_id': entry.project_id,
+        'leaf_index': leaf.position,
+        'leaf_hash': leaf.node_hash,
+        'leaf_count': root.leaf_count,
+        'root_id': root.id,
+        'root_hash': root.root_hash,
+        'anchored_at': root.created_at.isoformat() if root.created_at else None,
+        'path': [
+            {'hash': siblings[(level, sibling)], 'side': 'left' if sibling < (sibling ^ 1) else 'right'}
+            for level, sibling in pairs
+        ]
+    }
+
+def verify_inclusion_proof(leaf_hash: str, proof) -> bool:
+    """
+    Check that a leaf hash folds up to the proof's root
+
+    Args:
+        leaf_hash: Leaf hash recomputed from the entry
+        proof: Dictionary from get_inclusion_proof()
+
+    Returns:
+        True if the path leads to root_hash
+    """
+    node_hash = leaf_hash
+    for step in proof['path']:
+        if step['side'] == 'left':
+            node_hash = _parent_hash(step['hash'], node_hash)
+        else:
+            node_hash = _parent_hash(node_hash, step['hash'])
+    return node_hash == proof['root_hash']
+
+def verify_ledger_entry(entry_id: int):
+    """
+    Verify one ledger entry
+
+    Anchored entries are checked against their Merkle proof. Entries newer
+    than the last anchor fall back to (checkpointed) chain verification.
+
+    Args:
+        entry_id: ProjectLedger ID
+
+    Returns:
+        Dictionary with is_valid, method and proof, or None if there is no such entry
+    """
+    entry = db.session.get(ProjectLedger, entry_id)
+    if entry is None:
+        return None
+
+    proof = get_inclusion_proof(entry_id)
+    if proof is not None:
+        return {
+            'entry_id': entry_id,
+            'method': 'merkle_proof',
+            'is_valid': verify_inclusion_proof(ledger_leaf_hash(entry), proof),
+            'proof': proof
+        }
+
+    from blockchain_tracker import verify_project_chain
+    return {
+        'entry_id': entry_id,
+        'method': 'chain',
+        'is_valid': verify_project_chain(entry.project_id),
+        'proof': None
+    }
+
+def main():
+    """Anchor ledgers or print inclusion proofs from the command line"""
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Project ledger Merkle anchors")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    anchor_parser = subparsers.add_parser('anchor', help='Anchor ledgers with unanchored entries')
+    anchor_parser.add_argument('--project', default=None, help='Anchor one project now')
+
+    proof_parser = subparsers.add_parser('proof', help='Print and check an entry\'s inclusion proof')
+    proof_parser.add_argument('entry_id', type=int)
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.command == 'anchor':
+                if args.project:
+                    root = anchor_project_ledger(args.project)
+                    logging.info(f"Anchored {args.project}: {root.root_hash if root else 'no entries'}")
+                else:
+                    total, cursor = anchor_ledger_roots()
+                    while cursor is not None:
+                        anchored, cursor = anchor_ledger_roots(cursor)
+                        total += anchored
+                    logging.info(f"Anchored {total} project ledgers")
+            elif args.command == 'proof':
+                result = verify_ledger_entry(args.entry_id)
+                if result is None:
+                    logging.error(f"Ledger entry {args.entry_id} not found")
+                    sys.exit(1)
+                print(json.dumps(result, indent=2))
+                if not result['is_valid']:
+                    sys.exit(1)
+        except Exception as e:
+            logging.error(f"Ledger anchor command failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
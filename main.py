@@ -28,6 +28,26 @@ register_routes(app)
 from localization_helper import init_app
 init_app(app)
 
+# Warm the reference data cache (material weights, achievements, drop locations)
+with app.app_context():
+    try:
+        from reference_cache import load_reference_data
+        load_reference_data()
+    except Exception as e:
+        import logging
+        logging.warning(f"Reference data cache not loaded at startup: {e}")
+    finally:
+        from app import db
+        db.session.remove()
+
+# Start assigning queued uploads to waste batches in the background
+from batch_coalescer import start_batch_coalescer
+start_batch_coalescer(app)
+
+# Start the periodic maintenance job scheduler (one process runs each job)
+from scheduler import start_scheduler
+start_scheduler(app)
+
 # Global error handler for better debugging
 @app.errorhandler(Exception)
 def handle_all_exceptions(e):
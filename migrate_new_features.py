@@ -3,9 +3,11 @@ Migration script for new ReGenWorks features
 Works with both SQLite and PostgreSQL
 """
 
+import json
 import os
 import sys
 import logging
+from datetime import datetime, timedelta
 from app import app, db
 from sqlalchemy import text, inspect
 
@@ -58,6 +60,16 @@ def add_column_postgres(conn, table_name, column_name, column_type, default_valu
         logger.error(f"[ERROR] Error adding column '{column_name}' to '{table_name}': {e}")
         return False
 
+def create_index(conn, index_name, table_name, columns):
+    """Create an index if it does not exist (supported by both SQLite and PostgreSQL)"""
+    try:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns})'))
+        logger.info(f"[OK] Index '{index_name}' on '{table_name}' is present")
+        return True
+    except Exception as e:
+        logger.error(f"[ERROR] Error creating index '{index_name}' on '{table_name}': {e}")
+        return False
+
 def is_sqlite():
     """Check if database is SQLite"""
     return db.engine.url.drivername == 'sqlite'
@@ -72,11 +84,17 @@ def migrate_user_table():
             add_column_sqlite(conn, 'user', 'voice_input_enabled', 'BOOLEAN', '1')
             add_column_sqlite(conn, 'user', 'onboarding_completed', 'BOOLEAN', '0')
             add_column_sqlite(conn, 'user', 'badge_level', 'VARCHAR(20)', "'Bronze'")
+            add_column_sqlite(conn, 'user', 'lifetime_weight_grams', 'REAL', '0')
+            add_column_sqlite(conn, 'user', 'city', 'VARCHAR(100)', 'NULL')
         else:
             add_column_postgres(conn, 'user', 'preferred_language', 'VARCHAR(10)', "'en'")
             add_column_postgres(conn, 'user', 'voice_input_enabled', 'BOOLEAN', 'TRUE')
             add_column_postgres(conn, 'user', 'onboarding_completed', 'BOOLEAN', 'FALSE')
             add_column_postgres(conn, 'user', 'badge_level', 'VARCHAR(20)', "'Bronze'")
+            add_column_postgres(conn, 'user', 'lifetime_weight_grams', 'NUMERIC(14,2)', '0')
+            add_column_postgres(conn, 'user', 'city', 'VARCHAR(100)', 'NULL')
+        
+        create_index(conn, 'ix_user_city', '"user"', 'city')
 
 def migrate_waste_item_table():
     """Add new columns to waste_item table"""
@@ -87,10 +105,20 @@ def migrate_waste_item_table():
             add_column_sqlite(conn, 'waste_item', 'material_type', 'VARCHAR(50)', 'NULL')
             add_column_sqlite(conn, 'waste_item', 'estimated_weight_grams', 'REAL', 'NULL')
             add_column_sqlite(conn, 'waste_item', 'ml_confidence_score', 'REAL', 'NULL')
+            add_column_sqlite(conn, 'waste_item', 'co2e_grams', 'REAL', 'NULL')
+            add_column_sqlite(conn, 'waste_item', 'disposal_method', 'VARCHAR(20)', 'NULL')
+            add_column_sqlite(conn, 'waste_item', 'emission_factor_version', 'INTEGER', 'NULL')
         else:
             add_column_postgres(conn, 'waste_item', 'material_type', 'VARCHAR(50)', 'NULL')
             add_column_postgres(conn, 'waste_item', 'estimated_weight_grams', 'NUMERIC(10,2)', 'NULL')
             add_column_postgres(conn, 'waste_item', 'ml_confidence_score', 'NUMERIC(5,2)', 'NULL')
+            add_column_postgres(conn, 'waste_item', 'co2e_grams', 'NUMERIC(12,2)', 'NULL')
+            add_column_postgres(conn, 'waste_item', 'disposal_method', 'VARCHAR(20)', 'NULL')
+            add_column_postgres(conn, 'waste_item', 'emission_factor_version', 'INTEGER', 'NULL')
+        
+        create_index(conn, 'ix_waste_item_co2e_grams', 'waste_item', 'co2e_grams')
+        create_index(conn, 'ix_waste_item_disposal_method', 'waste_item', 'disposal_method')
+        create_index(conn, 'ix_waste_item_emission_factor_version', 'waste_item', 'emission_factor_version')
 
 def create_new_tables():
     """Create all new tables for the features"""
@@ -101,12 +129,33 @@ def create_new_tables():
         from models import (
             UserPlasticFootprintMonthly,
             PlasticFootprintScan,
+            FootprintDailyRollup,
+            FootprintWeeklyRollup,
+            FootprintMonthlyRollup,
+            FootprintDashboardSnapshot,
             MaterialWeightLookup,
             LocalizationString,
             InfrastructureProject,
             WasteBatch,
             ProjectContributor,
-            ProjectLedger
+            ProjectLedger,
+            GeminiResponseArchive,
+            CarbonUserRollup,
+            CarbonCityRollup,
+            EmissionFactorSet,
+            EmissionFactor,
+            EmissionFactorVersionTotal,
+            ReferenceDataVersion,
+            ScanRetentionRun,
+            LeaderboardSnapshot,
+            LeaderboardEntry,
+            BatchAssignmentQueue,
+            ProjectMaterialRequirement,
+            WasteBatchItem,
+            ScheduledJob,
+            ChainCheckpoint,
+            LedgerMerkleRoot,
+            LedgerMerkleNode
         )
         
         # Create all tables
@@ -208,6 +257,8 @@ def seed_initial_data():
             
             for item in weight_data:
                 db.session.add(item)
+            from reference_cache import bump_reference_data_version
+            bump_reference_data_version('material_weights')
             db.session.commit()
             logger.info(f"[OK] Material weight lookup data seeded ({len(weight_data)} items)")
         else:
@@ -262,12 +313,255 @@ def seed_initial_data():
             logger.info("[OK] Localization strings seeded")
         else:
             logger.info("[SKIP] Localization strings already exist")
+        
+        # Store the built-in carbon emission factors as version 1
+        from emission_factors import seed_default_factor_set
+        if seed_default_factor_set():
+            logger.info("[OK] Seeded emission factor set v1")
+        else:
+            logger.info("[SKIP] Emission factor sets already exist")
             
     except Exception as e:
         logger.error(f"[ERROR] Error seeding data: {e}")
         db.session.rollback()
         raise
 
+def backfill_lifetime_totals():
+    """Fill user.lifetime_weight_grams and the footprint rollups from existing data"""
+    logger.info("Backfilling lifetime footprint totals...")
+    
+    from footprint_updater import recalculate_lifetime_totals
+    count = recalculate_lifetime_totals()
+    logger.info(f"[OK] Lifetime totals set for {count} users")
+    
+    from models import FootprintDailyRollup
+    from footprint_updater import rebuild_footprint_rollups
+    if FootprintDailyRollup.query.first() is None:
+        counts = rebuild_footprint_rollups()
+        logger.info(f"[OK] Footprint rollups built: {counts}")
+    else:
+        logger.info("[SKIP] Footprint rollups already exist")
+
+def migrate_scan_storage():
+    """Index footprint scans by time and, on PostgreSQL, partition them by month"""
+    logger.info("Migrating plastic_footprint_scan storage...")
+    
+    from scan_retention import create_scan_indexes, partition_scan_table, ensure_scan_partitions
+    
+    with db.engine.begin() as conn:
+        if is_sqlite():
+            create_index(conn, 'ix_plastic_footprint_scan_user_timestamp', 'plastic_footprint_scan', 'user_id, timestamp')
+            create_index(conn, 'ix_plastic_footprint_scan_timestamp', 'plastic_footprint_scan', 'timestamp')
+    
+    if not is_sqlite():
+        if partition_scan_table():
+            logger.info("[OK] plastic_footprint_scan partitioned by month")
+        else:
+            create_scan_indexes()
+            db.session.commit()
+            ensure_scan_partitions()
+            logger.info("[SKIP] plastic_footprint_scan already partitioned")
+
+def migrate_project_contributors():
+    """Merge duplicate contributor rows and make (user_id, batch_id) unique"""
+    logger.info("Migrating project_contributor...")
+    
+    with db.engine.begin() as conn:
+        # Keep the oldest row of each (user, batch) pair with the summed weight
+        merged = conn.execute(text("""
+            UPDATE project_contributor
+            SET contribution_weight_grams = (
+                SELECT SUM(pc.contribution_weight_grams) FROM project_contributor pc
+                WHERE pc.user_id = project_contributor.user_id AND pc.batch_id = project_contributor.batch_id
+            )
+            WHERE id IN (
+                SELECT MIN(id) FROM project_contributor
+                GROUP BY user_id, batch_id HAVING COUNT(*) > 1
+            )
+        """)).rowcount
+        conn.execute(text("""
+            DELETE FROM project_contributor
+            WHERE id NOT IN (SELECT MIN(id) FROM project_contributor GROUP BY user_id, batch_id)
+        """))
+        if merged:
+            logger.info(f"[OK] Merged duplicate contributor rows for {merged} user/batch pairs")
+        
+        conn.execute(text(
+            'CREATE UNIQUE INDEX IF NOT EXISTS unique_project_contributor ON project_contributor (user_id, batch_id)'
+        ))
+        logger.info("[OK] Index 'unique_project_contributor' on 'project_contributor' is present")
+
+def migrate_open_batches():
+    """Mark each material's current batch as open and allow only one per material"""
+    logger.info("Migrating waste_batch open batches...")
+    
+    from auto_batch_creator import OPEN_BATCH_WINDOW_DAYS
+    
+    with db.engine.begin() as conn:
+        if is_sqlite():
+            add_column_sqlite(conn, 'waste_batch', 'is_open', 'BOOLEAN NOT NULL', '0')
+        else:
+            add_column_postgres(conn, 'waste_batch', 'is_open', 'BOOLEAN NOT NULL', 'FALSE')
+        
+        # The newest unlinked batch in the collection window keeps accepting items
+        opened = conn.execute(text("""
+            UPDATE waste_batch SET is_open = :open
+            WHERE id IN (
+                SELECT MAX(id) FROM waste_batch
+                WHERE status = 'collected' AND linked_project_id IS NULL AND collection_date >= :cutoff
+                GROUP BY material_type
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM waste_batch open_batch
+                WHERE open_batch.material_type = waste_batch.material_type AND open_batch.is_open = :open
+            )
+        """), {'open': True, 'cutoff': datetime.utcnow() - timedelta(days=OPEN_BATCH_WINDOW_DAYS)}).rowcount
+        if opened:
+            logger.info(f"[OK] Opened {opened} batches")
+        
+        conn.execute(text(
+            'CREATE UNIQUE INDEX IF NOT EXISTS uq_waste_batch_open_material ON waste_batch (material_type) WHERE is_open'
+        ))
+        logger.info("[OK] Index 'uq_waste_batch_open_material' on 'waste_batch' is present")
+
+def migrate_project_allocation():
+    """Add project deadlines and batch drop points, and give projects material requirements"""
+    logger.info("Migrating project material allocation...")
+    
+    with db.engine.begin() as conn:
+        if is_sqlite():
+            add_column_sqlite(conn, 'infrastructure_project', 'deadline', 'DATE', 'NULL')
+            add_column_sqlite(conn, 'waste_batch', 'drop_location_id', 'INTEGER REFERENCES drop_location(id)', 'NULL')
+        else:
+            add_column_postgres(conn, 'infrastructure_project', 'deadline', 'DATE', 'NULL')
+            add_column_postgres(conn, 'waste_batch', 'drop_location_id', 'INTEGER REFERENCES drop_location(id)', 'NULL')
+    
+    from project_allocation import backfill_material_requirements
+    count = backfill_material_requirements()
+    logger.info(f"[OK] Created {count} 'Any' material requirements from project totals")
+
+def migrate_journey_indexes():
+    """Index ledger entries by project and batch for material journeys"""
+    logger.info("Migrating material journey indexes...")
+    
+    with db.engine.begin() as conn:
+        create_index(conn, 'ix_project_ledger_project_batch', 'project_ledger', 'project_id, batch_reference')
+
+def migrate_journey_blocks():
+    """Add the hash scheme and proof-of-work columns to journey blocks"""
+    logger.info("Migrating waste journey blocks...")
+    
+    # Existing blocks keep hash_scheme NULL and are verified with the original scheme
+    with db.engine.begin() as conn:
+        if is_sqlite():
+            add_column_sqlite(conn, 'waste_journey_block', 'hash_scheme', 'VARCHAR(20)', 'NULL')
+            add_column_sqlite(conn, 'waste_journey_block', 'pow_difficulty', 'INTEGER', 'NULL')
+        else:
+            add_column_postgres(conn, 'waste_journey_block', 'hash_scheme', 'VARCHAR(20)', 'NULL')
+            add_column_postgres(conn, 'waste_journey_block', 'pow_difficulty', 'INTEGER', 'NULL')
+        create_index(conn, 'ix_waste_journey_block_item_time', 'waste_journey_block', 'waste_item_id, timestamp')
+
+def migrate_ledger_sequence():
+    """Number each project's ledger entries and make (project_id, seq) unique"""
+    logger.info("Migrating project_ledger sequence numbers...")
+    
+    with db.engine.begin() as conn:
+        if is_sqlite():
+            add_column_sqlite(conn, 'project_ledger', 'seq', 'INTEGER', 'NULL')
+        else:
+            add_column_postgres(conn, 'project_ledger', 'seq', 'INTEGER', 'NULL')
+        
+        # Existing entries follow their timestamp order, after any numbered ones
+        numbered = conn.execute(text("""
+            UPDATE project_ledger
+            SET seq = (
+                SELECT r.seq FROM (
+                    SELECT pl.id,
+                           ROW_NUMBER() OVER (PARTITION BY pl.project_id ORDER BY pl.timestamp, pl.id)
+                           + COALESCE((SELECT MAX(p2.seq) FROM project_ledger p2 WHERE p2.project_id = pl.project_id), 0) AS seq
+                    FROM project_ledger pl
+                    WHERE pl.seq IS NULL
+                ) r
+                WHERE r.id = project_ledger.id
+            )
+            WHERE seq IS NULL
+        """)).rowcount
+        if numbered:
+            logger.info(f"[OK] Numbered {numbered} existing ledger entries")
+        
+        conn.execute(text(
+            'CREATE UNIQUE INDEX IF NOT EXISTS unique_project_ledger_seq ON project_ledger (project_id, seq)'
+        ))
+        logger.info("[OK] Index 'unique_project_ledger_seq' on 'project_ledger' is present")
+
+def migrate_ledger_payloads(chunk_size=500):
+    """Store ledger data as native JSON (JSONB on PostgreSQL) with its canonical hash bytes"""
+    logger.info("Migrating project_ledger payloads...")
+    from sqlalchemy import bindparam, select
+    from models import ProjectLedger
+    from blockchain_tracker import canonical_block_bytes
+    
+    with db.engine.begin() as conn:
+        if is_sqlite():
+            add_column_sqlite(conn, 'project_ledger', 'canonical_data', 'BLOB', 'NULL')
+        else:
+            add_column_postgres(conn, 'project_ledger', 'canonical_data', 'BYTEA', 'NULL')
+    
+    # Older rows hold json.dumps() output inside the JSON column; unwrap them
+    table = ProjectLedger.__table__
+    update = table.update().where(table.c.id == bindparam('b_id')).values(
+        data=bindparam('b_data'),
+        canonical_data=bindparam('b_canonical')
+    )
+    converted, last_id = 0, 0
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.execute(select(table.c.id, table.c.data).where(
+                table.c.id > last_id,
+                table.c.canonical_data.is_(None)
+            ).order_by(table.c.id).limit(chunk_size)).all()
+            if not rows:
+                break
+            
+            params = []
+            for row in rows:
+                data = row.data
+                if isinstance(data, str):
+                    try:
+                        data = json.loads(data)
+                    except ValueError:
+                        pass  # A plain string payload; keep it as is
+                params.append({
+                    'b_id': row.id,
+                    'b_data': data,
+                    'b_canonical': canonical_block_bytes(data if data is not None else {})
+                })
+            conn.execute(update, params)
+            converted += len(rows)
+            last_id = rows[-1].id
+    
+    with db.engine.begin() as conn:
+        if not is_sqlite():
+            conn.execute(text('ALTER TABLE project_ledger ALTER COLUMN data TYPE JSONB USING data::jsonb'))
+            logger.info("[OK] project_ledger.data is JSONB")
+        
+        if converted:
+            # Leaf hashes cover the payload, so existing Merkle trees are rebuilt by the next anchor run
+            conn.execute(text('DELETE FROM ledger_merkle_node'))
+            conn.execute(text('DELETE FROM ledger_merkle_root'))
+            logger.info(f"[OK] Converted {converted} ledger payloads; Merkle roots will be re-anchored")
+
+def migrate_version_totals():
+    """Add the snapshot kind to per-version carbon totals"""
+    logger.info("Migrating emission_factor_version_total...")
+    
+    # Existing snapshots were taken when items arrived or first left a version
+    with db.engine.begin() as conn:
+        if is_sqlite():
+            add_column_sqlite(conn, 'emission_factor_version_total', 'snapshot_kind', 'VARCHAR(20)', "'current'")
+        else:
+            add_column_postgres(conn, 'emission_factor_version_total', 'snapshot_kind', 'VARCHAR(20)', "'current'")
+
 def main():
     """Run all migrations"""
     logger.info("Starting ReGenWorks feature migration...")
@@ -283,6 +577,36 @@ def main():
             # Step 2: Create new tables
             create_new_tables()
             
+            # Step 3: Backfill running totals
+            backfill_lifetime_totals()
+            
+            # Step 4: Partition and index footprint scans
+            migrate_scan_storage()
+            
+            # Step 5: One contributor row per user and batch
+            migrate_project_contributors()
+            
+            # Step 6: One open batch per material
+            migrate_open_batches()
+            
+            # Step 7: Per-material project requirements
+            migrate_project_allocation()
+            
+            # Step 8: Material journey lookups
+            migrate_journey_indexes()
+            
+            # Step 9: Journey block hash schemes
+            migrate_journey_blocks()
+            
+            # Step 10: Per-project ledger sequence numbers
+            migrate_ledger_sequence()
+            
+            # Step 11: Native JSON ledger payloads
+            migrate_ledger_payloads()
+            
+            # Step 12: Carbon version snapshot kinds
+            migrate_version_totals()
+            
             logger.info("Migration completed successfully!")
             
     except Exception as e:
@@ -1,6 +1,8 @@
 from datetime import datetime
 import hashlib
 import json
+import zlib
+from sqlalchemy.dialects.postgresql import JSONB
 from app import db, bcrypt
 from flask_login import UserMixin
 
@@ -25,6 +27,8 @@ class User(UserMixin, db.Model):
     
     # Plastic Footprint Tracker
     badge_level = db.Column(db.String(20), default='Bronze')  # Bronze, Silver, Gold, Champion
+    lifetime_weight_grams = db.Column(db.Numeric(14, 2), default=0)  # Running total of footprint scans
+    city = db.Column(db.String(100), nullable=True, index=True)  # For city leaderboards
     
     # Relationships
     waste_items = db.relationship('WasteItem', backref='user', lazy=True)
@@ -95,6 +99,11 @@ class WasteItem(db.Model):
     estimated_weight_grams = db.Column(db.Numeric(10, 2), nullable=True)
     ml_confidence_score = db.Column(db.Numeric(5, 2), nullable=True)
     
+    # Carbon emissions persisted at write time (negative co2e = carbon saved)
+    co2e_grams = db.Column(db.Numeric(12, 2), nullable=True, index=True)
+    disposal_method = db.Column(db.String(20), nullable=True, index=True)  # landfill, incineration, recycling
+    emission_factor_version = db.Column(db.Integer, nullable=True, index=True)
+    
     @property
     def material_detection(self):
         """Getter: Deserialize JSON string to Python dictionary"""
@@ -169,10 +178,18 @@ class Reward(db.Model):
         return f"<Reward {self.id}: {self.points} points for {self.reward_type}>"
 
 
+# Hash scheme of new journey blocks (rows without one use the original scheme)
+JOURNEY_HASH_SCHEME = 'v2'
+
 class WasteJourneyBlock(db.Model):
     """
     A block in the blockchain-like waste tracking system.
     Each block represents a stage in the waste item's journey from drop-off to recycling.
+    
+    Blocks with hash_scheme 'v2' hash a canonical encoding of their fields,
+    including an explicit timestamp set on creation. Proof of work is an
+    optional seal over the finished block hash (nonce / pow_difficulty), so
+    mining never changes the chain link.
     """
     id = db.Column(db.Integer, primary_key=True)
     waste_item_id = db.Column(db.Integer, db.ForeignKey('waste_item.id'), nullable=False)
@@ -188,11 +205,17 @@ class WasteJourneyBlock(db.Model):
     previous_hash = db.Column(db.String(64), nullable=True)  # Hash of the previous block
     block_hash = db.Column(db.String(64), nullable=False)  # Hash of this block
     nonce = db.Column(db.Integer, default=0)  # For proof of work simulation
+    hash_scheme = db.Column(db.String(20), nullable=True)  # None = original scheme
+    pow_difficulty = db.Column(db.Integer, nullable=True)  # Set once the block is mined
     
     # Relationships
     waste_item = db.relationship('WasteItem', backref='journey_blocks', lazy=True)
     
-    def __init__(self, waste_item_id, stage, location, details, verified_by, previous_hash=None):
+    __table_args__ = (
+        db.Index('ix_waste_journey_block_item_time', 'waste_item_id', 'timestamp'),
+    )
+    
+    def __init__(self, waste_item_id, stage, location, details, verified_by, previous_hash=None, timestamp=None):
         self.waste_item_id = waste_item_id
         self.stage = stage
         self.location = location
@@ -200,15 +223,32 @@ class WasteJourneyBlock(db.Model):
         self.verified_by = verified_by
         self.previous_hash = previous_hash
         self.nonce = 0
+        self.hash_scheme = JOURNEY_HASH_SCHEME
+        
+        # The timestamp is part of the hash, so it is set here rather than by the column default
+        self.timestamp = timestamp or datetime.utcnow()
         
         # Calculate block hash on creation
         self.block_hash = self.calculate_hash()
     
-    def calculate_hash(self):
-        """Calculate the hash of this block based on its contents"""
+    def canonical_bytes(self):
+        """Canonical encoding of the block's fields (sorted keys, no whitespace, UTF-8)"""
         block_data = {
             'waste_item_id': self.waste_item_id,
-            'timestamp': str(self.timestamp),
+            'timestamp': self.timestamp.isoformat(timespec='microseconds'),
+            'stage': self.stage,
+            'location': self.location,
+            'details': self.details,
+            'verified_by': self.verified_by,
+            'previous_hash': self.previous_hash
+        }
+        return json.dumps(block_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    
+    def _legacy_hash(self, timestamp_text):
+        """Hash used by blocks created before hash_scheme existed"""
+        block_data = {
+            'waste_item_id': self.waste_item_id,
+            'timestamp': timestamp_text,
             'stage': self.stage,
             'location': self.location,
             'details': self.details,
@@ -221,19 +261,40 @@ class WasteJourneyBlock(db.Model):
         block_string = json.dumps(block_data, sort_keys=True)
         return hashlib.sha256(block_string.encode()).hexdigest()
     
+    def calculate_hash(self):
+        """Calculate the hash of this block based on its contents"""
+        if self.hash_scheme is None:
+            return self._legacy_hash(str(self.timestamp))
+        return hashlib.sha256(self.canonical_bytes()).hexdigest()
+    
+    def proof_hash(self, nonce=None):
+        """Proof-of-work hash sealing this block's hash with a nonce"""
+        nonce = self.nonce if nonce is None else nonce
+        return hashlib.sha256(f"{self.block_hash}:{nonce}".encode()).hexdigest()
+    
     def mine_block(self, difficulty=2):
-        """Simulate proof of work by finding a hash with leading zeros"""
+        """Find a nonce whose proof hash has `difficulty` leading zeros (block_hash is unchanged)"""
         target = '0' * difficulty
+        nonce = 0
+        while not self.proof_hash(nonce).startswith(target):
+            nonce += 1
         
-        while self.block_hash[:difficulty] != target:
-            self.nonce += 1
-            self.block_hash = self.calculate_hash()
-        
-        return self.block_hash
+        self.nonce = nonce
+        self.pow_difficulty = difficulty
+        return self.proof_hash()
+    
+    def has_valid_proof(self):
+        """True if the block is unmined or its proof of work checks out"""
+        if self.hash_scheme is None or not self.pow_difficulty:
+            return True
+        return self.proof_hash().startswith('0' * self.pow_difficulty)
     
     def is_valid(self):
         """Verify that the block's hash is valid"""
-        return self.block_hash == self.calculate_hash()
+        if self.block_hash == self.calculate_hash():
+            return True
+        # Original-scheme blocks were hashed before the timestamp default was applied
+        return self.hash_scheme is None and self.block_hash == self._legacy_hash('None')
     
     def __repr__(self):
         return f"<WasteJourneyBlock {self.id}: {self.stage} for waste_item_id={self.waste_item_id}>"
@@ -303,13 +364,140 @@ class PlasticFootprintScan(db.Model):
     estimated_weight_grams = db.Column(db.Numeric(10, 2), nullable=False)
     ml_confidence_score = db.Column(db.Numeric(5, 2), nullable=True)
     manual_override = db.Column(db.Boolean, default=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)  # Partition key on PostgreSQL
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_plastic_footprint_scan_user_timestamp', 'user_id', 'timestamp'),
+        # BRIN on PostgreSQL (rows arrive in time order); a plain index on SQLite
+        db.Index('ix_plastic_footprint_scan_timestamp', 'timestamp', postgresql_using='brin'),
+    )
+    
     def __repr__(self):
         return f"<PlasticFootprintScan id={self.id} user_id={self.user_id}>"
 
 
+class FootprintDailyRollup(db.Model):
+    """Per-user scanned weight for one calendar day, updated with each scan"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    total_weight_grams = db.Column(db.Numeric(12, 2), default=0)
+    scan_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', name='unique_footprint_daily_rollup'),)
+    
+    def __repr__(self):
+        return f"<FootprintDailyRollup user_id={self.user_id} day={self.day}>"
+
+
+class FootprintWeeklyRollup(db.Model):
+    """Per-user scanned weight for one week (starting Monday), updated with each scan"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    week_start = db.Column(db.Date, nullable=False)  # Monday
+    total_weight_grams = db.Column(db.Numeric(12, 2), default=0)
+    scan_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'week_start', name='unique_footprint_weekly_rollup'),)
+    
+    def __repr__(self):
+        return f"<FootprintWeeklyRollup user_id={self.user_id} week_start={self.week_start}>"
+
+
+class FootprintMonthlyRollup(db.Model):
+    """Per-user scanned weight for one calendar month, updated with each scan"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    month_start = db.Column(db.Date, nullable=False)  # First day of month
+    total_weight_grams = db.Column(db.Numeric(12, 2), default=0)
+    scan_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'month_start', name='unique_footprint_monthly_rollup'),)
+    
+    def __repr__(self):
+        return f"<FootprintMonthlyRollup user_id={self.user_id} month_start={self.month_start}>"
+
+
+class FootprintDashboardSnapshot(db.Model):
+    """Precomputed footprint dashboard data per user, invalidated on every scan write"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), unique=True, nullable=False)
+    generation = db.Column(db.Integer, nullable=False, default=0)  # Bumped by every invalidation
+    _payload = db.Column('payload', db.Text, nullable=True)  # JSON; NULL when invalidated
+    built_for = db.Column(db.Date, nullable=True)  # Day the snapshot is valid for (current week/month depend on it)
+    built_at = db.Column(db.DateTime, nullable=True)
+    
+    @property
+    def payload(self):
+        """Getter: Deserialize JSON string to Python dictionary"""
+        return json.loads(self._payload) if self._payload else None
+    
+    @payload.setter
+    def payload(self, value):
+        """Setter: Serialize Python dictionary to JSON string"""
+        self._payload = json.dumps(value) if value is not None else None
+    
+    def __repr__(self):
+        return f"<FootprintDashboardSnapshot user_id={self.user_id} built_for={self.built_for}>"
+
+
+class ScanRetentionRun(db.Model):
+    """One run of the scan retention job; the latest pruned_before is the retention watermark"""
+    id = db.Column(db.Integer, primary_key=True)
+    pruned_before = db.Column(db.Date, nullable=False, index=True)  # Scans before this day were folded and removed
+    retention_months = db.Column(db.Integer, nullable=False)
+    scans_pruned = db.Column(db.Integer, default=0)
+    partitions_dropped = db.Column(db.Integer, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<ScanRetentionRun pruned_before={self.pruned_before}>"
+
+
+class LeaderboardSnapshot(db.Model):
+    """A ranked footprint leaderboard for one period (and optionally one city)"""
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(10), nullable=False)  # week, month
+    period_start = db.Column(db.Date, nullable=False)
+    city = db.Column(db.String(100), nullable=False, default='')  # '' = all users
+    entry_count = db.Column(db.Integer, default=0)
+    built_at = db.Column(db.DateTime, nullable=True)  # NULL until first built
+    
+    # Relationships
+    entries = db.relationship('LeaderboardEntry', backref='snapshot', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.UniqueConstraint('period', 'period_start', 'city', name='unique_leaderboard_snapshot'),
+    )
+    
+    def __repr__(self):
+        return f"<LeaderboardSnapshot {self.period}={self.period_start} city={self.city!r}>"
+
+
+class LeaderboardEntry(db.Model):
+    """One user's precomputed place on a leaderboard snapshot"""
+    id = db.Column(db.Integer, primary_key=True)
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('leaderboard_snapshot.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)  # 1..n, ties broken by user id
+    rank = db.Column(db.Integer, nullable=False)  # Competition rank; ties share a rank
+    total_weight_grams = db.Column(db.Numeric(12, 2), nullable=False)
+    scan_count = db.Column(db.Integer, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('snapshot_id', 'position', name='unique_leaderboard_position'),
+        db.UniqueConstraint('snapshot_id', 'user_id', name='unique_leaderboard_user'),
+    )
+    
+    def __repr__(self):
+        return f"<LeaderboardEntry snapshot={self.snapshot_id} #{self.position} user={self.user_id}>"
+
+
 class MaterialWeightLookup(db.Model):
     """ML model weight estimation lookup table"""
     id = db.Column(db.Integer, primary_key=True)
@@ -364,16 +552,39 @@ class InfrastructureProject(db.Model):
     total_plastic_required_grams = db.Column(db.Numeric(12, 2), nullable=True)  # Total weight required (all material types)
     total_plastic_allocated_grams = db.Column(db.Numeric(12, 2), default=0)  # Total weight allocated (all material types)
     project_type = db.Column(db.String(50), nullable=True)  # bench, pavement_tile, planter, etc.
+    deadline = db.Column(db.Date, nullable=True)  # Material needed by; earlier deadlines are allocated first
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     batches = db.relationship('WasteBatch', backref='project', lazy=True)
+    material_requirements = db.relationship('ProjectMaterialRequirement', backref='project', lazy=True,
+                                            cascade='all, delete-orphan')
     
     def __repr__(self):
         return f"<InfrastructureProject project_id={self.project_id} status={self.status}>"
 
 
+class ProjectMaterialRequirement(db.Model):
+    """Weight of one material a project still needs ('Any' accepts every material)"""
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('infrastructure_project.id', ondelete='CASCADE'), nullable=False)
+    material_type = db.Column(db.String(50), nullable=False)
+    required_grams = db.Column(db.Numeric(12, 2), nullable=False)
+    allocated_grams = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    remaining_grams = db.Column(db.Numeric(12, 2), nullable=False)  # required - allocated, kept in step on every allocation
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('project_id', 'material_type', name='unique_project_material'),
+        db.Index('ix_project_material_requirement_capacity', 'material_type', 'remaining_grams'),
+    )
+    
+    def __repr__(self):
+        return f"<ProjectMaterialRequirement project={self.project_id} {self.material_type} remaining={self.remaining_grams}>"
+
+
 class WasteBatch(db.Model):
     """Batches of collected waste linked to infrastructure projects"""
     id = db.Column(db.Integer, primary_key=True)
@@ -384,12 +595,20 @@ class WasteBatch(db.Model):
     collection_date = db.Column(db.DateTime, default=datetime.utcnow)
     processing_date = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(20), default='collected')  # collected, processing, allocated, completed
+    is_open = db.Column(db.Boolean, default=False, nullable=False)  # Still accepting new items
+    drop_location_id = db.Column(db.Integer, db.ForeignKey('drop_location.id'), nullable=True)  # Where the batch is held
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     contributors = db.relationship('ProjectContributor', backref='batch', lazy=True)
     
+    __table_args__ = (
+        # At most one open batch per material
+        db.Index('uq_waste_batch_open_material', 'material_type', unique=True,
+                 postgresql_where=db.text('is_open'), sqlite_where=db.text('is_open')),
+    )
+    
     def __repr__(self):
         return f"<WasteBatch batch_id={self.batch_id} weight={self.total_weight_grams}>"
 
@@ -404,23 +623,289 @@ class ProjectContributor(db.Model):
     is_top_contributor = db.Column(db.Boolean, default=False)  # Top 10% contributor
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'batch_id', name='unique_project_contributor'),
+    )
+    
     def __repr__(self):
         return f"<ProjectContributor user_id={self.user_id} batch_id={self.batch_id}>"
 
 
+class WasteBatchItem(db.Model):
+    """Which batch each waste item was added to"""
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('waste_batch.id', ondelete='CASCADE'), nullable=False, index=True)
+    waste_item_id = db.Column(db.Integer, db.ForeignKey('waste_item.id', ondelete='CASCADE'), nullable=False, unique=True)
+    weight_grams = db.Column(db.Numeric(10, 2), nullable=False)
+    added_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<WasteBatchItem batch_id={self.batch_id} waste_item_id={self.waste_item_id}>"
+
+
+class BatchAssignmentQueue(db.Model):
+    """Recyclable waste items waiting to be added to a batch by the coalescer"""
+    id = db.Column(db.Integer, primary_key=True)
+    waste_item_id = db.Column(db.Integer, db.ForeignKey('waste_item.id', ondelete='CASCADE'), unique=True, nullable=False)
+    enqueued_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<BatchAssignmentQueue waste_item_id={self.waste_item_id}>"
+
+
 class ProjectLedger(db.Model):
     """Blockchain-like immutable ledger for project updates"""
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.String(50), nullable=False)
+    seq = db.Column(db.Integer, nullable=True)  # Position in the project's chain (1, 2, ...)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), nullable=False)
     verified_by = db.Column(db.String(100), nullable=True)
     batch_reference = db.Column(db.String(50), nullable=True)
     previous_hash = db.Column(db.String(64), nullable=True)
     block_hash = db.Column(db.String(64), nullable=False)
-    data = db.Column(db.JSON, nullable=True)  # Additional metadata as JSON
+    data = db.Column(db.JSON().with_variant(JSONB, 'postgresql'), nullable=True)  # Block data (native JSON)
+    canonical_data = db.Column(db.LargeBinary, nullable=True)  # Exact bytes hashed into block_hash
     firestore_synced = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_project_ledger_project_batch', 'project_id', 'batch_reference'),
+        db.UniqueConstraint('project_id', 'seq', name='unique_project_ledger_seq'),
+    )
+    
     def __repr__(self):
         return f"<ProjectLedger project_id={self.project_id} block_hash={self.block_hash[:16]}...>"
+
+
+# ============================================================================
+# FEATURE 4: GEMINI RESPONSE ARCHIVE
+# ============================================================================
+
+class GeminiResponseArchive(db.Model):
+    """Raw Gemini responses (zlib-compressed) kept for offline re-parsing"""
+    id = db.Column(db.Integer, primary_key=True)
+    waste_item_id = db.Column(db.Integer, db.ForeignKey('waste_item.id', ondelete='CASCADE'), nullable=False, index=True)
+    model_name = db.Column(db.String(50), nullable=False)
+    prompt_version = db.Column(db.String(20), nullable=False, index=True)
+    _raw_response = db.Column('raw_response', db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    reparsed_at = db.Column(db.DateTime, nullable=True)
+    
+    @property
+    def raw_response(self):
+        """Getter: Decompress the stored response text"""
+        return zlib.decompress(self._raw_response).decode('utf-8')
+    
+    @raw_response.setter
+    def raw_response(self, value):
+        """Setter: Compress the response text for storage"""
+        self._raw_response = zlib.compress(value.encode('utf-8'), 9)
+    
+    def __repr__(self):
+        return f"<GeminiResponseArchive waste_item_id={self.waste_item_id} prompt_version={self.prompt_version}>"
+
+
+# ============================================================================
+# FEATURE 5: CARBON ROLLUPS
+# ============================================================================
+
+class CarbonUserRollup(db.Model):
+    """Carbon emissions aggregated per user, material and period (day/week/month)"""
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(10), nullable=False)  # day, week, month
+    period_start = db.Column(db.Date, nullable=False)
+    material_type = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    co2e_grams = db.Column(db.Numeric(14, 2), default=0)  # Net CO2e (negative = saved)
+    co2e_saved_grams = db.Column(db.Numeric(14, 2), default=0)  # CO2e saved by recycling
+    weight_grams = db.Column(db.Numeric(14, 2), default=0)
+    item_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('period', 'period_start', 'material_type', 'user_id', name='unique_carbon_user_rollup'),
+        db.Index('idx_carbon_user_rollup_user', 'user_id', 'period', 'period_start'),
+    )
+    
+    def __repr__(self):
+        return f"<CarbonUserRollup user_id={self.user_id} {self.period}={self.period_start} material={self.material_type}>"
+
+
+class CarbonCityRollup(db.Model):
+    """City-wide carbon emissions aggregated per material and period (day/week/month)"""
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(10), nullable=False)  # day, week, month
+    period_start = db.Column(db.Date, nullable=False)
+    material_type = db.Column(db.String(50), nullable=False)
+    co2e_grams = db.Column(db.Numeric(14, 2), default=0)  # Net CO2e (negative = saved)
+    co2e_saved_grams = db.Column(db.Numeric(14, 2), default=0)  # CO2e saved by recycling
+    weight_grams = db.Column(db.Numeric(14, 2), default=0)
+    item_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('period', 'period_start', 'material_type', name='unique_carbon_city_rollup'),
+    )
+    
+    def __repr__(self):
+        return f"<CarbonCityRollup {self.period}={self.period_start} material={self.material_type}>"
+
+
+class EmissionFactorSet(db.Model):
+    """A versioned, immutable set of carbon emission factors"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, unique=True, nullable=False, index=True)
+    description = db.Column(db.String(255), nullable=True)
+    source = db.Column(db.String(255), nullable=True)  # e.g. EPA, IPCC
+    is_active = db.Column(db.Boolean, default=False, index=True)  # Used for new items
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    activated_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    factors = db.relationship('EmissionFactor', backref='factor_set', lazy=True, cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f"<EmissionFactorSet v{self.version} active={self.is_active}>"
+
+
+class EmissionFactor(db.Model):
+    """kg CO2e per kg of material for one disposal method within a factor set"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, db.ForeignKey('emission_factor_set.version', ondelete='CASCADE'), nullable=False)
+    material_type = db.Column(db.String(50), nullable=False)
+    disposal_method = db.Column(db.String(20), nullable=False)  # production, landfill, incineration, recycling
+    kg_co2e_per_kg = db.Column(db.Numeric(10, 4), nullable=False)  # Negative = carbon saved
+    
+    __table_args__ = (
+        db.UniqueConstraint('version', 'material_type', 'disposal_method', name='unique_emission_factor'),
+    )
+    
+    def __repr__(self):
+        return f"<EmissionFactor v{self.version} {self.material_type}/{self.disposal_method}={self.kg_co2e_per_kg}>"
+
+
+class EmissionFactorVersionTotal(db.Model):
+    """Audit snapshot of item carbon totals computed with a given factor version"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, index=True)
+    material_type = db.Column(db.String(50), nullable=False)
+    co2e_grams = db.Column(db.Numeric(14, 2), default=0)
+    co2e_saved_grams = db.Column(db.Numeric(14, 2), default=0)
+    weight_grams = db.Column(db.Numeric(14, 2), default=0)
+    item_count = db.Column(db.Integer, default=0)
+    # current: items on the version at computed_at; departing: taken as items
+    # started leaving (a move is under way); departed: that move finished
+    snapshot_kind = db.Column(db.String(20), default='current')
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('version', 'material_type', name='unique_emission_factor_version_total'),
+    )
+    
+    def __repr__(self):
+        return f"<EmissionFactorVersionTotal v{self.version} material={self.material_type}>"
+
+
+# ============================================================================
+# FEATURE 6: REFERENCE DATA CACHE
+# ============================================================================
+
+class ReferenceDataVersion(db.Model):
+    """Change counter for a cached reference table; bumped whenever the table is edited"""
+    name = db.Column(db.String(50), primary_key=True)  # material_weights, achievements, drop_locations
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<ReferenceDataVersion {self.name}=v{self.version}>"
+
+
+# ============================================================================
+# FEATURE 7: SCHEDULED MAINTENANCE JOBS
+# ============================================================================
+
+class ScheduledJob(db.Model):
+    """A periodic maintenance job: its schedule, run lease, resume cursor and last run stats"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    interval_seconds = db.Column(db.Integer, nullable=False)
+    next_run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    cursor = db.Column(db.String(100), nullable=True)  # Where an unfinished run stopped
+    lease_owner = db.Column(db.String(100), nullable=True)  # host:pid running the job
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    last_started_at = db.Column(db.DateTime, nullable=True)
+    last_finished_at = db.Column(db.DateTime, nullable=True)
+    last_status = db.Column(db.String(20), nullable=True)  # running, succeeded, partial, interrupted, failed
+    last_error = db.Column(db.Text, nullable=True)
+    last_duration_ms = db.Column(db.Integer, nullable=True)
+    last_lag_ms = db.Column(db.Integer, nullable=True)  # How late the run started
+    last_processed = db.Column(db.Integer, nullable=True)
+    run_count = db.Column(db.Integer, nullable=False, default=0)
+    failure_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<ScheduledJob {self.name} next={self.next_run_at}>"
+
+
+# ============================================================================
+# FEATURE 8: CHAIN VERIFICATION CHECKPOINTS
+# ============================================================================
+
+class ChainCheckpoint(db.Model):
+    """How far a journey or project ledger chain has been verified (block ID and hash)"""
+    id = db.Column(db.Integer, primary_key=True)
+    chain_type = db.Column(db.String(20), nullable=False)  # 'journey' (waste item) or 'project' (ledger)
+    chain_key = db.Column(db.String(50), nullable=False)  # Waste item ID or project ID
+    block_id = db.Column(db.Integer, nullable=True)  # Last verified block; None after a failed audit
+    block_hash = db.Column(db.String(64), nullable=True)
+    block_count = db.Column(db.Integer, nullable=False, default=0)
+    verified_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_audit_at = db.Column(db.DateTime, nullable=True)
+    audit_valid = db.Column(db.Boolean, nullable=True)  # Result of the last full re-verification
+    
+    __table_args__ = (db.UniqueConstraint('chain_type', 'chain_key', name='unique_chain_checkpoint'),)
+    
+    def __repr__(self):
+        return f"<ChainCheckpoint {self.chain_type}:{self.chain_key} block={self.block_id}>"
+
+
+# ============================================================================
+# FEATURE 9: LEDGER MERKLE ANCHORS
+# ============================================================================
+
+class LedgerMerkleRoot(db.Model):
+    """Merkle root over a project's ledger entries up to last_entry_id"""
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.String(50), nullable=False)
+    root_hash = db.Column(db.String(64), nullable=False)
+    leaf_count = db.Column(db.Integer, nullable=False)
+    last_entry_id = db.Column(db.Integer, nullable=False)  # Highest ProjectLedger.id covered
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    nodes = db.relationship('LedgerMerkleNode', backref='root', lazy='dynamic', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_ledger_merkle_root_project', 'project_id', 'last_entry_id'),
+    )
+    
+    def __repr__(self):
+        return f"<LedgerMerkleRoot {self.project_id} leaves={self.leaf_count} root={self.root_hash[:16]}...>"
+
+
+class LedgerMerkleNode(db.Model):
+    """One node of a project's latest Merkle tree (level 0 = leaves, one per ledger entry)"""
+    id = db.Column(db.Integer, primary_key=True)
+    root_id = db.Column(db.Integer, db.ForeignKey('ledger_merkle_root.id', ondelete='CASCADE'), nullable=False)
+    level = db.Column(db.Integer, nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    node_hash = db.Column(db.String(64), nullable=False)
+    entry_id = db.Column(db.Integer, nullable=True)  # ProjectLedger.id, leaves only
+    
+    __table_args__ = (
+        db.UniqueConstraint('root_id', 'level', 'position', name='unique_merkle_node_position'),
+        db.Index('ix_ledger_merkle_node_entry', 'root_id', 'entry_id'),
+    )
+    
+    def __repr__(self):
+        return f"<LedgerMerkleNode root={self.root_id} level={self.level} position={self.position}>"
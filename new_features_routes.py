@@ -29,40 +29,17 @@ def register_new_feature_routes(app):
     def footprint_dashboard():
         """Display plastic footprint dashboard (weekly-based)"""
         try:
-            from footprint_updater import get_week_start
+            from dashboard_snapshot import get_dashboard_snapshot
             
-            # Get weekly history (last 12 weeks)
-            weekly_history = UserPlasticFootprintMonthly.query.filter_by(
-                user_id=current_user.id
-            ).order_by(desc(UserPlasticFootprintMonthly.month)).limit(12).all()
-            
-            # Get current week start (Monday)
-            today = date.today()
-            current_week_start = get_week_start(today)
-            current_weekly = UserPlasticFootprintMonthly.query.filter_by(
-                user_id=current_user.id,
-                month=current_week_start
-            ).first()
-            
-            # Get recent scans
-            recent_scans = PlasticFootprintScan.query.filter_by(
-                user_id=current_user.id
-            ).order_by(desc(PlasticFootprintScan.timestamp)).limit(10).all()
-            
-            # Calculate total lifetime weight
-            total_lifetime = db.session.query(
-                func.sum(UserPlasticFootprintMonthly.total_weight_grams)
-            ).filter_by(user_id=current_user.id).scalar() or 0.0
-            
-            # Get badge level
-            badge_level = current_user.badge_level or 'Bronze'
+            # One key lookup; rebuilt only after a new scan
+            snapshot = get_dashboard_snapshot(current_user.id)
             
             return render_template('footprint_dashboard.html',
-                weekly_history=weekly_history,
-                current_weekly=current_weekly,
-                recent_scans=recent_scans,
-                total_lifetime=float(total_lifetime),
-                badge_level=badge_level
+                weekly_history=snapshot['weekly_history'],
+                current_weekly=snapshot['current_weekly'],
+                recent_scans=snapshot['recent_scans'],
+                total_lifetime=snapshot['lifetime_weight_grams'],
+                badge_level=snapshot['badge_level']
             )
         except Exception as e:
             logging.error(f"Error loading footprint dashboard: {e}")
@@ -72,10 +49,11 @@ def register_new_feature_routes(app):
     @app.route('/footprint-dashboard/sync', methods=['POST'])
     @login_required
     def sync_footprint_data():
-        """Sync all scans to weekly records (for fixing missing data)"""
+        """Rebuild the current user's weekly records from their scans (for fixing missing data)"""
         try:
-            from footprint_updater import sync_all_scans_to_weekly
-            count = sync_all_scans_to_weekly()
+            from footprint_updater import sync_all_scans_to_weekly, rebuild_footprint_rollups
+            count = sync_all_scans_to_weekly(user_id=current_user.id)
+            rebuild_footprint_rollups(user_id=current_user.id)
             flash(f"Synced {count} weekly footprint records. Dashboard should now show your data!", "success")
             return redirect(url_for('footprint_dashboard'))
         except Exception as e:
@@ -149,7 +127,7 @@ def register_new_feature_routes(app):
             # Get ledger entries
             ledger_entries = ProjectLedger.query.filter_by(
                 project_id=project_id
-            ).order_by(ProjectLedger.timestamp).all()
+            ).order_by(ProjectLedger.seq, ProjectLedger.id).all()
             
             # Calculate progress
             progress = 0.0
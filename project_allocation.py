@@ -0,0 +1,315 @@
+"""
+Project Material Allocation
+Decides which infrastructure project a waste batch goes to.
+
+Each project lists the materials it needs in project_material_requirement,
+one row per material ('Any' for a project that takes every material). The
+remaining_grams column is decremented in SQL on every allocation, so open
+requirements for a material are found through the (material_type,
+remaining_grams) index instead of loading every project.
+
+Candidates are ranked by:
+    1. deadline (soonest first; projects without one last)
+    2. distance from the batch's drop point (when the batch has one)
+    3. remaining need (largest first)
+A requirement for the exact material wins a tie with an 'Any' row.
+
+Usage:
+    python project_allocation.py backfill
+    python project_allocation.py require <project_id> Plastic 40000
+    python project_allocation.py allocate
+    python project_allocation.py show [--material Plastic]
+"""
+
+import argparse
+import logging
+import math
+import sys
+from datetime import date, datetime
+from sqlalchemy import func, literal, select
+from app import db
+from models import InfrastructureProject, ProjectMaterialRequirement
+from db_helpers import dialect_insert
+from reference_cache import get_drop_location
+
+# Requirement rows with this material accept every material
+ANY_MATERIAL = 'Any'
+
+# Projects that can still receive material
+ACTIVE_PROJECT_STATUSES = ('planned', 'in_progress')
+
+def get_batch_point(drop_location_id):
+    """
+    Coordinates of a batch's drop point
+
+    Args:
+        drop_location_id: Drop location ID (may be None)
+
+    Returns:
+        Tuple of (latitude, longitude, longitude scale) or None
+    """
+    if not drop_location_id:
+        return None
+    location = get_drop_location(drop_location_id)
+    if location is None:
+        return None
+    return location.latitude, location.longitude, math.cos(math.radians(location.latitude))
+
+def _distance_sq(point, latitude, longitude):
+    """
+    Squared equirectangular distance (degrees) from a batch point
+
+    Works on SQL columns and on plain numbers alike; only used for ordering.
+    """
+    lat, lng, lng_scale = point
+    d_lat = latitude - lat
+    d_lng = (longitude - lng) * lng_scale
+    return d_lat * d_lat + d_lng * d_lng
+
+def find_requirement_for_batch(material_type: str, drop_location_id: int = None):
+    """
+    Find the highest-priority open requirement for a batch
+
+    Args:
+        material_type: Batch material type
+        drop_location_id: Batch drop point, if known
+
+    Returns:
+        ProjectMaterialRequirement (with .project) or None
+    """
+    order = [InfrastructureProject.deadline.is_(None), InfrastructureProject.deadline]
+    point = get_batch_point(drop_location_id)
+    if point:
+        order.append(_distance_sq(point, InfrastructureProject.location_lat, InfrastructureProject.location_lng))
+    order += [
+        ProjectMaterialRequirement.remaining_grams.desc(),
+        ProjectMaterialRequirement.material_type == ANY_MATERIAL,
+        ProjectMaterialRequirement.id
+    ]
+
+    return ProjectMaterialRequirement.query.join(
+        InfrastructureProject, InfrastructureProject.id == ProjectMaterialRequirement.project_id
+    ).filter(
+        ProjectMaterialRequirement.material_type.in_([material_type, ANY_MATERIAL]),
+        ProjectMaterialRequirement.remaining_grams > 0,
+        InfrastructureProject.status.in_(ACTIVE_PROJECT_STATUSES)
+    ).order_by(*order).first()
+
+def load_open_requirements(material_types=None):
+    """
+    Load every open requirement for some materials in one query
+
+    Used to allocate many batches in one pass; callers decrement
+    'remaining_grams' in the returned dictionaries as they allocate.
+
+    Args:
+        material_types: Material types ('Any' rows are always included;
+            None loads every material)
+
+    Returns:
+        List of dictionaries
+    """
+    query = db.session.query(
+        ProjectMaterialRequirement.id,
+        ProjectMaterialRequirement.project_id,
+        ProjectMaterialRequirement.material_type,
+        ProjectMaterialRequirement.remaining_grams,
+        InfrastructureProject.deadline,
+        InfrastructureProject.location_lat,
+        InfrastructureProject.location_lng
+    ).join(
+        InfrastructureProject, InfrastructureProject.id == ProjectMaterialRequirement.project_id
+    ).filter(
+        ProjectMaterialRequirement.remaining_grams > 0,
+        InfrastructureProject.status.in_(ACTIVE_PROJECT_STATUSES)
+    )
+    if material_types is not None:
+        query = query.filter(ProjectMaterialRequirement.material_type.in_(set(material_types) | {ANY_MATERIAL}))
+    rows = query.all()
+
+    return [
+        {
+            'id': row.id,
+            'project_id': row.project_id,
+            'material_type': row.material_type,
+            'remaining_grams': float(row.remaining_grams),
+            'deadline': row.deadline,
+            'latitude': float(row.location_lat),
+            'longitude': float(row.location_lng)
+        }
+        for row in rows
+    ]
+
+def pick_requirement(requirements, material_type: str, point=None):
+    """
+    Choose from load_open_requirements() rows with the same ranking as find_requirement_for_batch()
+
+    Args:
+        requirements: Rows from load_open_requirements()
+        material_type: Batch material type
+        point: Batch point from get_batch_point(), if known
+
+    Returns:
+        The chosen dictionary or None
+    """
+    def rank(requirement):
+        return (
+            requirement['deadline'] is None,
+            requirement['deadline'] or date.min,
+            _distance_sq(point, requirement['latitude'], requirement['longitude']) if point else 0,
+            -requirement['remaining_grams'],
+            requirement['material_type'] == ANY_MATERIAL,
+            requirement['id']
+        )
+
+    candidates = [
+        requirement for requirement in requirements
+        if requirement['material_type'] in (material_type, ANY_MATERIAL) and requirement['remaining_grams'] > 0
+    ]
+    return min(candidates, key=rank) if candidates else None
+
+def consume_material_requirement(project_id: int, material_type: str, weight_grams: float, requirement_id: int = None):
+    """
+    Record weight allocated to a project's requirement (nothing is committed)
+
+    Args:
+        project_id: Project database ID
+        material_type: Material allocated
+        weight_grams: Weight allocated
+        requirement_id: Requirement chosen by the allocator; if omitted the
+            exact material row is used while it has capacity, then 'Any'
+
+    Returns:
+        ID of the requirement updated, or None if the project has none
+    """
+    if requirement_id is None:
+        requirement_id = db.session.query(ProjectMaterialRequirement.id).filter(
+            ProjectMaterialRequirement.project_id == project_id,
+            ProjectMaterialRequirement.material_type.in_([material_type, ANY_MATERIAL])
+        ).order_by(
+            (ProjectMaterialRequirement.remaining_grams > 0).desc(),
+            ProjectMaterialRequirement.material_type == ANY_MATERIAL,
+            ProjectMaterialRequirement.id
+        ).limit(1).scalar()
+        if requirement_id is None:
+            return None
+
+    table = ProjectMaterialRequirement.__table__
+    db.session.execute(table.update().where(table.c.id == requirement_id).values(
+        allocated_grams=table.c.allocated_grams + weight_grams,
+        remaining_grams=table.c.remaining_grams - weight_grams,
+        updated_at=datetime.utcnow()
+    ))
+    return requirement_id
+
+def set_material_requirement(project_id: int, material_type: str, required_grams: float):
+    """
+    Create or change how much of a material a project needs (nothing is committed)
+
+    Weight already allocated is kept; remaining_grams is recomputed from it.
+    A material row is separate from the project's 'Any' row, if it has one.
+
+    Args:
+        project_id: Project database ID
+        material_type: Material type, or 'Any'
+        required_grams: Total weight needed
+    """
+    if required_grams < 0:
+        raise ValueError("required_grams must not be negative")
+
+    table = ProjectMaterialRequirement.__table__
+    stmt = dialect_insert(table)
+    now = datetime.utcnow()
+    db.session.execute(stmt.values(
+        project_id=project_id,
+        material_type=material_type,
+        required_grams=required_grams,
+        allocated_grams=0,
+        remaining_grams=required_grams,
+        created_at=now,
+        updated_at=now
+    ).on_conflict_do_update(
+        index_elements=['project_id', 'material_type'],
+        set_={
+            'required_grams': stmt.excluded.required_grams,
+            'remaining_grams': stmt.excluded.required_grams - table.c.allocated_grams,
+            'updated_at': stmt.excluded.updated_at
+        }
+    ))
+
+def backfill_material_requirements():
+    """
+    Give every project without requirement rows an 'Any' row from its totals
+
+    Returns:
+        Number of rows created
+    """
+    project = InfrastructureProject.__table__
+    requirement = ProjectMaterialRequirement.__table__
+    now = datetime.utcnow()
+    allocated = func.coalesce(project.c.total_plastic_allocated_grams, 0)
+
+    missing = select(
+        project.c.id,
+        literal(ANY_MATERIAL),
+        project.c.total_plastic_required_grams,
+        allocated,
+        project.c.total_plastic_required_grams - allocated,
+        literal(now),
+        literal(now)
+    ).where(
+        project.c.total_plastic_required_grams.isnot(None),
+        ~select(requirement.c.id).where(requirement.c.project_id == project.c.id).exists()
+    )
+
+    result = db.session.execute(requirement.insert().from_select(
+        ['project_id', 'material_type', 'required_grams', 'allocated_grams', 'remaining_grams', 'created_at', 'updated_at'],
+        missing
+    ))
+    db.session.commit()
+    return result.rowcount
+
+def main():
+    """Manage project material requirements from the command line"""
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Project material allocation")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('backfill', help="Create 'Any' requirements for projects without any")
+    subparsers.add_parser('allocate', help='Link every full pending batch to a project')
+    require_parser = subparsers.add_parser('require', help='Set how much of a material a project needs')
+    require_parser.add_argument('project_id', help='Project ID (InfrastructureProject.project_id)')
+    require_parser.add_argument('material_type', help="Material type, e.g. Plastic, or 'Any'")
+    require_parser.add_argument('required_grams', type=float, help='Total weight needed')
+    show_parser = subparsers.add_parser('show', help='List open requirements in priority order')
+    show_parser.add_argument('--material', default=None)
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.command == 'backfill':
+                logging.info(f"Created {backfill_material_requirements()} requirement rows")
+            elif args.command == 'require':
+                project = InfrastructureProject.query.filter_by(project_id=args.project_id).first()
+                if project is None:
+                    logging.error(f"Project {args.project_id} not found")
+                    sys.exit(1)
+                set_material_requirement(project.id, args.material_type, args.required_grams)
+                db.session.commit()
+                logging.info(f"{project.project_name} needs {args.required_grams:.0f}g of {args.material_type}")
+            elif args.command == 'allocate':
+                from auto_batch_creator import process_pending_batches
+                logging.info(f"Linked {process_pending_batches()} batches")
+            elif args.command == 'show':
+                rows = load_open_requirements([args.material] if args.material else None)
+                for row in sorted(rows, key=lambda r: (r['deadline'] is None, r['deadline'] or date.min, -r['remaining_grams'])):
+                    print(f"project {row['project_id']}\t{row['material_type']}\t{row['remaining_grams']:.0f}g\tdeadline {row['deadline'] or '-'}")
+        except Exception as e:
+            logging.error(f"Allocation command failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -94,6 +94,10 @@ with app.app_context():
     ]
     
     db.session.add_all(drop_locations)
+    
+    # Running processes reload their cached copies
+    from reference_cache import bump_reference_data_version
+    bump_reference_data_version()
     db.session.commit()
     
     logging.info("Database recreation complete!")
\ No newline at end of file
@@ -0,0 +1,266 @@
+"""
+Reference Data Cache
+Keeps small, read-mostly tables (material weights, achievements, drop
+locations) in memory as immutable snapshots so hot paths skip the database.
+
+Each table has a row in reference_data_version. Writers call
+bump_reference_data_version() in the same transaction as their edit; every
+process notices the new version within VERSION_CHECK_SECONDS and reloads.
+Snapshots are also reloaded after MAX_AGE_SECONDS as a safety net for edits
+made outside the app.
+
+Usage:
+    python reference_cache.py bump [--table material_weights]
+    python reference_cache.py show
+"""
+
+import argparse
+import logging
+import sys
+import threading
+import time
+from datetime import datetime
+from types import MappingProxyType
+from typing import NamedTuple, Optional, Tuple
+from app import db
+from models import MaterialWeightLookup, Achievement, DropLocation, ReferenceDataVersion
+from db_helpers import dialect_insert
+
+# How often a process asks the database whether a table changed
+VERSION_CHECK_SECONDS = 30
+
+# Snapshots older than this are reloaded even without a version bump
+MAX_AGE_SECONDS = 600
+
+class MaterialWeight(NamedTuple):
+    """Average item weight for a material/category (grams)"""
+    material_type: str
+    category: Optional[str]
+    average_weight_grams: float
+    min_weight_grams: Optional[float]
+    max_weight_grams: Optional[float]
+    confidence_threshold: Optional[float]
+
+class AchievementInfo(NamedTuple):
+    """An achievement definition"""
+    id: int
+    name: str
+    description: str
+    badge_image: Optional[str]
+    points_awarded: int
+    required_items: int
+    required_material: Optional[str]
+
+class DropLocationInfo(NamedTuple):
+    """A drop-off location"""
+    id: int
+    name: str
+    address: str
+    latitude: float
+    longitude: float
+    accepted_materials: Tuple[str, ...]
+
+def _optional_float(value):
+    return float(value) if value is not None else None
+
+def _load_material_weights():
+    """material_type -> tuple of MaterialWeight, in id order"""
+    weights = {}
+    for row in MaterialWeightLookup.query.order_by(MaterialWeightLookup.id).all():
+        weights.setdefault(row.material_type, []).append(MaterialWeight(
+            material_type=row.material_type,
+            category=row.category,
+            average_weight_grams=float(row.average_weight_grams),
+            min_weight_grams=_optional_float(row.min_weight_grams),
+            max_weight_grams=_optional_float(row.max_weight_grams),
+            confidence_threshold=_optional_float(row.confidence_threshold)
+        ))
+    return MappingProxyType({material_type: tuple(rows) for material_type, rows in weights.items()})
+
+def _load_achievements():
+    """Tuple of AchievementInfo, in id order"""
+    return tuple(
+        AchievementInfo(
+            id=row.id,
+            name=row.name,
+            description=row.description,
+            badge_image=row.badge_image,
+            points_awarded=row.points_awarded or 0,
+            required_items=row.required_items or 0,
+            required_material=row.required_material
+        )
+        for row in Achievement.query.order_by(Achievement.id).all()
+    )
+
+def _load_drop_locations():
+    """id -> DropLocationInfo"""
+    return MappingProxyType({
+        row.id: DropLocationInfo(
+            id=row.id,
+            name=row.name,
+            address=row.address,
+            latitude=row.latitude,
+            longitude=row.longitude,
+            accepted_materials=tuple(
+                m.strip() for m in (row.accepted_materials or '').split(',') if m.strip()
+            )
+        )
+        for row in DropLocation.query.order_by(DropLocation.id).all()
+    })
+
+# Table name -> loader returning an immutable snapshot
+REFERENCE_TABLES = {
+    'material_weights': _load_material_weights,
+    'achievements': _load_achievements,
+    'drop_locations': _load_drop_locations,
+}
+
+# name -> {'data', 'version', 'loaded_at', 'checked_at'}
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _stored_version(name):
+    """Current version of a table, or None if it cannot be read"""
+    try:
+        # Savepoint so a failure (e.g. before migrating) leaves the caller's transaction usable
+        with db.session.begin_nested():
+            version = db.session.query(ReferenceDataVersion.version).filter_by(name=name).scalar()
+        return version or 0
+    except Exception as e:
+        logging.error(f"Error reading reference data version for {name}: {e}")
+        return None
+
+def _get(name):
+    """Get a table snapshot, reloading it if its version changed or it expired"""
+    now = time.monotonic()
+    entry = _cache.get(name)
+    if entry and now - entry['checked_at'] < VERSION_CHECK_SECONDS and now - entry['loaded_at'] < MAX_AGE_SECONDS:
+        return entry['data']
+
+    version = _stored_version(name)
+    if entry and version == entry['version'] and now - entry['loaded_at'] < MAX_AGE_SECONDS:
+        entry['checked_at'] = now
+        return entry['data']
+
+    with _cache_lock:
+        data = REFERENCE_TABLES[name]()
+        _cache[name] = {'data': data, 'version': version, 'loaded_at': now, 'checked_at': now}
+    return data
+
+def load_reference_data():
+    """Load every reference table (call at startup inside an app context)"""
+    for name in REFERENCE_TABLES:
+        _get(name)
+
+def clear_reference_cache(name: str = None):
+    """Drop this process's snapshot of one table (or all of them)"""
+    with _cache_lock:
+        if name is None:
+            _cache.clear()
+        else:
+            _cache.pop(name, None)
+
+def bump_reference_data_version(*names):
+    """
+    Tell every process that reference tables changed
+
+    Call in the same transaction as the edit; nothing is committed here.
+    This process's snapshots are dropped immediately.
+
+    Args:
+        names: Table names from REFERENCE_TABLES (all tables if omitted)
+    """
+    names = names or tuple(REFERENCE_TABLES)
+    unknown = [name for name in names if name not in REFERENCE_TABLES]
+    if unknown:
+        raise ValueError(f"Unknown reference table(s): {', '.join(unknown)}")
+
+    table = ReferenceDataVersion.__table__
+    stmt = dialect_insert(table)
+    now = datetime.utcnow()
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'version': table.c.version + 1, 'updated_at': stmt.excluded.updated_at}
+    ), [{'name': name, 'version': 1, 'updated_at': now} for name in names])
+
+    for name in names:
+        clear_reference_cache(name)
+
+def get_material_weights():
+    """All material weights as a read-only {material_type: (MaterialWeight, ...)} mapping"""
+    return _get('material_weights')
+
+def get_material_weight(material_type: str, category: str = None) -> Optional[MaterialWeight]:
+    """
+    Look up the weight entry for a material
+
+    Args:
+        material_type: Material type (Plastic, Paper, Metal, etc.)
+        category: Optional category (e.g. plastic_bottle); the first entry
+            for the material is used if omitted or not found
+
+    Returns:
+        MaterialWeight, or None if the material is unknown
+    """
+    rows = get_material_weights().get(material_type)
+    if not rows:
+        return None
+    if category is not None:
+        for row in rows:
+            if row.category == category:
+                return row
+    return rows[0]
+
+def get_achievements() -> Tuple[AchievementInfo, ...]:
+    """All achievement definitions"""
+    return _get('achievements')
+
+def get_drop_locations():
+    """All drop locations as a read-only {id: DropLocationInfo} mapping"""
+    return _get('drop_locations')
+
+def get_drop_location(drop_location_id: int) -> Optional[DropLocationInfo]:
+    """Look up a drop location by ID"""
+    return get_drop_locations().get(drop_location_id)
+
+def get_journey_stage(stage: str):
+    """Metadata (name, description, icon) for a waste journey stage, or None"""
+    from blockchain_service import JOURNEY_STAGES
+    return JOURNEY_STAGES.get(stage)
+
+def get_infrastructure_category(category: str):
+    """Display name for an infrastructure report category, or None"""
+    from infrastructure_service import INFRASTRUCTURE_CATEGORIES
+    return INFRASTRUCTURE_CATEGORIES.get(category)
+
+def main():
+    """Inspect or invalidate the reference data cache from the command line"""
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Manage the reference data cache")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bump_parser = subparsers.add_parser('bump', help='Make every process reload reference data')
+    bump_parser.add_argument('--table', choices=sorted(REFERENCE_TABLES), default=None)
+
+    subparsers.add_parser('show', help='Show stored versions and row counts')
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.command == 'bump':
+                names = (args.table,) if args.table else ()
+                bump_reference_data_version(*names)
+                db.session.commit()
+                logging.info(f"Bumped reference data version: {args.table or 'all tables'}")
+            elif args.command == 'show':
+                for name in REFERENCE_TABLES:
+                    print(f"{name}\tv{_stored_version(name)}\t{len(_get(name))} entries")
+        except Exception as e:
+            logging.error(f"Reference cache command failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Request-Scoped Memoization
+Lets read helpers that several parts of one page call (journey blocks,
+project chains, user stats) run their queries once per request.
+
+Results are kept on flask.g, keyed on the function and its arguments, so
+they disappear with the request. Outside a request (scheduler threads, CLI
+commands) the decorator calls straight through. Helpers that write call
+invalidate_request_cache() for the readers they affect, so a request never
+reads its own stale result back.
+"""
+
+import functools
+from flask import g, has_request_context
+
+def request_memoize(func):
+    """
+    Cache a function's result for the rest of the current request (decorator)
+
+    Arguments must be hashable; calls with unhashable arguments are not cached.
+    The undecorated function stays available as `.uncached`.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not has_request_context():
+            return func(*args, **kwargs)
+
+        key = (wrapper, args, tuple(sorted(kwargs.items())))
+        cache = g.setdefault('_request_cache', {})
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            return func(*args, **kwargs)  # Unhashable arguments
+
+        result = cache[key] = func(*args, **kwargs)
+        return result
+
+    wrapper.uncached = func
+    return wrapper
+
+def invalidate_request_cache(*funcs):
+    """
+    Drop cached results for the current request
+
+    Args:
+        *funcs: Memoized functions to forget (all cached results if none given)
+    """
+    if not has_request_context():
+        return
+    cache = g.get('_request_cache')
+    if not cache:
+        return
+    if not funcs:
+        cache.clear()
+        return
+    for key in [key for key in cache if key[0] in funcs]:
+        del cache[key]
@@ -5,7 +5,9 @@ Rewards and gamification system for ReGenWorks.
 from datetime import datetime, timedelta
 from flask_login import current_user
 from app import db
-from models import User, WasteItem, Achievement, UserAchievement, Reward, DropLocation
+from models import User, WasteItem, UserAchievement, Reward
+from reference_cache import get_achievements, get_drop_location
+from request_cache import request_memoize, invalidate_request_cache
 
 def award_points(user_id, points, description, reward_type):
     """
@@ -41,6 +43,7 @@ def award_points(user_id, points, description, reward_type):
     # Save changes
     db.session.add(reward)
     db.session.commit()
+    invalidate_request_cache(get_user_stats)
     
     # Check for new achievements
     check_achievements(user_id)
@@ -60,7 +63,7 @@ def award_points_for_drop_off(user_id, waste_item_id, drop_location_id):
         return None
         
     waste_item = WasteItem.query.get(waste_item_id)
-    drop_location = DropLocation.query.get(drop_location_id)
+    drop_location = get_drop_location(drop_location_id)
     
     if not waste_item or not drop_location:
         return None
@@ -119,18 +122,15 @@ def check_achievements(user_id):
     if not user:
         return None
     
-    # Get all available achievements
-    achievements = Achievement.query.all()
+    # Achievement definitions come from the reference data cache
+    already_earned = {
+        achievement_id for (achievement_id,) in db.session.query(UserAchievement.achievement_id).filter_by(user_id=user_id)
+    }
     earned_achievements = []
     
-    for achievement in achievements:
+    for achievement in get_achievements():
         # Skip if user already has this achievement
-        existing = UserAchievement.query.filter_by(
-            user_id=user_id, 
-            achievement_id=achievement.id
-        ).first()
-        
-        if existing:
+        if achievement.id in already_earned:
             continue
         
         # Check if user meets criteria for achievement
@@ -193,8 +193,14 @@ def check_achievements(user_id):
                 f"Earned achievement: {achievement.name}",
                 "achievement"
             )
+            
+            # award_points() re-checks achievements, so reload what is already earned
+            already_earned = {
+                achievement_id for (achievement_id,) in db.session.query(UserAchievement.achievement_id).filter_by(user_id=user_id)
+            }
     
     db.session.commit()
+    invalidate_request_cache(get_user_stats)
     return earned_achievements
 
 def _update_recycling_streak(user):
@@ -217,9 +223,10 @@ def _update_recycling_streak(user):
     # Update last activity date
     user.last_activity_date = datetime.utcnow()
 
+@request_memoize
 def get_user_stats(user_id):
     """
-    Get a summary of user statistics for display
+    Get a summary of user statistics for display (computed once per request)
     
     Args:
         user_id: ID of the user
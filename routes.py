@@ -85,26 +85,22 @@ def register_routes(app):
                     return render_template("index.html")
                 
                 # Calculate carbon emissions
-                from carbon_calculator import calculate_carbon_emissions, get_carbon_summary
-                from models import MaterialWeightLookup
+                from carbon_calculator import get_carbon_summary
+                from carbon_service import calculate_emissions
+                from footprint_updater import get_estimated_weight
                 from localization_helper import get_current_language
                 
                 material_type = analysis_result.get("material", "Plastic")
                 current_lang = get_current_language()
                 
-                # Get weight estimate
-                weight_lookup = MaterialWeightLookup.query.filter_by(
-                    material_type=material_type
-                ).first()
-                estimated_weight = 25.0  # Default in grams
-                if weight_lookup:
-                    estimated_weight = float(weight_lookup.average_weight_grams)
+                # Get weight estimate (from the process-wide reference data cache)
+                estimated_weight = get_estimated_weight(material_type)
                 
                 # Determine disposal method based on recyclability
                 disposal_method = 'recycling' if analysis_result.get("is_recyclable", False) else 'landfill'
                 
                 # Calculate carbon emissions
-                carbon_data = calculate_carbon_emissions(material_type, estimated_weight, disposal_method)
+                carbon_data = calculate_emissions(material_type, estimated_weight, disposal_method)
                 carbon_summary = get_carbon_summary(carbon_data, current_lang)
                 
                 # Add carbon emissions to analysis result
@@ -132,34 +128,36 @@ def register_routes(app):
                 waste_item.material_type = material_type
                 waste_item.estimated_weight_grams = estimated_weight
                 
+                # Persist carbon figures so dashboards can aggregate them in SQL
+                from carbon_service import apply_carbon_to_item
+                apply_carbon_to_item(waste_item, carbon_data)
+                
                 # Link to user if logged in
                 if current_user.is_authenticated:
                     waste_item.user_id = current_user.id
                 
-                # Save to database
-                db.session.add(waste_item)
-                db.session.commit()
-                
-                # Auto-create batch and link to project
-                from auto_batch_creator import auto_create_batch_from_waste_item
-                auto_create_batch_from_waste_item(waste_item.id)
-                
-                # Create footprint scan if user is authenticated and material detected
-                if current_user.is_authenticated and analysis_result.get("material"):
-                    try:
-                        from models import PlasticFootprintScan, MaterialWeightLookup
-                        from sqlalchemy import func
-                        
-                        material_type = analysis_result.get("material", "Plastic")
-                        
-                        # Get weight estimate from lookup table
-                        weight_lookup = MaterialWeightLookup.query.filter_by(
-                            material_type=material_type
-                        ).first()
-                        
-                        estimated_weight = 25.0  # Default
-                        if weight_lookup:
-                            estimated_weight = float(weight_lookup.average_weight_grams)
+                # All post-analysis writes share one transaction and one commit,
+                # so an item is never saved without its batch entry and scan
+                try:
+                    db.session.add(waste_item)
+                    db.session.flush()  # Get waste_item.id
+                    
+                    # Archive the raw Gemini response for offline re-parsing
+                    from gemini_archive import archive_gemini_response
+                    archive_gemini_response(waste_item.id, analysis_result)
+                    
+                    # Keep carbon rollups in step with the item insert
+                    from carbon_service import record_item_carbon
+                    record_item_carbon(waste_item)
+                    
+                    # Queue batch assignment; the batch coalescer adds it to a batch
+                    from auto_batch_creator import enqueue_batch_assignment
+                    enqueue_batch_assignment(waste_item)
+                    
+                    # Create footprint scan if user is authenticated and material detected
+                    if current_user.is_authenticated and analysis_result.get("material"):
+                        from models import PlasticFootprintScan
+                        from footprint_updater import record_scan_rollups, update_weekly_footprint
                         
                         # Get ML confidence if available
                         ml_confidence = None
@@ -168,26 +166,24 @@ def register_routes(app):
                             if isinstance(detection, dict):
                                 ml_confidence = detection.get("confidence", 0.0)
                         
-                        # Create footprint scan
                         scan = PlasticFootprintScan(
                             user_id=current_user.id,
                             waste_item_id=waste_item.id,
                             material_type=material_type,
                             estimated_weight_grams=estimated_weight,
-                            ml_confidence_score=ml_confidence
+                            ml_confidence_score=ml_confidence,
+                            timestamp=datetime.utcnow()
                         )
                         db.session.add(scan)
-                        db.session.commit()
                         
-                        # Manually update weekly footprint (in case trigger doesn't exist)
-                        try:
-                            from footprint_updater import update_weekly_footprint
-                            update_weekly_footprint(current_user.id, estimated_weight)
-                        except Exception as updater_error:
-                            logging.error(f"Error updating weekly footprint: {updater_error}")
-                    except Exception as e:
-                        logging.error(f"Error creating footprint scan: {e}")
-                        # Don't fail the whole request if footprint tracking fails
+                        record_scan_rollups(current_user.id, estimated_weight, scan.timestamp)
+                        update_weekly_footprint(current_user.id, estimated_weight, scan.timestamp, commit=False)
+                    
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    waste_item = None  # Nothing was saved
+                    raise
                 
                 # Store the waste item ID in session for listing form
                 session["last_analyzed_item_id"] = waste_item.id
@@ -405,7 +401,11 @@ def register_routes(app):
                 description=notes,
                 is_recyclable=True  # Assuming items being dropped off are recyclable
             )
+            from carbon_service import calculate_item_carbon, record_item_carbon
+            calculate_item_carbon(waste_item)
             db.session.add(waste_item)
+            db.session.flush()
+            record_item_carbon(waste_item)
             db.session.commit()
             
             # Award points for the drop-off
@@ -0,0 +1,326 @@
+"""
+Footprint Scan Partitioning and Retention
+On PostgreSQL plastic_footprint_scan is range-partitioned by month on
+timestamp, with a BRIN index on timestamp and a default partition so inserts
+never fail. On SQLite the table stays a single table with a plain timestamp
+index, and retention deletes rows in chunks instead of dropping partitions.
+
+Retention folds scans older than N months into the day/week/month rollups
+(reconciling the affected periods from raw scans), records the cutoff as a
+watermark that later rebuilds respect, and then removes the raw rows.
+
+Usage:
+    python scan_retention.py partition [--months-ahead 3]
+    python scan_retention.py ensure-partitions [--months-ahead 3]
+    python scan_retention.py prune [--retention-months 12] [--dry-run]
+"""
+
+import argparse
+import logging
+import re
+import sys
+from datetime import date, datetime
+from sqlalchemy import and_, delete, func, or_, select, text
+from app import db
+from models import PlasticFootprintScan, ScanRetentionRun
+from db_helpers import is_postgres
+from footprint_updater import (
+    FOOTPRINT_ROLLUPS, get_retained_period_start, get_scan_retention_cutoff,
+    rebuild_rollup_range, shift_period_start
+)
+
+SCAN_TABLE = PlasticFootprintScan.__tablename__
+
+# Raw scans older than this many months are folded into rollups and removed
+DEFAULT_RETENTION_MONTHS = 12
+
+# Future monthly partitions kept ready ahead of incoming scans
+DEFAULT_MONTHS_AHEAD = 3
+
+# Rows per DELETE when pruning without partitions
+PRUNE_CHUNK_SIZE = 5000
+
+_PARTITION_NAME = re.compile(rf'^{SCAN_TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+def _partition_name(month_start):
+    return f"{SCAN_TABLE}_p{month_start.year:04d}_{month_start.month:02d}"
+
+def is_scan_table_partitioned():
+    """Check if the scan table is a partitioned PostgreSQL table"""
+    if not is_postgres():
+        return False
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+    ), {'table': SCAN_TABLE}).first() is not None
+
+def _create_month_partition(month_start):
+    """Create the partition for one month if it does not exist (no commit)"""
+    month_end = shift_period_start('month', month_start, 1)
+    db.session.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {_partition_name(month_start)} PARTITION OF {SCAN_TABLE} "
+        f"FOR VALUES FROM ('{month_start.isoformat()}') TO ('{month_end.isoformat()}')"
+    ))
+
+def ensure_scan_partitions(months_ahead: int = DEFAULT_MONTHS_AHEAD):
+    """
+    Create monthly partitions from the current month through months_ahead
+
+    Does nothing unless the scan table is partitioned. Run at least monthly;
+    scans beyond the last partition land in the default partition.
+
+    Args:
+        months_ahead: Number of future months to prepare
+
+    Returns:
+        Number of months checked
+    """
+    if not is_scan_table_partitioned():
+        return 0
+
+    try:
+        current_month = date.today().replace(day=1)
+        for offset in range(months_ahead + 1):
+            _create_month_partition(shift_period_start('month', current_month, offset))
+        db.session.commit()
+        return months_ahead + 1
+    except Exception as e:
+        logging.error(f"Error creating scan partitions: {e}")
+        db.session.rollback()
+        raise
+
+def partition_scan_table(months_ahead: int = DEFAULT_MONTHS_AHEAD):
+    """
+    Convert plastic_footprint_scan into a monthly range-partitioned table
+
+    Runs in one transaction on PostgreSQL: the existing table is renamed,
+    a partitioned copy with the same columns and defaults is created
+    (primary key (id, timestamp), as PostgreSQL requires the partition key in
+    it), rows are copied, the id sequence is handed over and the old table is
+    dropped. Safe to re-run; does nothing on SQLite or if already partitioned.
+
+    Args:
+        months_ahead: Number of future monthly partitions to create
+
+    Returns:
+        True if the table was converted
+    """
+    if not is_postgres() or is_scan_table_partitioned():
+        return False
+
+    legacy = f"{SCAN_TABLE}_legacy"
+    try:
+        db.session.execute(text(f'ALTER TABLE {SCAN_TABLE} RENAME TO {legacy}'))
+        db.session.execute(text(
+            f'UPDATE {legacy} SET "timestamp" = COALESCE(created_at, now()) WHERE "timestamp" IS NULL'
+        ))
+        db.session.execute(text(f'''
+            CREATE TABLE {SCAN_TABLE} (
+                LIKE {legacy} INCLUDING DEFAULTS,
+                CONSTRAINT pk_{SCAN_TABLE} PRIMARY KEY (id, "timestamp"),
+                FOREIGN KEY (user_id) REFERENCES "user" (id) ON DELETE CASCADE,
+                FOREIGN KEY (waste_item_id) REFERENCES waste_item (id) ON DELETE SET NULL
+            ) PARTITION BY RANGE ("timestamp")
+        '''))
+        db.session.execute(text(f'CREATE TABLE {SCAN_TABLE}_default PARTITION OF {SCAN_TABLE} DEFAULT'))
+
+        first_scan = db.session.execute(text(f'SELECT min("timestamp") FROM {legacy}')).scalar()
+        month = (first_scan.date() if first_scan else date.today()).replace(day=1)
+        last_month = shift_period_start('month', date.today().replace(day=1), months_ahead)
+        while month <= last_month:
+            _create_month_partition(month)
+            month = shift_period_start('month', month, 1)
+
+        db.session.execute(text(f'INSERT INTO {SCAN_TABLE} SELECT * FROM {legacy}'))
+
+        # Keep the id sequence when the old table (its owner) is dropped
+        sequence = db.session.execute(
+            text("SELECT pg_get_serial_sequence(:table, 'id')"), {'table': legacy}
+        ).scalar()
+        if sequence:
+            db.session.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY {SCAN_TABLE}.id'))
+
+        db.session.execute(text(f'DROP TABLE {legacy}'))
+        create_scan_indexes()
+        db.session.commit()
+        logging.info(f"Partitioned {SCAN_TABLE} by month")
+        return True
+    except Exception as e:
+        logging.error(f"Error partitioning {SCAN_TABLE}: {e}")
+        db.session.rollback()
+        raise
+
+def create_scan_indexes():
+    """Create the (user_id, timestamp) index and the BRIN (or plain, on SQLite) timestamp index (no commit)"""
+    using = ' USING brin' if is_postgres() else ''
+    db.session.execute(text(
+        f'CREATE INDEX IF NOT EXISTS ix_{SCAN_TABLE}_user_timestamp ON {SCAN_TABLE} (user_id, "timestamp")'
+    ))
+    db.session.execute(text(
+        f'CREATE INDEX IF NOT EXISTS ix_{SCAN_TABLE}_timestamp ON {SCAN_TABLE}{using} ("timestamp")'
+    ))
+
+def get_retention_cutoff(retention_months: int = DEFAULT_RETENTION_MONTHS, today=None):
+    """First day of the oldest month whose raw scans are kept"""
+    current_month = (today or date.today()).replace(day=1)
+    return shift_period_start('month', current_month, -retention_months)
+
+def _scans_before(cutoff):
+    """Filter for scans before a day, written so timestamp indexes/partition pruning still apply"""
+    cutoff_time = datetime.combine(cutoff, datetime.min.time())
+    return or_(
+        PlasticFootprintScan.timestamp < cutoff_time,
+        and_(PlasticFootprintScan.timestamp.is_(None), PlasticFootprintScan.created_at < cutoff_time)
+    )
+
+def _drop_old_partitions(cutoff):
+    """Drop monthly partitions that end on or before the cutoff; returns (partitions, rows)"""
+    partitions = db.session.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table"
+    ), {'table': SCAN_TABLE}).scalars().all()
+
+    dropped, rows = 0, 0
+    for name in sorted(partitions):
+        match = _PARTITION_NAME.match(name)
+        if not match:
+            continue  # the default partition
+        month_end = shift_period_start('month', date(int(match.group(1)), int(match.group(2)), 1), 1)
+        if month_end > cutoff:
+            continue
+        rows += db.session.execute(text(f'SELECT count(*) FROM {name}')).scalar()
+        db.session.execute(text(f'DROP TABLE {name}'))
+        db.session.commit()
+        dropped += 1
+        logging.info(f"Dropped scan partition {name}")
+    return dropped, rows
+
+def _delete_scans_before(cutoff, chunk_size=PRUNE_CHUNK_SIZE):
+    """Delete raw scans before the cutoff in chunks, committing each one; returns rows deleted"""
+    deleted = 0
+    while True:
+        ids = select(PlasticFootprintScan.id).where(_scans_before(cutoff)).limit(chunk_size).scalar_subquery()
+        result = db.session.execute(
+            delete(PlasticFootprintScan).where(PlasticFootprintScan.id.in_(ids)),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        deleted += result.rowcount
+        if result.rowcount < chunk_size:
+            return deleted
+
+def prune_footprint_scans(retention_months: int = DEFAULT_RETENTION_MONTHS, dry_run: bool = False):
+    """
+    Fold scans older than retention_months into the rollups and remove them
+
+    1. Rollup rows for the periods being retired are rebuilt from the raw
+       scans, so they are exact before the scans go away.
+    2. The cutoff is recorded as the retention watermark in the same
+       transaction; rebuild_footprint_rollups() and sync_all_scans_to_weekly()
+       leave periods before it untouched from then on.
+    3. Old monthly partitions are dropped (PostgreSQL) and any remaining old
+       rows are deleted in chunks. If this step is interrupted, re-running
+       finishes it.
+
+    Args:
+        retention_months: Months of raw scans to keep, counting the current one
+        dry_run: Only report what would be pruned
+
+    Returns:
+        Dictionary with cutoff, scans_pruned and partitions_dropped
+    """
+    if retention_months < 1:
+        raise ValueError("retention_months must be at least 1")
+
+    cutoff = get_retention_cutoff(retention_months)
+    previous_cutoff = get_scan_retention_cutoff()
+    summary = {'cutoff': cutoff, 'scans_pruned': 0, 'partitions_dropped': 0}
+
+    if dry_run:
+        summary['scans_pruned'] = db.session.query(func.count(PlasticFootprintScan.id)).filter(
+            _scans_before(cutoff)
+        ).scalar()
+        return summary
+
+    try:
+        if previous_cutoff is None or cutoff > previous_cutoff:
+            # Make the retiring periods exact before their raw scans disappear
+            for period in FOOTPRINT_ROLLUPS:
+                rebuild_rollup_range(
+                    period,
+                    start=get_retained_period_start(period, previous_cutoff) if previous_cutoff else None,
+                    end=get_retained_period_start(period, cutoff)
+                )
+            run = ScanRetentionRun(pruned_before=cutoff, retention_months=retention_months)
+            db.session.add(run)
+        else:
+            # Already folded; finish any removal a previous run left behind
+            cutoff = previous_cutoff
+            summary['cutoff'] = cutoff
+            run = ScanRetentionRun.query.filter_by(pruned_before=cutoff).order_by(ScanRetentionRun.id.desc()).first()
+        db.session.commit()
+    except Exception as e:
+        logging.error(f"Error folding scans into rollups: {e}")
+        db.session.rollback()
+        raise
+
+    try:
+        if is_scan_table_partitioned():
+            summary['partitions_dropped'], summary['scans_pruned'] = _drop_old_partitions(cutoff)
+        summary['scans_pruned'] += _delete_scans_before(cutoff)
+
+        from dashboard_snapshot import invalidate_all_dashboard_snapshots
+        invalidate_all_dashboard_snapshots()  # Recent-scan lists may include pruned rows
+
+        run.scans_pruned = (run.scans_pruned or 0) + summary['scans_pruned']
+        run.partitions_dropped = (run.partitions_dropped or 0) + summary['partitions_dropped']
+        run.finished_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        logging.error(f"Error pruning footprint scans before {cutoff}: {e}")
+        db.session.rollback()
+        raise
+
+    if is_scan_table_partitioned():
+        ensure_scan_partitions()
+
+    logging.info(f"Pruned {summary['scans_pruned']} scans before {cutoff}")
+    return summary
+
+def main():
+    """Manage scan partitions and retention from the command line"""
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Footprint scan partitioning and retention")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    partition_parser = subparsers.add_parser('partition', help='Convert the scan table to monthly partitions (PostgreSQL)')
+    partition_parser.add_argument('--months-ahead', type=int, default=DEFAULT_MONTHS_AHEAD)
+
+    ensure_parser = subparsers.add_parser('ensure-partitions', help='Create upcoming monthly partitions')
+    ensure_parser.add_argument('--months-ahead', type=int, default=DEFAULT_MONTHS_AHEAD)
+
+    prune_parser = subparsers.add_parser('prune', help='Fold old scans into rollups and remove them')
+    prune_parser.add_argument('--retention-months', type=int, default=DEFAULT_RETENTION_MONTHS)
+    prune_parser.add_argument('--dry-run', action='store_true')
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.command == 'partition':
+                converted = partition_scan_table(args.months_ahead)
+                logging.info("Scan table partitioned" if converted else "Scan table not partitioned (SQLite or already done)")
+            elif args.command == 'ensure-partitions':
+                logging.info(f"Checked {ensure_scan_partitions(args.months_ahead)} monthly partitions")
+            elif args.command == 'prune':
+                summary = prune_footprint_scans(args.retention_months, args.dry_run)
+                logging.info(f"Scan retention{' (dry run)' if args.dry_run else ''}: {summary}")
+        except Exception as e:
+            logging.error(f"Scan retention command failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
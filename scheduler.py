@@ -0,0 +1,372 @@
+"""
+Maintenance Job Scheduler
+Runs periodic maintenance jobs (linking full batches to projects, rebuilding
+weekly footprints, mining journey blocks, auditing hash chains, anchoring
+ledger Merkle roots, re-ranking leaderboards) from the web processes without
+running them once per worker.
+
+Every process runs a scheduler thread. A job's row in scheduled_job is also
+its lease: a process runs the job only after an UPDATE that requires the job
+to be due and unleased (or its lease expired) succeeds, so one process wins.
+Jobs work in bounded chunks that commit on their own; after each chunk the
+runner saves the job's cursor and extends the lease. If a runner dies the
+lease expires and the next process resumes from the saved cursor.
+
+Each run records its duration, lag (how late it started) and outcome on the
+job's row.
+
+Usage:
+    python scheduler.py list
+    python scheduler.py run link_pending_batches [--force]
+"""
+
+import argparse
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple
+from sqlalchemy import or_
+from app import db
+from models import ScheduledJob, WasteBatch
+from db_helpers import dialect_insert
+
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# How often each process looks for due jobs (seconds)
+SCHEDULER_POLL_SECONDS = float(os.environ.get('SCHEDULER_POLL_SECONDS', '15'))
+
+# A runner that stops extending its lease for this long loses the job
+DEFAULT_LEASE_SECONDS = 120
+
+# A run stops after this long and the rest is picked up at the next poll
+DEFAULT_MAX_RUN_SECONDS = 300
+
+# Identifies this process in lease_owner
+RUNNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+class Job(NamedTuple):
+    """A registered job; func(cursor, chunk_size) returns (items processed, next cursor or None when done)"""
+    name: str
+    func: Callable
+    interval_seconds: int
+    chunk_size: int
+    lease_seconds: int
+    max_run_seconds: int
+
+# Job name -> Job
+JOBS = {}
+
+_job_rows_ready = False
+_scheduler_thread = None
+_scheduler_lock = threading.Lock()
+
+def register_job(name: str, interval_seconds: int, chunk_size: int = 100,
+                 lease_seconds: int = DEFAULT_LEASE_SECONDS, max_run_seconds: int = DEFAULT_MAX_RUN_SECONDS):
+    """
+    Register a periodic job (decorator)
+
+    The decorated function takes (cursor, chunk_size), processes one chunk
+    after the cursor (None means from the start), commits, and returns
+    (items processed, next cursor). It returns None as the cursor once
+    there is nothing left.
+
+    Args:
+        name: Unique job name
+        interval_seconds: Time between scheduled runs
+        chunk_size: Items per chunk
+        lease_seconds: Lease length, extended after every chunk
+        max_run_seconds: Time budget of one run
+    """
+    def decorator(func):
+        JOBS[name] = Job(name, func, interval_seconds, chunk_size, lease_seconds, max_run_seconds)
+        return func
+    return decorator
+
+def ensure_job_rows():
+    """Create a scheduled_job row for every registered job and sync intervals"""
+    table = ScheduledJob.__table__
+    stmt = dialect_insert(table)
+    now = datetime.utcnow()
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'interval_seconds': stmt.excluded.interval_seconds}
+    ), [
+        {'name': job.name, 'interval_seconds': job.interval_seconds, 'next_run_at': now,
+         'run_count': 0, 'failure_count': 0}
+        for job in JOBS.values()
+    ])
+    db.session.commit()
+
+def _claim(job: Job, now: datetime, force: bool = False):
+    """Take the job's lease if it is due and free; returns (next_run_at, cursor) or None"""
+    table = ScheduledJob.__table__
+    conditions = [
+        table.c.name == job.name,
+        or_(table.c.lease_owner.is_(None), table.c.lease_expires_at < now)
+    ]
+    if not force:
+        conditions.append(table.c.next_run_at <= now)
+
+    row = db.session.execute(table.update().where(*conditions).values(
+        lease_owner=RUNNER_ID,
+        lease_expires_at=now + timedelta(seconds=job.lease_seconds),
+        last_started_at=now,
+        last_status='running'
+    ).returning(table.c.next_run_at, table.c.cursor)).first()
+    db.session.commit()
+    return row
+
+def _checkpoint(job: Job, cursor):
+    """Save progress and extend the lease; False if another runner took the job"""
+    table = ScheduledJob.__table__
+    result = db.session.execute(table.update().where(
+        table.c.name == job.name,
+        table.c.lease_owner == RUNNER_ID
+    ).values(
+        cursor=cursor,
+        lease_expires_at=datetime.utcnow() + timedelta(seconds=job.lease_seconds)
+    ))
+    db.session.commit()
+    return result.rowcount == 1
+
+def _next_run_at(scheduled: datetime, interval_seconds: int, now: datetime):
+    """The first slot on the job's schedule after now (missed slots are skipped)"""
+    interval = timedelta(seconds=interval_seconds)
+    if scheduled + interval > now:
+        return scheduled + interval
+    missed = (now - scheduled) // interval
+    return scheduled + interval * (missed + 1)
+
+def run_job(job: Job, force: bool = False):
+    """
+    Run a job if this process can take its lease
+
+    Args:
+        job: Registered job
+        force: Run even if the job is not due yet
+
+    Returns:
+        Dictionary with status, processed, duration_ms and lag_ms, or None
+        if the job was not due or another process holds it
+    """
+    now = datetime.utcnow()
+    claimed = _claim(job, now, force)
+    if claimed is None:
+        return None
+
+    scheduled, cursor = claimed
+    lag_ms = max(0, int((now - scheduled).total_seconds() * 1000))
+    started = time.monotonic()
+    processed = 0
+    status, error = 'succeeded', None
+
+    try:
+        while True:
+            count, cursor = job.func(cursor, job.chunk_size)
+            processed += count
+            if cursor is None:
+                break
+            if not _checkpoint(job, cursor):
+                status = 'interrupted'  # Lease expired and another process took over
+                break
+            if time.monotonic() - started >= job.max_run_seconds:
+                status = 'partial'
+                break
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Scheduled job {job.name} failed: {e}")
+        status, error = 'failed', str(e)
+
+    duration_ms = int((time.monotonic() - started) * 1000)
+    finished = datetime.utcnow()
+    if status == 'partial':
+        next_run_at = finished  # Resume from the cursor at the next poll
+    else:
+        next_run_at = _next_run_at(scheduled, job.interval_seconds, finished)
+
+    if status != 'interrupted':
+        table = ScheduledJob.__table__
+        db.session.execute(table.update().where(
+            table.c.name == job.name,
+            table.c.lease_owner == RUNNER_ID
+        ).values(
+            lease_owner=None,
+            lease_expires_at=None,
+            cursor=cursor if status in ('partial', 'failed') else None,
+            next_run_at=next_run_at,
+            last_finished_at=finished,
+            last_status=status,
+            last_error=error,
+            last_duration_ms=duration_ms,
+            last_lag_ms=lag_ms,
+            last_processed=processed,
+            run_count=table.c.run_count + 1,
+            failure_count=table.c.failure_count + (1 if status == 'failed' else 0)
+        ))
+        db.session.commit()
+
+    logging.info(f"Scheduled job {job.name}: {status}, {processed} processed in {duration_ms}ms (lag {lag_ms}ms)")
+    return {'status': status, 'processed': processed, 'duration_ms': duration_ms, 'lag_ms': lag_ms}
+
+def run_due_jobs():
+    """
+    Run every due job this process can lease
+
+    Returns:
+        Dictionary of job name -> run result for the jobs that ran
+    """
+    global _job_rows_ready
+    if not _job_rows_ready:
+        ensure_job_rows()
+        _job_rows_ready = True
+
+    results = {}
+    for name in sorted(JOBS):
+        result = run_job(JOBS[name])
+        if result is not None:
+            results[name] = result
+    return results
+
+def _run(app, poll_seconds: float):
+    """Scheduler loop"""
+    while True:
+        # Jitter so the processes do not all poll at the same instant
+        time.sleep(poll_seconds * random.uniform(0.8, 1.2))
+        with app.app_context():
+            try:
+                run_due_jobs()
+            except Exception as e:
+                logging.error(f"Scheduler poll failed: {e}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+def start_scheduler(app, poll_seconds: float = None):
+    """
+    Start this process's scheduler thread (once)
+
+    Args:
+        app: Flask application
+        poll_seconds: Seconds between polls (default: SCHEDULER_POLL_SECONDS)
+
+    Returns:
+        True if a thread is running
+    """
+    global _scheduler_thread
+    if not SCHEDULER_ENABLED:
+        return False
+
+    with _scheduler_lock:
+        if _scheduler_thread is None or not _scheduler_thread.is_alive():
+            _scheduler_thread = threading.Thread(
+                target=_run,
+                args=(app, poll_seconds or SCHEDULER_POLL_SECONDS),
+                name='maintenance-scheduler',
+                daemon=True
+            )
+            _scheduler_thread.start()
+    return True
+
+# ============================================================================
+# JOBS
+# ============================================================================
+
+@register_job('link_pending_batches', interval_seconds=300, chunk_size=200)
+def link_pending_batches_job(cursor, chunk_size):
+    """Link full collected batches to projects, chunk_size batches at a time"""
+    from auto_batch_creator import pending_batches_query, process_pending_batches
+
+    batch_ids = [
+        batch_id for (batch_id,) in pending_batches_query().with_entities(WasteBatch.id).filter(
+            WasteBatch.id > int(cursor or 0)
+        ).order_by(WasteBatch.id).limit(chunk_size)
+    ]
+    if not batch_ids:
+        return 0, None
+
+    linked = process_pending_batches(batch_ids)
+    return linked, (str(batch_ids[-1]) if len(batch_ids) == chunk_size else None)
+
+@register_job('sync_weekly_footprints', interval_seconds=24 * 3600, chunk_size=500)
+def sync_weekly_footprints_job(cursor, chunk_size):
+    """Rebuild weekly footprint records from scans, chunk_size users at a time"""
+    from footprint_updater import sync_weekly_chunk
+
+    written, last_user_id = sync_weekly_chunk(int(cursor or 0), chunk_size)
+    return written, (str(last_user_id) if last_user_id is not None else None)
+
+@register_job('mine_journey_blocks', interval_seconds=60, chunk_size=100)
+def mine_journey_blocks_job(cursor, chunk_size):
+    """Add proof of work to new journey blocks when JOURNEY_CHAIN_MODE is 'pow'"""
+    from blockchain_service import JOURNEY_CHAIN_MODE, mine_pending_blocks
+
+    if JOURNEY_CHAIN_MODE != 'pow':
+        return 0, None
+
+    mined, last_id = mine_pending_blocks(int(cursor or 0), chunk_size)
+    return mined, (str(last_id) if mined == chunk_size else None)
+
+@register_job('audit_chains', interval_seconds=6 * 3600, chunk_size=50)
+def audit_chains_job(cursor, chunk_size):
+    """Fully re-verify checkpointed journey and project chains"""
+    from chain_checkpoints import audit_chain_checkpoints
+
+    audited, last_id = audit_chain_checkpoints(int(cursor or 0), chunk_size)
+    return audited, (str(last_id) if audited == chunk_size else None)
+
+@register_job('anchor_ledger_roots', interval_seconds=3600, chunk_size=50)
+def anchor_ledger_roots_job(cursor, chunk_size):
+    """Build Merkle roots for project ledgers with new entries"""
+    from ledger_merkle import anchor_ledger_roots
+
+    anchored, last_project_id = anchor_ledger_roots(cursor or '', chunk_size)
+    return anchored, (last_project_id if anchored == chunk_size else None)
+
+@register_job('refresh_leaderboards', interval_seconds=300, chunk_size=50)
+def refresh_leaderboards_job(cursor, chunk_size):
+    """Re-rank the current weekly and monthly leaderboards, chunk_size cities at a time"""
+    from leaderboard import refresh_leaderboards_chunk
+
+    return refresh_leaderboards_chunk(cursor, chunk_size)
+
+def main():
+    """Inspect or run scheduled jobs from the command line"""
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Periodic maintenance jobs")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('list', help='Show jobs and their last run')
+
+    run_parser = subparsers.add_parser('run', help='Run one job now if no other process holds it')
+    run_parser.add_argument('job', choices=sorted(JOBS))
+    run_parser.add_argument('--force', action='store_true', help='Run even if the job is not due')
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            ensure_job_rows()
+            if args.command == 'list':
+                for job in ScheduledJob.query.order_by(ScheduledJob.name).all():
+                    print(f"{job.name}\tevery {job.interval_seconds}s\tnext {job.next_run_at}\t"
+                          f"{job.last_status or '-'}\t{job.last_duration_ms or 0}ms\tlag {job.last_lag_ms or 0}ms\t"
+                          f"runs {job.run_count} failures {job.failure_count}")
+            elif args.command == 'run':
+                result = run_job(JOBS[args.job], force=args.force)
+                if result is None:
+                    logging.info(f"{args.job} is not due or another process is running it")
+                elif result['status'] == 'failed':
+                    sys.exit(1)
+        except Exception as e:
+            logging.error(f"Scheduler command failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
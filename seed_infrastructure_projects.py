@@ -87,6 +87,11 @@ def seed_infrastructure_projects():
             db.session.add(project)
         
         db.session.commit()
+        
+        # Each project takes any material up to its total requirement
+        from project_allocation import backfill_material_requirements
+        backfill_material_requirements()
+        
         print(f"✓ Created {len(projects)} infrastructure projects")
         print("\nProjects created:")
         for p in projects:
@@ -0,0 +1,198 @@
+"""
+Batch Accumulation Stress Test
+Runs many parallel writers against the batch code and checks that no
+weight is lost and that only one batch is opened per material.
+
+Each run uses its own material name and users, stays below the project
+link threshold (so no project is touched) and deletes what it created.
+Point DATABASE_URL at PostgreSQL for a meaningful run; SQLite serialises
+all writers and refuses some of them outright ("database is locked"),
+which the writers retry.
+
+Usage:
+    python stress_batch_accumulation.py [--writers 16] [--items 50] [--mode direct|queue]
+"""
+
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from decimal import Decimal
+from sqlalchemy import func
+from app import app, db
+from models import User, WasteItem, WasteBatch, WasteBatchItem, ProjectContributor, BatchAssignmentQueue
+from auto_batch_creator import (
+    auto_create_batch_from_waste_item, enqueue_batch_assignment, process_batch_assignment_queue,
+    BATCH_LINK_THRESHOLD_GRAMS
+)
+
+def _create_fixtures(run_id, writers, items, weight):
+    """One user per writer and their waste items; returns [(user_id, [item ids])]"""
+    fixtures = []
+    for n in range(writers):
+        user = User(username=f"stress_{run_id}_{n}", email=f"stress_{run_id}_{n}@example.invalid")
+        user.set_password(uuid.uuid4().hex)
+        db.session.add(user)
+        db.session.flush()
+        waste_items = [
+            WasteItem(
+                image_path='stress.jpg',
+                user_id=user.id,
+                material=f"Stress-{run_id}",
+                material_type=f"Stress-{run_id}",
+                is_recyclable=True,
+                estimated_weight_grams=weight
+            )
+            for _ in range(items)
+        ]
+        db.session.add_all(waste_items)
+        db.session.flush()
+        fixtures.append((user.id, [item.id for item in waste_items]))
+    db.session.commit()
+    return fixtures
+
+def _run_writer(item_ids, mode, barrier, errors, attempts):
+    """Add one writer's items; failed attempts are rolled back and retried"""
+    with app.app_context():
+        barrier.wait()
+        for item_id in item_ids:
+            for attempt in range(attempts):
+                try:
+                    if mode == 'direct':
+                        done = auto_create_batch_from_waste_item(item_id)
+                    else:
+                        enqueue_batch_assignment(db.session.get(WasteItem, item_id))
+                        db.session.commit()
+                        done = True
+                except Exception:
+                    db.session.rollback()
+                    done = False
+                if done:
+                    break
+                time.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+            else:
+                errors.append(f"item {item_id} failed {attempts} times")
+                continue
+
+            if mode == 'queue':
+                try:
+                    process_batch_assignment_queue(limit=10)
+                except Exception:
+                    pass  # Rows stay queued for the next pass
+        db.session.remove()
+
+def _cleanup(run_id, fixtures):
+    material_type = f"Stress-{run_id}"
+    user_ids = [user_id for user_id, _ in fixtures]
+    batch_ids = [b.id for b in WasteBatch.query.filter_by(material_type=material_type).all()]
+    ProjectContributor.query.filter(ProjectContributor.batch_id.in_(batch_ids)).delete(synchronize_session=False)
+    WasteBatchItem.query.filter(WasteBatchItem.batch_id.in_(batch_ids)).delete(synchronize_session=False)
+    WasteBatch.query.filter(WasteBatch.id.in_(batch_ids)).delete(synchronize_session=False)
+    item_ids = db.session.query(WasteItem.id).filter(WasteItem.user_id.in_(user_ids))
+    BatchAssignmentQueue.query.filter(BatchAssignmentQueue.waste_item_id.in_(item_ids)).delete(synchronize_session=False)
+    WasteItem.query.filter(WasteItem.user_id.in_(user_ids)).delete(synchronize_session=False)
+    User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+def run_stress_test(writers=16, items=50, weight=1.0, mode='direct', attempts=100, keep=False):
+    """
+    Run parallel writers and check the batch and contributor totals
+
+    Args:
+        writers: Parallel writer threads
+        items: Items per writer
+        weight: Grams per item
+        mode: 'direct' (auto_create_batch_from_waste_item per item) or
+            'queue' (enqueue, then every writer also drains the queue)
+        attempts: Tries per item before it counts as failed (a rolled-back
+            attempt must leave no trace, so retries cannot double count)
+        keep: Leave the created rows in place
+
+    Returns:
+        True if every check passed
+    """
+    expected_total = Decimal(str(weight)) * writers * items
+    if expected_total >= Decimal(str(BATCH_LINK_THRESHOLD_GRAMS)):
+        raise ValueError(
+            f"writers * items * weight must stay below {BATCH_LINK_THRESHOLD_GRAMS}g so no batch is linked to a project"
+        )
+
+    run_id = uuid.uuid4().hex[:8]
+    material_type = f"Stress-{run_id}"
+    fixtures = _create_fixtures(run_id, writers, items, weight)
+    db.session.remove()
+
+    barrier = threading.Barrier(writers)
+    errors = []
+    threads = [
+        threading.Thread(target=_run_writer, args=(item_ids, mode, barrier, errors, attempts))
+        for _, item_ids in fixtures
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    try:
+        if mode == 'queue':
+            while process_batch_assignment_queue():
+                pass
+
+        batches = WasteBatch.query.filter_by(material_type=material_type).all()
+        batch_total = sum((Decimal(str(b.total_weight_grams)) for b in batches), Decimal(0))
+        contributions = dict(db.session.query(
+            ProjectContributor.user_id, func.sum(ProjectContributor.contribution_weight_grams)
+        ).filter(
+            ProjectContributor.batch_id.in_([b.id for b in batches])
+        ).group_by(ProjectContributor.user_id).all())
+        per_user = Decimal(str(weight)) * items
+
+        checks = {
+            'no writer errors': not errors,
+            'one batch opened': len(batches) == 1,
+            'every item recorded once': WasteBatchItem.query.filter(
+                WasteBatchItem.batch_id.in_([b.id for b in batches])
+            ).count() == writers * items,
+            'batch weight': batch_total == expected_total,
+            'contributor weights': all(
+                Decimal(str(contributions.get(user_id, 0))) == per_user for user_id, _ in fixtures
+            ),
+        }
+
+        print(f"{writers} writers x {items} items ({mode}) in {elapsed:.2f}s")
+        print(f"batches: {len(batches)}  weight: {batch_total}g (expected {expected_total}g)")
+        for error in errors[:10]:
+            print(f"  error: {error}")
+        for name, passed in checks.items():
+            print(f"[{'OK' if passed else 'FAIL'}] {name}")
+        return all(checks.values())
+    finally:
+        if not keep:
+            _cleanup(run_id, fixtures)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress-test concurrent batch accumulation")
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--items', type=int, default=50, help='Items per writer')
+    parser.add_argument('--weight', type=float, default=1.0, help='Grams per item')
+    parser.add_argument('--mode', choices=('direct', 'queue'), default='direct')
+    parser.add_argument('--attempts', type=int, default=100, help='Tries per item')
+    parser.add_argument('--keep', action='store_true', help='Keep the created rows')
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            passed = run_stress_test(args.writers, args.items, args.weight, args.mode, args.attempts, args.keep)
+        except Exception as e:
+            logging.error(f"Stress test failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+    sys.exit(0 if passed else 1)
+
+if __name__ == '__main__':
+    main()
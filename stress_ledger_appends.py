@@ -0,0 +1,131 @@
+"""
+Ledger Append Stress Test
+Runs many parallel writers appending to one project's ledger and checks
+that the result is a single linear chain: seq 1..n without gaps, every
+entry linked to the one before it, and no two entries sharing a
+predecessor.
+
+Each run uses its own project and deletes what it created. Point
+DATABASE_URL at PostgreSQL for a meaningful run; SQLite serialises all
+writers and refuses some of them outright ("database is locked"), which
+the writers retry.
+
+Usage:
+    python stress_ledger_appends.py [--writers 16] [--items 25]
+"""
+
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from app import app, db
+from models import InfrastructureProject, ProjectLedger
+from blockchain_tracker import create_material_journey_block, verify_project_chain
+
+def _run_writer(project_id, writer, items, barrier, errors, attempts):
+    """Append one writer's entries; failed attempts are rolled back and retried"""
+    with app.app_context():
+        barrier.wait()
+        for n in range(items):
+            for attempt in range(attempts):
+                block = create_material_journey_block(
+                    waste_item_id=0,
+                    batch_id=f"stress-{writer}-{n}",
+                    project_id=project_id,
+                    action='stress',
+                    verified_by=f"writer_{writer}"
+                )
+                if block is not None:
+                    break
+                time.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+            else:
+                errors.append(f"writer {writer} entry {n} failed {attempts} times")
+        db.session.remove()
+
+def run_stress_test(writers=16, items=25, attempts=100, keep=False):
+    """
+    Run parallel appenders and check the chain is linear
+
+    Args:
+        writers: Parallel writer threads
+        items: Entries per writer
+        attempts: Tries per entry before it counts as failed
+        keep: Leave the created rows in place
+
+    Returns:
+        True if every check passed
+    """
+    project_id = f"stress-{uuid.uuid4().hex[:8]}"
+    db.session.add(InfrastructureProject(
+        project_id=project_id,
+        project_name='Ledger stress test',
+        location_lat=0,
+        location_lng=0,
+        status='planned'
+    ))
+    db.session.commit()
+    db.session.remove()
+
+    barrier = threading.Barrier(writers)
+    errors = []
+    threads = [
+        threading.Thread(target=_run_writer, args=(project_id, writer, items, barrier, errors, attempts))
+        for writer in range(writers)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    try:
+        entries = ProjectLedger.query.filter_by(project_id=project_id).order_by(ProjectLedger.seq).all()
+        expected = writers * items
+        predecessors = [entry.previous_hash for entry in entries]
+
+        checks = {
+            'no writer errors': not errors,
+            'every entry written': len(entries) == expected,
+            'seq is 1..n': [entry.seq for entry in entries] == list(range(1, len(entries) + 1)),
+            'linked in seq order': all(
+                entry.previous_hash == (entries[i - 1].block_hash if i else None) for i, entry in enumerate(entries)
+            ),
+            'no forks': len(set(predecessors)) == len(predecessors),
+            'chain verifies': verify_project_chain(project_id, full=True),
+        }
+
+        print(f"{writers} writers x {items} entries in {elapsed:.2f}s ({len(entries) / elapsed:.0f} appends/s)")
+        for error in errors[:10]:
+            print(f"  error: {error}")
+        for name, passed in checks.items():
+            print(f"[{'OK' if passed else 'FAIL'}] {name}")
+        return all(checks.values())
+    finally:
+        if not keep:
+            ProjectLedger.query.filter_by(project_id=project_id).delete(synchronize_session=False)
+            InfrastructureProject.query.filter_by(project_id=project_id).delete(synchronize_session=False)
+            db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress-test concurrent ledger appends")
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--items', type=int, default=25, help='Entries per writer')
+    parser.add_argument('--attempts', type=int, default=100, help='Tries per entry')
+    parser.add_argument('--keep', action='store_true', help='Keep the created rows')
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            passed = run_stress_test(args.writers, args.items, args.attempts, args.keep)
+        except Exception as e:
+            logging.error(f"Stress test failed: {e}")
+            db.session.rollback()
+            sys.exit(1)
+    sys.exit(0 if passed else 1)
+
+if __name__ == '__main__':
+    main()